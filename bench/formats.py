@@ -0,0 +1,67 @@
+#!/bin/env python2
+''' formats.py
+Benchmark of the response formats, compares the payload size (plain and
+gzipped) and the encode time of JSON (with ISO and epoch dates) against
+MessagePack on a 25 post thread page, a 100 post thread page and a 100 thread
+listing.  The pages are the ones built by serialize.py, with Links for their
+urls.
+
+    $ PYTHONPATH=src python bench/formats.py
+'''
+import timeit
+from serialize import thread_page, thread_listing, ROUNDS
+from tamari import serializers
+from tamari.compression import gzip
+from tamari.links import Link
+
+
+def linked(packet):
+    ''' linked
+    Replaces the urls in the packet with Links, like the database layer
+    returns them
+    '''
+    if type(packet) is list:
+        return [linked(item) for item in packet]
+    if type(packet) is dict:
+        return {key: Link('bench', path=value) if type(value) is str and
+                value.startswith('/') else linked(value)
+                for key, value in packet.iteritems()}
+    return packet
+
+
+def encode_time(func, packet):
+    number = 200
+    best = min(timeit.repeat(lambda: func(packet), number=number,
+                             repeat=ROUNDS))
+    return best / number * 1000000
+
+
+def main():
+    links = lambda link: link.values['path']
+    formats = [
+        ("json (iso)", lambda packet: serializers.to_json(
+            packet, serializers.date_formatter('iso'), links)),
+        ("json (epoch)", lambda packet: serializers.to_json(
+            packet, serializers.date_formatter('epoch'), links))]
+    if serializers.msgpack:
+        formats.append(("msgpack", lambda packet: serializers.to_msgpack(
+            packet, links=links)))
+    else:
+        print "msgpack is not installed, only JSON is measured"
+    print "json library: {}".format(serializers.BACKEND)
+
+    for name, packet in [("thread page (25 posts)", thread_page()),
+                         ("thread page (100 posts)", thread_page(100)),
+                         ("thread listing (100)", thread_listing())]:
+        packet = linked(packet)
+        print name
+        for format, func in formats:
+            body = func(packet)
+            print "  {:<14} {:>7} bytes  {:>6} gzipped  {:>8.1f}us".format(
+                format, len(body), len(gzip(body, 6)),
+                encode_time(func, packet))
+
+if __name__ == '__main__':
+    main()
+
+# vim: ft=python
@@ -0,0 +1,421 @@
+#!/bin/env python2
+''' load.py
+Load benchmark of the web layer, replays a weighted mix of requests (see
+WORKLOADS) from a number of simulated users against a seeded forum, driving
+the app through the helpers of the tests (tests/base.py).  By default the
+requests go through the app in this process, with --server they are sent
+over HTTP to a running server and with --workers a local server forking up
+to that many workers is started for the run (not with the memory engine, the
+workers wouldn't share its data).  The local server forks for each request,
+so point --server at a preforking server to measure one.  Reports the
+requests per second and the p50/p95/p99 latency of each operation, and in
+process, the queries made to the database per request (see count_queries,
+the memory engine has no database to query) along with the hits and misses
+of the in process caches (see cache_stats).
+
+    $ PYTHONPATH=src TAMARI_ENGINE=sqlite python bench/load.py \
+        [--workload=reads] [--requests=2000] [--clients=4] [--threads=50] \
+        [--replies=10] [--seed=1] [--server=http://127.0.0.1:5000] \
+        [--workers=4] [--output=load.json]
+'''
+import Cookie
+import httplib
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import urllib
+import urlparse
+from bisect import bisect
+from collections import OrderedDict
+from functools import wraps
+from multiprocessing import Process
+from timeit import default_timer as timer
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+import tamari
+from tamari import database, decorators, session, settings
+from base import TestBase
+from storage import percentile
+
+# operations of each workload, (operation, weight) for each
+WORKLOADS = {
+    "reads": [("get_thread", 60), ("get_threads", 30), ("get_forum", 5),
+              ("reply", 5)],
+    "mixed": [("get_thread", 50), ("get_threads", 20), ("reply", 25),
+              ("create_thread", 5)],
+    "writes": [("get_thread", 20), ("reply", 60), ("create_thread", 20)]
+}
+PERCENTILES = [50, 95, 99]
+# methods of the pymongo collections that make a query (or a write)
+MONGO_QUERIES = ["find", "find_one", "insert", "save", "update", "remove",
+                 "count", "find_and_modify", "aggregate"]
+calls = threading.local()  # queries made by each thread
+
+
+class Response(object):
+    ''' Response
+    The parts of a test client response that the helpers read
+    '''
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+
+class RemoteClient(object):
+    ''' RemoteClient
+    Stand in for the test client that sends the requests to a server over
+    HTTP, keeping the cookies set by the server (the session) between
+    requests.
+    '''
+    def __init__(self, url):
+        self.host = urlparse.urlsplit(url).netloc
+        self.connection = httplib.HTTPConnection(self.host)
+        self.cookies = {}
+
+    def open(self, method, path, data=None, headers=()):
+        headers = dict(headers)
+        body = None
+        if data is not None:
+            body = urllib.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = "; ".join(
+                "{}={}".format(*cookie) for cookie in self.cookies.items())
+        self.connection.request(method, path, body, headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        for header in response.msg.getheaders('set-cookie'):
+            for name, morsel in Cookie.SimpleCookie(header).items():
+                if morsel.value:
+                    self.cookies[name] = morsel.value
+                else:  # deleted
+                    self.cookies.pop(name, None)
+        if response.getheader('connection', '').lower() == 'close':
+            self.connection.close()
+        return Response(response.status, data)
+
+    def get(self, path, **kwargs):
+        return self.open("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open("POST", path, **kwargs)
+
+
+class Client(TestBase):
+    ''' Client
+    A simulated user of the forum, makes its requests with the helpers of the
+    tests (see OPERATIONS)
+    '''
+    def __init__(self, name, server=None):
+        TestBase.__init__(self)
+        self.server = server
+        self.user = {'username': name, 'password': 'load'}
+
+    def runTest(self):
+        pass  # needed by unittest to create the case
+
+    def setUp(self):
+        if not self.server:
+            return TestBase.setUp(self)
+        self.app = RemoteClient(self.server)
+        self.endpoints = json.loads(
+            self.app.get('/', headers=self.json_header).data)
+
+
+class Forum(object):
+    ''' Forum
+    The threads of the seeded forum, shared by the clients
+    '''
+    def __init__(self):
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def add(self, thread):
+        with self.lock:
+            self.threads.append({'url': thread['url']})
+
+    def pick(self, rng):
+        return rng.choice(self.threads)
+
+
+def reply(client, forum, rng):
+    response = client.app.post(
+        forum.pick(rng)['url'], data={'content': "Load reply"},
+        headers=client.json_header)
+    client.assertHasStatus(response, httplib.CREATED)
+
+# requests made by each operation of the workloads, these take the client, the
+# forum and the random generator of the client, the helpers of the tests raise
+# an AssertionError if the response isn't the expected one
+OPERATIONS = {
+    "get_forum": lambda client, forum, rng: client.get_forum(),
+    "get_threads": lambda client, forum, rng: client.get_threads(),
+    "get_thread": lambda client, forum, rng: client.get_thread(
+        forum.pick(rng)),
+    "reply": reply,
+    "create_thread": lambda client, forum, rng: forum.add(
+        client.create_thread())
+}
+
+
+def counted(func):
+    ''' counted
+    Wraps a function that queries the database to count its calls, calls it
+    makes itself (i.e. find_one calling find) are not counted again
+    '''
+    @wraps(func)
+    def decorated_function(*args, **kwargs):
+        if getattr(calls, 'depth', 0):
+            return func(*args, **kwargs)
+        calls.count = getattr(calls, 'count', 0) + 1
+        calls.depth = 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            calls.depth = 0
+    return decorated_function
+
+
+def count_queries():
+    ''' count_queries
+    Wraps the calls the database engine makes to its database so that the
+    queries made by each request are counted: the query methods of the
+    pymongo collections for the mongo engine, the execute function of the
+    sqlite engine (every statement but the ones beginning and ending a
+    transaction).  Returns whether the engine has a database to count the
+    queries of.
+    '''
+    engine = database.engine
+    if engine.__name__.endswith('mongo'):
+        from pymongo.collection import Collection
+        for name in MONGO_QUERIES:
+            if hasattr(Collection, name):
+                setattr(Collection, name, counted(getattr(Collection, name)))
+        return True
+    if engine.__name__.endswith('sqlite'):
+        execute = engine.execute
+        for name, module in sys.modules.items():
+            if module and name.startswith(engine.__name__) and \
+                    getattr(module, 'execute', None) is execute:
+                module.execute = counted(execute)  # bound by each submodule
+        return True
+    return False
+
+
+def cache_stats():
+    ''' cache_stats
+    Counters of the in process caches of the app: the hits, misses and size
+    of the session and response caches (None when the cache is off) and the
+    number of reads collapsed into another by the single flight layer
+    '''
+    sessions = session.Sessions
+    return {
+        "sessions": sessions.cache.stats()
+        if isinstance(sessions, session.SessionCache) else None,
+        "responses": decorators.responses.stats()
+        if settings.RESPONSE_CACHE['size'] else None,
+        "collapsed": database.coalescer.collapsed
+    }
+
+
+def report(name, stats):
+    ''' report
+    Line of the summary for the counters of a cache
+    '''
+    if stats is None:
+        return "{:<14} off".format(name)
+    return "{:<14} {hits:>6} hits {misses:>6} misses  {:.1%} hit rate  " \
+        "{size} entries".format(name, stats["hits"] / float(
+            stats["hits"] + stats["misses"] or 1), **stats)
+
+
+def schedule(workload, count, rng):
+    ''' schedule
+    The operations of a client, picked at random by their weights
+    '''
+    names, totals = [], []
+    for name, weight in WORKLOADS[workload]:
+        names.append(name)
+        totals.append((totals[-1] if totals else 0) + weight)
+    return [names[bisect(totals, rng.random() * totals[-1])]
+            for number in xrange(count)]
+
+
+def seed(client, forum, options):
+    ''' seed
+    Creates the threads (and their replies) of the forum
+    '''
+    for number in xrange(int(options['threads'])):
+        thread = client.create_thread(thread={
+            'title': "Load thread {}".format(number),
+            'content': "Seeded thread for the load benchmark"})
+        forum.add(thread)
+        for reply in xrange(int(options['replies'])):
+            response = client.app.post(
+                thread['url'], data={'content': "Seeded reply"},
+                headers=client.json_header)
+            client.assertHasStatus(response, httplib.CREATED)
+
+
+def replay(client, operations, forum, rng, samples):
+    ''' replay
+    Makes the operations of the client, recording the latency, the database
+    queries and whether each failed
+    '''
+    for name in operations:
+        calls.count = 0
+        begin = timer()
+        try:
+            OPERATIONS[name](client, forum, rng)
+            failed = False
+        except Exception:
+            failed = True
+        samples.append((name, timer() - begin, calls.count, failed))
+
+
+def summary(samples, elapsed, queried):
+    ''' summary
+    Statistics of each operation, latencies are in milliseconds
+    '''
+    results = OrderedDict()
+    for name in sorted(set(sample[0] for sample in samples)):
+        made = [sample for sample in samples if sample[0] == name]
+        latencies = sorted(sample[1] * 1000 for sample in made)
+        results[name] = {
+            "requests": len(made),
+            "errors": sum(1 for sample in made if sample[3]),
+            "requests_per_second": len(made) / elapsed,
+            "database_queries": sum(sample[2] for sample in made) /
+            float(len(made)) if queried else None
+        }
+        for rank in PERCENTILES:
+            results[name]["p{}".format(rank)] = percentile(latencies, rank)
+    return results
+
+
+def run(port, workers):
+    from werkzeug.serving import run_simple
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    run_simple("127.0.0.1", port, tamari.app, processes=workers)
+
+
+def serve(port, workers):
+    ''' serve
+    Starts a local server forking up to workers processes, returns the
+    process running it once it accepts connections
+    '''
+    server = Process(target=run, args=(port, workers))
+    server.daemon = True
+    server.start()
+    for attempt in xrange(50):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return server
+        except socket.error:
+            time.sleep(0.1)
+    server.terminate()
+    sys.exit("the local server didn't start")
+
+
+def main(options):
+    local = not options.get('server')
+    if local and not settings.DEBUG:
+        sys.exit("load.py writes to the database, it only runs in DEBUG")
+    if local:
+        tamari.cleanup()
+    workers, server = int(options.get('workers', 0)), None
+    if workers:
+        if database.engine.__name__.endswith('memory'):
+            sys.exit("the workers of a local server can't share the memory "
+                     "engine, use another engine or run in process")
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        server = serve(port, workers)
+        options['server'] = "http://127.0.0.1:{}".format(port)
+    queried = not options.get('server') and count_queries()
+
+    try:
+        rng = random.Random(int(options['seed']))
+        prefix = "load{}-".format(os.getpid())
+        clients = [Client(prefix + str(number), options.get('server'))
+                   for number in xrange(int(options['clients']))]
+        forum = Forum()
+        for client in clients:
+            client.setUp()
+            client.assertHasStatus(
+                client.register(client.user), httplib.CREATED)
+        seed(clients[0], forum, options)
+
+        per_client = int(options['requests']) // len(clients)
+        samples, runs = [], []
+        for client in clients:
+            client_rng = random.Random(rng.random())
+            runs.append(threading.Thread(target=replay, args=(
+                client, schedule(options['workload'], per_client, client_rng),
+                forum, client_rng, samples)))
+        before = cache_stats()
+        begin = timer()
+        for run in runs:
+            run.start()
+        for run in runs:
+            run.join()
+        elapsed = timer() - begin
+        caches = cache_stats() if not options.get('server') else None
+    finally:
+        if server:
+            server.terminate()
+        if local:
+            tamari.cleanup()
+
+    results = summary(samples, elapsed, queried)
+    print "{} requests in {:.2f}s, {:.1f}/s ({} workload, {} clients)".format(
+        len(samples), elapsed, len(samples) / elapsed, options['workload'],
+        len(clients))
+    for name, result in results.iteritems():
+        print "{:<14} {requests:>6} req {requests_per_second:>8.1f}/s  " \
+            "p50 {p50:>7.2f}ms  p95 {p95:>7.2f}ms  p99 {p99:>7.2f}ms  " \
+            "errors {errors}  queries {queries}".format(
+                name, queries="{:.1f}".format(result["database_queries"])
+                if result["database_queries"] is not None else "n/a",
+                **result)
+    if caches:
+        # the counters are kept from the start of the process, the seeding
+        # and the registrations are taken out
+        for name in ("sessions", "responses"):
+            if caches[name]:
+                for counter in ("hits", "misses"):
+                    caches[name][counter] -= before[name][counter]
+            print report(name, caches[name])
+        caches["collapsed"] -= before["collapsed"]
+        print "{:<14} {:>6} reads".format("collapsed", caches["collapsed"])
+
+    if options.get('output'):
+        with open(options['output'], "w") as output_file:
+            json.dump({
+                "engine": database.engine.__name__.split(".")[-1],
+                "server": options.get('server'),
+                "workers": workers,
+                "workload": options['workload'],
+                "clients": len(clients),
+                "elapsed": elapsed,
+                "results": results,
+                "caches": caches
+            }, output_file, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    options = {"workload": "reads", "requests": 2000, "clients": 4,
+               "threads": 50, "replies": 10, "seed": 1}
+    for arg in sys.argv[1:]:
+        if arg.startswith('--') and '=' in arg:
+            name, value = arg[2:].split('=', 1)
+            options[name] = value
+    main(options)
+
+# vim: ft=python
@@ -0,0 +1,117 @@
+#!/bin/env python2
+''' serialize.py
+Micro-benchmark of the response serialization, compares the previous
+json.JSONEncoder based path (which looked up the session date format for every
+date) against serializers.to_json on a 25 post thread page and a 100 thread
+listing, reporting the serializations per second of each.
+
+    $ PYTHONPATH=src python bench/serialize.py [--date-format=epoch]
+'''
+import datetime
+import json
+import sys
+import timeit
+from bson.objectid import ObjectId
+from tamari import serializers
+
+ROUNDS = 5
+
+
+class SessionEncoder(json.JSONEncoder):
+    ''' SessionEncoder
+    The previous encoder, resolves the date format (from a session dict) for
+    each date it encodes
+    '''
+    session = {}
+
+    def default(self, obj):
+        if isinstance(obj, ObjectId):
+            return str(obj)
+        elif isinstance(obj, datetime.datetime):
+            date_format = self.session.get('date_format')
+            if not date_format:
+                return str(obj)
+            if date_format in serializers.DATE_FORMATS:
+                return serializers.DATE_FORMATS[date_format](obj)
+            return obj.strftime(date_format)
+        return json.JSONEncoder.default(self, obj)
+
+
+def post(thread, n):
+    return {
+        "id": str(ObjectId()),
+        "url": "/post/" + str(ObjectId()),
+        "user": "/user/" + str(ObjectId()),
+        "thread": thread,
+        "content": "Reply number {} to the thread. ".format(n) * 12,
+        "created": datetime.datetime.utcnow(),
+        "editted": datetime.datetime.utcnow() if n % 5 == 0 else None,
+        "version": n % 3
+    }
+
+
+def thread_page(posts=25):
+    thread = str(ObjectId())
+    return {
+        "id": thread,
+        "url": "/thread/" + thread,
+        "title": "Benchmark thread",
+        "user": "/user/" + str(ObjectId()),
+        "forum": ObjectId(),
+        "head": ObjectId(),
+        "created": datetime.datetime.utcnow(),
+        "editted": None,
+        "post_count": posts,
+        "last_post_at": datetime.datetime.utcnow(),
+        "last_post_user": "/user/" + str(ObjectId()),
+        "version": 0,
+        "posts": [post(thread, n) for n in range(posts)]
+    }
+
+
+def thread_listing(threads=100):
+    return [{
+        "url": "/thread/" + str(ObjectId()),
+        "title": "Benchmark thread {}".format(n),
+        "created": datetime.datetime.utcnow(),
+        "user": "/user/" + str(ObjectId()),
+        "post_count": n,
+        "last_post_at": datetime.datetime.utcnow(),
+        "last_post_user": "/user/" + str(ObjectId())
+    } for n in range(threads)]
+
+
+def throughput(func, packet):
+    number = 200
+    best = min(timeit.repeat(lambda: func(packet), number=number,
+                             repeat=ROUNDS))
+    return number / best
+
+
+def main(date_format):
+    SessionEncoder.session = {'date_format': date_format}
+    print "serializer: {}, date format: {}".format(
+        serializers.BACKEND, date_format)
+
+    def previous(packet):
+        return json.dumps(packet, cls=SessionEncoder, separators=(',', ':'))
+
+    def current(packet):
+        return serializers.to_json(
+            packet, serializers.date_formatter(date_format))
+
+    for name, packet in [("thread page (25 posts)", thread_page()),
+                         ("thread listing (100)", thread_listing())]:
+        before, after = throughput(previous, packet), \
+            throughput(current, packet)
+        print "{:<24} previous {:>9.1f}/s  current {:>9.1f}/s  ({:.2f}x)" \
+            .format(name, before, after, after / before)
+
+if __name__ == '__main__':
+    date_format = 'iso'
+    for arg in sys.argv[1:]:
+        if arg.startswith('--date-format='):
+            date_format = arg.split('=', 1)[1]
+    main(date_format)
+
+# vim: ft=python
@@ -0,0 +1,205 @@
+#!/bin/env python2
+''' storage.py
+Micro-benchmark of the database layer, runs against the configured engine
+(or the one named by TAMARI_ENGINE) and times each call of: thread creation,
+replies, a page of a thread at increasing depths, a page of the thread list
+at increasing offsets, the children of a forum, find_parent at increasing
+forum depths (with and without the path cache) and the Permission checks.
+The percentiles of each are written as JSON, and compared against a baseline
+(a previous output) if one is given, exiting with 1 if any case got slower
+than the threshold allows.  The data is written to the development database,
+which is cleaned up before and after, so this only runs in DEBUG.
+
+    $ PYTHONPATH=src TAMARI_ENGINE=memory python bench/storage.py \
+        [--output=storage.json] [--baseline=baseline.json] [--rounds=200] \
+        [--scale=1] [--threshold=1.25]
+'''
+import json
+import platform
+import sys
+from collections import OrderedDict
+from timeit import default_timer as timer
+from tamari import app, settings
+from tamari import database
+from tamari.database import User, Thread, Forum, Permission
+from flask import session
+
+PAGE = 25  # posts or threads per page
+DEPTHS = [0, 100, 1000]  # offsets of the pages read, multiplied by the scale
+FORUM_DEPTHS = [1, 4, 16]  # depths of the forums find_parent is run on
+CHILDREN = 20  # subforums of the forum listed by children
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(samples, rank):
+    ''' percentile
+    The nearest rank percentile of the (sorted) samples
+    '''
+    return samples[max(0, -(-rank * len(samples) // 100) - 1)]
+
+
+def summary(samples):
+    ''' summary
+    Statistics of the timings of a case, in microseconds
+    '''
+    samples = sorted(sample * 1000000 for sample in samples)
+    result = {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples),
+        "min": samples[0],
+        "max": samples[-1]
+    }
+    for rank in PERCENTILES:
+        result["p{}".format(rank)] = percentile(samples, rank)
+    return result
+
+
+def measure(func, rounds):
+    ''' measure
+    Times each of the rounds of the function (passed the round number)
+    '''
+    samples = []
+    for number in xrange(rounds):
+        begin = timer()
+        func(number)
+        samples.append(timer() - begin)
+    return summary(samples)
+
+
+def setup(scale):
+    ''' setup
+    Writes the data the cases run against: an author and another user, a
+    forum with a thread list deep enough for the largest offset, a thread
+    with enough posts for the largest depth, a forum with CHILDREN subforums
+    and a chain of forums as deep as the deepest FORUM_DEPTHS.
+    '''
+    data = {"root": str(Forum.get_root())}
+    data["author"], _ = User.create(
+        {"username": "author", "password": "bench"})
+    data["other"], _ = User.create(
+        {"username": "other", "password": "bench"})
+    depth = max(DEPTHS) * scale + PAGE
+
+    data["forum"] = Forum.create(
+        {"name": "threads", "parent": data["root"]})["id"]
+    for number in xrange(depth):
+        thread = Thread.create({
+            "title": "Thread {}".format(number), "content": "Head post",
+            "user": data["author"], "forum": data["forum"]})
+    data["thread"] = thread["id"]
+    data["post"] = thread["posts"][0]["id"]
+    for number in xrange(depth):
+        Thread.reply(data["thread"], {
+            "content": "Reply {}".format(number), "user": data["author"]})
+
+    data["parent"] = Forum.create(
+        {"name": "children", "parent": data["root"]})["id"]
+    for number in xrange(CHILDREN):
+        Forum.create({"name": str(number), "parent": data["parent"]})
+
+    data["chain"] = [data["root"]]
+    for number in xrange(max(FORUM_DEPTHS)):
+        data["chain"].append(Forum.create(
+            {"name": str(number), "parent": data["chain"][-1]})["id"])
+    return data
+
+
+def cases(data, scale):
+    ''' cases
+    The benchmark cases, (name, function of the round number) for each
+    '''
+    yield "Thread.create", lambda number: Thread.create({
+        "title": "Created {}".format(number), "content": "Head post",
+        "user": data["author"], "forum": data["forum"]})
+    yield "Thread.reply", lambda number: Thread.reply(data["thread"], {
+        "content": "Bench reply {}".format(number), "user": data["other"]})
+    for depth in DEPTHS:
+        yield "Thread.get page at {}".format(depth * scale), \
+            lambda number, start=depth * scale: Thread.get(
+                thread_id=data["thread"], limit=PAGE, start=start)
+    for depth in DEPTHS:
+        yield "Thread.get list at {}".format(depth * scale), \
+            lambda number, start=depth * scale: Thread.get(
+                forum=data["forum"], limit=PAGE, start=start)
+    yield "Forum.children ({})".format(CHILDREN), \
+        lambda number: Forum.children(parent=data["parent"])
+    for depth in FORUM_DEPTHS:
+        yield "Forum.find_parent at {}".format(depth), \
+            lambda number, forum=data["chain"][depth]: Forum.find_parent(
+                forum, [data["chain"][1]])
+        yield "Forum.find_parent at {} (uncached)".format(depth), \
+            lambda number, forum=data["chain"][depth]: (
+                Forum.paths.clear(), Forum.find_parent(
+                    forum, [data["chain"][1]]))
+    yield "Permission.check_forum", lambda number: Permission.check_forum(
+        data["chain"][-1])
+    yield "Permission.check_thread", lambda number: Permission.check_thread(
+        data["thread"])
+    yield "Permission.check_post", lambda number: Permission.check_post(
+        data["post"])
+
+
+def compare(results, baseline, threshold):
+    ''' compare
+    Prints the change of the median and p90 of each case against the
+    baseline, returns the names of the cases slower than the threshold
+    '''
+    slower = []
+    for name, result in results.iteritems():
+        if name not in baseline:
+            continue
+        ratios = [result[stat] / baseline[name][stat] if baseline[name][stat]
+                  else 1.0 for stat in ("p50", "p90")]
+        print "{:<40} p50 {:>6.2f}x  p90 {:>6.2f}x{}".format(
+            name, ratios[0], ratios[1],
+            "  SLOWER" if ratios[0] > threshold else "")
+        if ratios[0] > threshold:
+            slower.append(name)
+    return slower
+
+
+def main(options):
+    if not settings.DEBUG:
+        sys.exit("storage.py writes to the database, it only runs in DEBUG")
+    scale, rounds = int(options["scale"]), int(options["rounds"])
+    database.cleanup()
+    results = OrderedDict()
+    try:
+        data = setup(scale)
+        with app.test_request_context():
+            session['id'], session['rights'] = data["other"], \
+                [data["chain"][1]]  # an admin of a forum, not of the root
+            for name, func in cases(data, scale):
+                results[name] = measure(func, rounds)
+                print "{:<40} p50 {p50:>9.1f}us  p90 {p90:>9.1f}us  " \
+                    "p99 {p99:>9.1f}us".format(name, **results[name])
+    finally:
+        database.cleanup()
+
+    output = {
+        "engine": database.engine.__name__.split(".")[-1],
+        "python": platform.python_version(),
+        "scale": scale,
+        "rounds": rounds,
+        "results": results
+    }
+    if options.get("output"):
+        with open(options["output"], "w") as output_file:
+            json.dump(output, output_file, indent=2, sort_keys=True)
+    if options.get("baseline"):
+        with open(options["baseline"]) as baseline_file:
+            baseline = json.load(baseline_file)
+        print "against {} (engine {})".format(
+            options["baseline"], baseline.get("engine"))
+        if compare(results, baseline["results"], float(options["threshold"])):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    options = {"rounds": 200, "scale": 1, "threshold": 1.25}
+    for arg in sys.argv[1:]:
+        if arg.startswith('--') and '=' in arg:
+            name, value = arg[2:].split('=', 1)
+            options[name] = value
+    main(options)
+
+# vim: ft=python
@@ -9,7 +9,9 @@ __all__ = ["user", "thread", "api", "forum"]
 
 def cleanup():
     from .database import Forum
+    from .decorators import responses
     database.cleanup()
+    responses.clear()
     app.endpoint('root', '/forum/' + str(Forum.get_root()))
 
 
@@ -23,14 +25,15 @@ def password_hash(password):
     return pwhash.hexdigest()
 
 # Webapp initiliazation
-from .decorators import TamariFlask
+from .decorators import TamariFlask, compress
 from . import session
 # TamariFlask is in decorators, just extended version of flask.Flask
 app = TamariFlask(__name__)
-app.session_interface = session.SessionHandler()
+app.session_interface = session.backends[settings.SESSION_BACKEND]()
 app.secret_key = settings.SECRET_KEY
 app.debug = settings.DEBUG
 app.jinja_env.line_statement_prefix = '%'
+app.after_request(compress)
 app.__version__ = __version__
 # This just imports all of the webapps modules (defined in __all__)
 from importlib import import_module
@@ -1,17 +1,33 @@
 ''' api.py
 Contains routes and actions specific to the REST API, things that really don't
 fall into any larger category are mostly what go into here.  This includes the
-discovery route, the settings modification, and the version route.
+discovery route, the settings modification, the version route, and the
+batch route.
 '''
-from . import app
+from . import app, settings
 from .decorators import datatype
+from .database import memo
+from .session import SHARED_SESSION, SETTINGS_CHANGED
+from .serializers import dumps
 from flask import request, session
+from werkzeug.test import EnvironBuilder
+from werkzeug.exceptions import HTTPException
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from types import NoneType
 import httplib
+import time
 # This is just a set of keys that can't be set via settings
-prohibited_settings = ["id", "_id"]
+prohibited_settings = ["id", "_id", SETTINGS_CHANGED]
+BATCH = settings.BATCH
+METHODS = ["GET", "POST", "PUT", "DELETE"]  # methods of the calls in a batch
+pool = None  # threads the concurrent calls of every batch are run on
+pool_lock = Lock()
 
 route = "/settings"
 app.endpoint(name='settings', route=route)
+batch_route = "/batch"
+app.endpoint(name='batch', route=batch_route)
 
 
 @app.put(route)
@@ -26,6 +42,7 @@ def set_settings():
     for key in request.form:
         if key not in prohibited_settings:
             session[key] = request.form[key]
+    session[SETTINGS_CHANGED] = int(time.time())
     return httplib.ACCEPTED
 
 
@@ -65,3 +82,134 @@ def get_version():
     Returns the version of the app, useful for compatibility checks of APIs
     '''
     return app.__version__
+
+
+def call(spec, base_url, shared, store):
+    ''' call
+    Runs one call of a batch in its own request context, with the session
+    of the batch and the batch's store for database reads (see memo).  The
+    response isn't processed (so the session is not saved), the body is read
+    before the context is left.  Returns the response.
+    '''
+    headers = dict(spec.get('headers') or {})
+    headers['Accept'] = 'application/json'
+    environ = EnvironBuilder(
+        path=spec['path'], base_url=base_url, method=spec['method'],
+        data=spec.get('body'), headers=headers).get_environ()
+    environ[SHARED_SESSION] = shared
+
+    with app.request_context(environ), memo.use(store):
+        try:
+            response = app.preprocess_request()
+            if response is None:
+                response = app.dispatch_request()
+            response = app.make_response(response)
+        except HTTPException as err:
+            response = err.get_response(environ)
+        except Exception:
+            app.logger.exception("Failed batch call %s", spec['path'])
+            response = app.make_response(("", httplib.INTERNAL_SERVER_ERROR))
+        response.freeze()  # read the body while the context is still up
+    return response
+
+
+def result(response):
+    ''' result
+    Formats the response of a call as the JSON of its entry in the batch's
+    results, a JSON body is placed as it is rather than being decoded
+    '''
+    headers = {key: value for key, value in response.headers.items()
+               if key not in ('Content-Length', 'Content-Type')}
+    body = response.data if response.mimetype == 'application/json' \
+        and response.data else dumps(response.data)
+    return '{{"status":{},"headers":{},"body":{}}}'.format(
+        response.status_code, dumps(headers), body)
+
+
+def valid(spec):
+    ''' valid
+    Returns whether the call of a batch is well formed (and not a batch), the
+    body must be an object (form data) or a string and the headers an object
+    '''
+    if not isinstance(spec, dict) or \
+            not isinstance(spec.get('path'), basestring) or \
+            not isinstance(spec.get('body'), (dict, basestring, NoneType)) or \
+            not isinstance(spec.get('headers'), (dict, NoneType)):
+        return False
+    return spec['path'].startswith('/') and \
+        not spec['path'].startswith(batch_route) and \
+        str(spec.get('method', 'GET')).upper() in METHODS
+
+
+def workers():
+    ''' workers
+    Returns the pool of threads the concurrent calls of batches are run on,
+    it is started by the first batch that needs it and shared by all the
+    batches after
+    '''
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = ThreadPool(BATCH['workers'])
+    return pool
+
+
+def groups(specs, concurrent=False):
+    ''' groups
+    Splits the calls of a batch into the groups that are run together, with
+    concurrent, each run of consecutive GETs is a group, otherwise each call
+    is on its own
+    '''
+    group = []
+    for spec in specs:
+        if group and not (concurrent and spec['method'] == 'GET' and
+                          group[-1]['method'] == 'GET'):
+            yield group
+            group = []
+        group.append(spec)
+    if group:
+        yield group
+
+
+@app.post(batch_route)
+@datatype
+def batch():
+    ''' batch -> POST /batch
+        POST: [{"method": [string], "path": [string], "body": [object],
+                "headers": [object]}, ...]
+        or {"calls": [...], "concurrent": [bool]}
+
+    Runs a list of API calls in one request, the calls share the session of
+    the batch (it is loaded and saved once) and their database reads.
+    Returns an array with the status, headers and body of each call, in
+    order.  With "concurrent", consecutive GETs are run at the same time
+    (they should not depend on each other).  The calls after a change (any
+    other method) see the change.  Returns a BAD_REQUEST if the batch is not
+    a list of well formed calls (see valid) or is larger than the BATCH
+    setting allows.
+    '''
+    packet = request.json
+    specs = packet.get('calls') if isinstance(packet, dict) else packet
+    if not isinstance(specs, list) or len(specs) > BATCH['size'] or \
+            not all(valid(spec) for spec in specs):
+        return "A batch must be a list of up to {} calls".format(
+            BATCH['size']), httplib.BAD_REQUEST
+    for spec in specs:
+        spec['method'] = str(spec.get('method', 'GET')).upper()
+
+    base_url, shared, store = \
+        request.url_root, session._get_current_object(), {}
+    run = lambda spec: call(spec, base_url, shared, store)
+    responses = []
+    for group in groups(specs, isinstance(packet, dict) and
+                        packet.get('concurrent')):
+        if len(group) > 1:
+            responses += workers().map(run, group)
+            continue
+        responses.append(run(group[0]))
+        if group[0]['method'] != 'GET':
+            store.clear()  # the calls after a change see it
+
+    return app.response_class(
+        "[" + ",".join(result(response) for response in responses) + "]",
+        mimetype='application/json')
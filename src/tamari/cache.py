@@ -0,0 +1,191 @@
+''' cache.py
+In process caching helpers, these are small bounded stores used to keep hot
+data (like session packets) in memory and avoid trips to the database.  Each
+cache keeps counters of its hits and misses for reporting.  Also holds the
+SingleFlight helper that shares one call between identical concurrent calls
+and the Memo helper that shares reads between the calls of one batch.
+'''
+from collections import OrderedDict
+from copy import deepcopy
+from functools import wraps
+from threading import Lock, Event, local
+from contextlib import contextmanager
+import time
+
+
+def call_key(func, args, kwargs):
+    ''' call_key
+    Returns the key identifying a call of func with the arguments, None if
+    the arguments can't be hashed.
+    '''
+    key = (func.__module__, func.__name__, args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class LRUCache(object):
+    ''' LRUCache
+    A dictionary like store bounded to `size` entries, when full the least
+    recently used entry is evicted.  If `ttl` is set, entries older than `ttl`
+    seconds are treated as missing.
+    '''
+    def __init__(self, size, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        ''' LRUCache::get
+        Returns the value stored for the key (marking it as recently used) or
+        default if there is no live entry for it.
+        '''
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or \
+                    (self.ttl and entry[0] + self.ttl < time.time()):
+                self.misses += 1
+                return default
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        ''' LRUCache::set
+        Stores the value for the key, evicting the least recently used entry
+        if the cache is full.
+        '''
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time(), value)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        ''' LRUCache::delete
+        Removes the entry for the key, if there is one.
+        '''
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        ''' LRUCache::clear
+        Removes all of the entries, the counters are left as is.
+        '''
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        ''' LRUCache::stats
+        Returns the counters and current size of the cache.
+        '''
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries)
+        }
+
+
+class SingleFlight(object):
+    ''' SingleFlight
+    Coalesces concurrent identical calls, while a call is in flight any other
+    thread making the same call waits for it and receives (a copy of) its
+    result or error instead of making the call itself.  The number of calls
+    that were collapsed into another is kept in `collapsed`.
+    '''
+    def __init__(self):
+        self.calls = {}
+        self.collapsed = 0
+        self.lock = Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        ''' SingleFlight::do
+        Calls func with the arguments, unless a call for the key is already
+        in flight, in which case its outcome is waited on and shared.
+        '''
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": Event(), "followers": 0}
+            else:
+                call["followers"] += 1
+                self.collapsed += 1
+
+        if not leader:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return deepcopy(call["shared"])
+
+        try:
+            call["result"] = func(*args, **kwargs)
+        except Exception as err:
+            call["error"] = err
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            # no one can join once the call is removed, the result is only
+            # copied (away from the caller's changes) if someone did
+            if call["followers"] and "result" in call:
+                call["shared"] = deepcopy(call["result"])
+            call["done"].set()
+        return call["result"]
+
+    def wrap(self, func):
+        ''' SingleFlight::wrap
+        Returns func wrapped so that calls with the same arguments are
+        coalesced, calls with unhashable arguments are just made.
+        '''
+        @wraps(func)
+        def coalesced(*args, **kwargs):
+            key = call_key(func, args, kwargs)
+            if key is None:
+                return func(*args, **kwargs)
+            return self.do(key, func, *args, **kwargs)
+        return coalesced
+
+
+class Memo(object):
+    ''' Memo
+    Request scoped cache of calls, while a store (a dict) is in use by a
+    thread (see use), the wrapped functions return a copy of the result of an
+    identical earlier call made with the same store instead of making the call
+    again.  Errors are not stored.  Outside of use, calls are just made.
+    '''
+    def __init__(self):
+        self.local = local()
+
+    @contextmanager
+    def use(self, store):
+        ''' Memo::use
+        Caches the calls made by this thread in the store until the block
+        exits, the same store can be used by several threads at once.
+        '''
+        self.local.store = store
+        try:
+            yield store
+        finally:
+            self.local.store = None
+
+    def wrap(self, func):
+        ''' Memo::wrap
+        Returns func wrapped so that its results are cached in the store in
+        use, calls with unhashable arguments are just made.
+        '''
+        @wraps(func)
+        def memoized(*args, **kwargs):
+            store = getattr(self.local, 'store', None)
+            key = call_key(func, args, kwargs) if store is not None else None
+            if key is None:
+                return func(*args, **kwargs)
+            if key not in store:
+                store[key] = deepcopy(func(*args, **kwargs))
+            return deepcopy(store[key])
+        return memoized
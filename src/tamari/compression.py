@@ -0,0 +1,32 @@
+''' compression.py
+Collection of the content codings that response bodies can be compressed
+with.  gzip is always available, brotli and zstd are used if their libraries
+are installed.  Each encoder takes the body and the compression level (1-9).
+'''
+import zlib
+
+
+def gzip(data, level):
+    ''' gzip
+    Compresses the data into the gzip format, the header carries no
+    timestamp so the same data always compresses to the same bytes.
+    '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+ENCODERS = {
+    "gzip": gzip
+}
+
+try:  # optional encoders, used if installed
+    import brotli
+    ENCODERS["br"] = lambda data, level: brotli.compress(data, quality=level)
+except ImportError:
+    pass
+
+try:
+    import zstandard
+    ENCODERS["zstd"] = lambda data, level: \
+        zstandard.ZstdCompressor(level=level).compress(data)
+except ImportError:
+    pass
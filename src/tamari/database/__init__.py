@@ -1,19 +1,46 @@
+from os import environ
 from sys import modules
 from importlib import import_module
 from .. import settings
+from ..cache import SingleFlight, Memo
 import errors
 
 DEFAULT = "mongo"
-__submodules__ = ['User', 'Thread', 'Forum', 'Session', 'Permission']
-__engines__ = ["mongo"]
+__submodules__ = ['User', 'Thread', 'Forum', 'Session', 'Permission',
+                  'Bulk']
+__engines__ = ["mongo", "sqlite", "memory"]
+__coalesced__ = {  # read functions coalesced by the single flight layer,
+    # and shared by the calls of a batch
+    'Thread': ['get', 'get_page', 'get_post'],
+    'Forum': ['get', 'children'],
+    'User': ['get']
+}
 __dict__ = modules[__name__].__dict__
-engine = settings.DATABASE.get('type', DEFAULT)
+# TAMARI_ENGINE overrides the configured engine (i.e. to run the tests
+# against each engine, see `make conformance`)
+engine = environ.get('TAMARI_ENGINE', settings.DATABASE.get('type', DEFAULT))
 
 if engine in __engines__:
     engine = import_module("." + engine, __name__)
     for submodule in __submodules__:
         __dict__[submodule] = import_module("." + submodule, engine.__name__)
     cleanup = engine.cleanup
+    migrate = engine.migrate
+    # Concurrent identical reads (i.e. a burst of requests for the same page)
+    # share a single call to the database, coalescer.collapsed counts them
+    coalescer = SingleFlight()
+    if settings.DATABASE.get('coalesce', True):
+        for submodule, functions in __coalesced__.items():
+            for function in functions:
+                setattr(__dict__[submodule], function, coalescer.wrap(
+                    getattr(__dict__[submodule], function)))
+    # Reads made while a store is in use with memo.use (i.e. by the calls of
+    # a batch) are only made once
+    memo = Memo()
+    for submodule, functions in __coalesced__.items():
+        for function in functions:
+            setattr(__dict__[submodule], function, memo.wrap(
+                getattr(__dict__[submodule], function)))
 else:
     raise errors.DBNotDefinedError(
         'The database is not defined in the settings file')
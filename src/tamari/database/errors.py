@@ -50,3 +50,19 @@ class NoEntryError(DatabaseError):
     to signify that the ID provided is incorrect
     '''
     pass
+
+
+class BadCursorError(DatabaseError):
+    ''' BadCursorError
+    Raised by the db layer when a pagination cursor provided by a client can
+    not be decoded into a position in the result set
+    '''
+    pass
+
+
+class ConflictError(DatabaseError):
+    ''' ConflictError
+    Raised by the db layer when a change is made against a version of a
+    document that is no longer the current one
+    '''
+    pass
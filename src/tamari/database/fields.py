@@ -0,0 +1,36 @@
+''' fields.py
+Helper functions for the sparse fieldsets of packets (the 'fields' argument
+of the read functions), shared by the database engines.  Fields are the keys
+of the packet, fields of nested packets are dotted (i.e. 'posts.content').
+'''
+
+
+def includes(fields, field):
+    ''' includes
+    Helper function that returns whether the field (or any of its nested
+    fields) was requested.
+    '''
+    return fields is None or field in fields or \
+        any(requested.startswith(field + '.') for requested in fields)
+
+
+def subfields(fields, field):
+    ''' subfields
+    Helper function that returns the nested fields requested for the field,
+    None (all of them) if the field itself was requested.
+    '''
+    if fields is None or field in fields:
+        return None
+    return frozenset(requested[len(field) + 1:] for requested in fields
+                     if requested.startswith(field + '.'))
+
+
+def sparse(packet, fields):
+    ''' sparse
+    Helper function that limits the packet to the requested fields, the url
+    is always kept.
+    '''
+    if fields is None:
+        return packet
+    return {key: value for key, value in packet.iteritems()
+            if key == 'url' or includes(fields, key)}
@@ -0,0 +1,109 @@
+''' Bulk
+Bulk writes of generated data (see synthetic.py), the rows of each batch are
+stored at once and each index group they touch is sorted once.  The rows hold
+the ids (as strings) of the rows they refer to, the ids of the written rows
+are returned in order.
+'''
+from . import store, lock, new_id
+from .. import errors
+from ..rows import key, ident
+from datetime import datetime
+
+
+def users(rows):
+    ''' users
+    Writes the users, none of them have any rights.  If any of the usernames
+    is taken (or repeated in the batch) an ExistingUsernameError is raised
+    and none are written.
+    '''
+    users = [{
+        "id": new_id(),
+        "username": row['username'],
+        "password": row['password'],
+        "rights": [],
+        "created": row.get('created', datetime.utcnow()),
+        "modified": None,
+        "modified_by": None
+    } for row in rows]
+    with lock:
+        batch = set()  # usernames seen earlier in the batch
+        for user in users:
+            if user['username'] in store.usernames or \
+                    user['username'] in batch:
+                raise errors.ExistingUsernameError(
+                    "Username: {} already exists", user['username'])
+            batch.add(user['username'])
+        for user in users:
+            store.users[user['id']] = user
+            store.usernames[user['username']] = user['id']
+    return [ident(user['id']) for user in users]
+
+
+def forums(rows):
+    ''' forums
+    Writes the forums, their parents must already be written
+    '''
+    forums = [{
+        "id": new_id(),
+        "name": row['name'],
+        "parent": key(row['parent']) if row['parent'] else None,
+        "thread_count": 0,
+        "post_count": 0
+    } for row in rows]
+    with lock:
+        for forum in forums:
+            store.forums[forum['id']] = forum
+        store.forums_parent.add_many(forums)
+    return [ident(forum['id']) for forum in forums]
+
+
+def threads(rows):
+    ''' threads
+    Writes the threads along with their posts (the first is the head post),
+    and adds them to the counts of their forums
+    '''
+    threads, posts, counts = [], [], {}
+    for row in rows:
+        thread = {
+            "id": new_id(),
+            "forum": key(row['forum']),
+            "title": row['title'],
+            "user": key(row['user']),
+            "created": row['created'],
+            "editted": None,
+            "editted_by": None,
+            "post_count": len(row['posts']),
+            "last_post_at": row['posts'][-1]['created'],
+            "last_post_user": key(row['posts'][-1]['user']),
+            "version": 0
+        }
+        for post in row['posts']:
+            posts.append({
+                "id": new_id(),
+                "thread": thread['id'],
+                "user": key(post['user']),
+                "content": post['content'],
+                "created": post['created'],
+                "editted": None,
+                "editted_by": None,
+                "version": 0
+            })
+        thread['head'] = posts[-len(row['posts'])]['id']
+        threads.append(thread)
+        count = counts.setdefault(thread['forum'], [0, 0])
+        count[0] += 1
+        count[1] += thread['post_count']
+
+    with lock:
+        for post in posts:
+            store.posts[post['id']] = post
+        for thread in threads:
+            store.threads[thread['id']] = thread
+        store.posts_thread.add_many(posts)
+        store.threads_created.add_many(threads)
+        store.threads_activity.add_many(threads)
+        for forum, (thread_count, post_count) in counts.iteritems():
+            if forum in store.forums:
+                store.forums[forum]['thread_count'] += thread_count
+                store.forums[forum]['post_count'] += post_count
+    return [ident(thread['id']) for thread in threads]
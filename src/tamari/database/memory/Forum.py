@@ -0,0 +1,152 @@
+''' Forum
+The wrapper class for operations on forums in the database backend, this
+includes things like creating a forum, getting the list of forums at
+different levels of the hierarchy
+'''
+from . import store, lock, new_id, page, includes, sparse
+from ..rows import key, ident
+from .. import errors
+from ...links import Link
+paths = {}  # cache of forum id -> ids from the root down to the forum, the
+    # tree is only ever added to, so an entry never goes stale
+
+
+def create(info):
+    ''' create
+    Single argument function, this argument should be a dictionary of all
+    of the information for creating this forum.  Should really just have
+    a name and a parent, if it's parent is root, don't add it.
+    '''
+    if not info:
+        raise errors.MissingInfoError('No forum information provided')
+
+    info.update({
+        'thread_count': 0,
+        'post_count': 0
+    })
+    if info['parent']:
+        if key(info['parent']) not in store.forums:
+            raise errors.NoEntryError('No forum found with provided parent id')
+        info['parent'] = key(info['parent'])
+    else:
+        info['parent'] = None
+
+    __insert(info)
+    return __full(info)
+
+
+def get(forum_id, fields=None):
+    ''' get
+    Returns the forum information for the specified forum level, the level
+    should be the ID of the forum, if level is not specified, it will
+    return a list of the root subforums.  If fields is set, the packet is
+    limited to those fields.
+    '''
+    forum = store.forums.get(key(forum_id))
+    if not forum:
+        raise errors.NoEntryError('No forum found with provided id')
+    return __full(forum, fields)
+
+
+def children(parent=None, fields=None):
+    ''' children
+    Returns a list of the forums whose parent is the provided argument.  If
+    fields is set, the packets are limited to those fields.
+    '''
+    return [__simple(store.forums[id], fields) for id
+            in page(store.forums_parent, key(parent))]
+
+
+def get_root():
+    ''' get_root
+    If there is are no forums in the database, a basic root forum is created
+    and the id is returned, if there are forums in the database, the root forum
+    is retrieved and the id is returned.  Used in discovery of the root forum.
+    '''
+    with lock:
+        root = page(store.forums_parent, None, 1)
+        if root:
+            return root[0]
+        return __insert({
+            'name': 'root',
+            'parent': None,
+            'thread_count': 0,
+            'post_count': 0
+        })
+
+
+def __insert(forum):
+    ''' (private) ::__insert
+    Stores the forum (and its index entry), returns its id
+    '''
+    with lock:
+        forum['id'] = new_id()
+        store.forums[forum['id']] = forum.copy()
+        store.forums_parent.add(forum)
+    return forum['id']
+
+
+def __simple(forum, fields=None):
+    ''' (private) ::__simple
+    Simple format of the forum packet
+    '''
+    return sparse({
+        "url": Link('get_forum', forum_id=ident(forum['id'])),
+        "name": forum.get('name')
+    }, fields)
+
+
+def __full(packet, fields=None):
+    ''' (private) ::__full
+    Full format of the forum packet
+    '''
+    forum = packet.copy()
+    if includes(fields, 'breadcrumbs'):
+        forum['breadcrumbs'] = [__simple(parent)
+                                for parent in ancestors(forum)]
+    forum['id'] = ident(forum['id'])
+    forum['parent'] = ident(forum.get('parent'))
+    forum['url'] = Link('get_forum', forum_id=forum['id'])
+    forum['threads'] = Link('get_threads', forum_id=forum['id'])
+    forum['forums'] = Link('get_forums', forum_id=forum['id'])
+    return sparse(forum, fields)
+
+
+def ancestors(forum):
+    ''' ancestors
+    Returns the ancestors (the forums from the root down to the parent) of
+    the forum, walking up the parents.
+    '''
+    chain = []
+    parent = store.forums.get(forum.get('parent'))
+    while parent:
+        chain.insert(0, parent)
+        parent = store.forums.get(parent['parent'])
+    return chain
+
+
+def path(forum_id):
+    ''' path
+    Returns the ids (as strings) of the forum and all of its ancestors.  These
+    are cached per process after the first lookup of a forum.
+    '''
+    forum_id = str(forum_id)
+    if forum_id not in paths:
+        forum = store.forums.get(key(forum_id))
+        if not forum:
+            raise errors.NoEntryError('No forum found with provided id')
+        paths[forum_id] = frozenset(
+            [ident(parent['id']) for parent in ancestors(forum)] +
+            [forum_id])
+    return paths[forum_id]
+
+
+def find_parent(forum, id_list):
+    ''' find_parent
+    Helper function, finds if the forum or the forum's parent(s) are in the
+    provided id_list, used for checking permissions
+    '''
+    if 0 in id_list:  # CHANGEME: checks if id_list is root
+        return True
+
+    return not path(forum).isdisjoint(id_list)
@@ -0,0 +1,58 @@
+''' Permissions.py
+Permissions checking is established in here per database backend, this will
+provide functions that deal with checking permissions on whether a user has
+permissions to modify and create and specific levels based on their rights and
+the settings of the application.
+'''
+from . import settings, store
+from ..rows import key, ident
+from .Forum import find_parent
+from flask import session
+
+inherit = settings.INHERIT_ADMINS
+
+
+def is_root():
+    ''' is_root
+    Returns whether the user is the root user, giving them super rights across
+    the application.
+    '''
+    return 0 in session['rights']
+
+
+def check_forum(forum_id):
+    ''' check_forum
+    Returns whether the user has the rights to modify things in the specified
+    forum level.  This will check parents if the application property
+    INHERIT_ADMINS is set (i.e. an admin at the root level has rights to modify
+    the root > sub_forum level), the path of the forum makes this a single set
+    intersection with the session rights.
+    '''
+    if is_root():
+        return True
+    return find_parent(forum_id, session['rights']) if inherit \
+        else forum_id in session['rights']
+
+
+def check_thread(thread_id):
+    ''' check_thread
+    Returns whether the user has the rights to modify the specified forum.
+    If the user is the creator of the thread, they have rights, if the user is
+    an admin of the forum posted in, they have rights.
+    '''
+    thread = store.threads[key(thread_id)]
+    return True if ident(thread['user']) == session['id'] \
+        else check_forum(ident(thread['forum']))
+
+
+def check_post(post_id):
+    ''' check_post
+    Returns whether the user has the rights to modify the specified post.  If
+    the user is the creator of the post, they have rights, if the user is an
+    admin of the forum posted in, they have rights.
+    '''
+    post = store.posts[key(post_id)]
+    if ident(post['user']) != session['id']:
+        thread = store.threads[post['thread']]
+        return check_forum(ident(thread['forum']))
+    return True
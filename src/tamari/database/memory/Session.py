@@ -0,0 +1,43 @@
+''' Session
+Storage of the server side sessions and of the revoked tokens
+'''
+from . import store, lock, new_id
+from datetime import datetime
+from copy import deepcopy
+import time
+
+
+def get(id):
+    try:
+        packet = store.sessions.get(int(id))
+    except (TypeError, ValueError):
+        return None
+    return deepcopy(packet) if packet else None
+
+
+def save(packet):
+    if packet.get('_id') is None:
+        packet['_id'] = new_id()
+    store.sessions[packet['_id']] = deepcopy(dict(packet))
+    return packet['_id']
+
+
+def remove(id):
+    store.sessions.pop(id, None)
+
+
+def revoke(token, expires):
+    # tokens past their expiry can't be used anyway, so their entries go
+    now = time.time()
+    with lock:
+        for entry, (until, revoked) in store.revoked_sessions.items():
+            if until <= now:
+                del store.revoked_sessions[entry]
+        store.revoked_sessions[token] = (expires, datetime.utcnow())
+
+
+def revoked(since=None):
+    now = time.time()
+    return [(token, expires) for token, (expires, revoked)
+            in store.revoked_sessions.items()
+            if expires > now and (not since or revoked >= since)]
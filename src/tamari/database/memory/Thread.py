@@ -0,0 +1,319 @@
+''' Thread
+The wrapper class for operations on threads in the database backend, there
+are two tables, one is a table of threads, this will hold the title (which
+is not going to be part of each post) and the head post, then there is a
+much larger table of posts which all belong to a thread
+'''
+from . import store, lock, new_id, page, includes, subfields
+from .User import get_many as get_users
+from ..rows import key, encode_cursor, decode_cursor, thread_summary, \
+    thread_packet, post_packet, find_authors
+from .. import errors
+from datetime import datetime
+from flask import session
+
+editable = {  # fields an edit can set, for each table
+    "threads": ["title", "editted", "editted_by"],
+    "posts": ["content", "editted", "editted_by"]
+}
+sorts = {  # orderings of the thread list, name -> field sorted on
+    "created": "created",
+    "activity": "last_post_at"
+}
+indexes = {  # index of the thread list for each sorted field
+    "created": "threads_created",
+    "last_post_at": "threads_activity"
+}
+STREAM_BATCH = 100  # posts read (and authors looked up) at a time by stream
+
+
+def create(info=None):
+    ''' create
+    Single argument function, this argument should be the thread being
+    created.  The thread is stored with a pointer to the post information as
+    the 'head' of the thread, then the rest will be stored as a post beginning
+    the thread.
+    '''
+    if not info:
+        raise errors.MissingInfoError('No thread information provided')
+
+    created = datetime.utcnow()
+    thread = {
+        "id": new_id(),
+        "forum": key(info['forum']) if 'forum' in info else None,
+        "title": info.get('title'),
+        "user": key(info['user']),
+        "head": new_id(),
+        "created": created,
+        "editted": None,
+        "editted_by": None,
+        "post_count": 1,
+        "last_post_at": created,
+        "last_post_user": key(info['user']),
+        "version": 0
+    }
+    post = {
+        "id": thread['head'],
+        "thread": thread['id'],
+        "user": thread['user'],
+        "content": info.get('content'),
+        "created": created,
+        "editted": None,
+        "editted_by": None,
+        "version": 0
+    }
+    with lock:
+        forum = store.forums.get(thread['forum'])
+        if thread['forum'] is not None and not forum:
+            raise errors.NoEntryError('No forum found with provided id')
+        __insert_post(post)
+        store.threads[thread['id']] = thread.copy()
+        store.threads_created.add(thread)
+        store.threads_activity.add(thread)
+        if forum:
+            forum['thread_count'] += 1
+            forum['post_count'] += 1
+
+    return thread_packet(thread, [post])
+
+
+def edit_thread(id, user=None, info=None, version=None):
+    ''' edit_thread
+    Modifies the thread entry in the database based on the thread id that
+    is passed in.  The provided information is applied at once, and if a
+    version is given, only if the thread is still at that version (otherwise
+    a ConflictError is raised).  Returns the updated thread without its
+    posts.
+    '''
+    if not info:
+        raise errors.MissingInfoError('No thread information provided')
+
+    return thread_packet(__edit("threads", id, user, info, version), None)
+
+
+def get(thread_id=None, forum=None, limit=0, start=0, expand=False,
+        fields=None):
+    ''' get
+    Retrieval function for threads.  The purpose is to return all of the
+    threads based on given conditions.  If the id argument is set, it will
+    return more granular information on that single thread, if it is not,
+    a list of threads with a simple summary will be returned instead.  If
+    expand is set, the public packets of the authors are embedded in place of
+    their urls.  If fields is set, the packets are limited to those fields
+    (with the posts limited by the nested 'posts.' fields).
+    '''
+    if not thread_id:  # Thread list
+        thread_set = [store.threads[id] for id in page(
+            store.threads_created, key(forum), limit, start, True)]
+        authors = find_authors(thread_set, get_users) if expand else None
+        return [thread_summary(thread, authors, fields)
+                for thread in thread_set]
+    else:  # Single thread
+        thread = store.threads.get(key(thread_id))
+        if not thread:
+            raise errors.NoEntryError('No thread found for provided id')
+        post_set = None  # posts are only read if they were requested
+        if includes(fields, "posts"):
+            post_set = [store.posts[id] for id in page(
+                store.posts_thread, thread['id'], limit, start)]
+        authors = find_authors([thread] + (post_set or []), get_users) \
+            if expand else None
+        return thread_packet(thread, post_set, authors, fields)
+
+
+def stream(thread_id=None, limit=0, start=0, expand=False, fields=None):
+    ''' stream
+    Retrieves a single thread like get, but the posts of the thread are a
+    generator reading them from the index as they are consumed (in batches of
+    STREAM_BATCH, along with the authors of each batch if expand is set), so
+    the packets of a large page of posts are never held in memory at once.
+    '''
+    thread = store.threads.get(key(thread_id))
+    if not thread:
+        raise errors.NoEntryError('No thread found for provided id')
+    post_ids = page(store.posts_thread, thread['id'], limit, start)
+    thread = thread_packet(
+        thread, None,
+        find_authors([thread], get_users) if expand else None, fields)
+    if includes(fields, "posts"):
+        thread['posts'] = __stream(
+            post_ids, expand, subfields(fields, "posts"))
+    return thread
+
+
+def get_page(forum=None, limit=0, cursor=None, start=0, sort="created",
+             expand=False, fields=None):
+    ''' get_page
+    Keyset paginated retrieval of the thread list for a forum, newest first
+    by the ordering named by sort (one of sorts).  If a cursor (from a previous
+    page) is provided, the page begins past the position stored in it in the
+    index of the ordering (and in the ordering stored in it), otherwise the
+    page begins at the offset of start.  Returns a tuple of the list of
+    threads and a dict with the 'prev' and 'next' cursors for the surrounding
+    pages (None if there is no page in that direction).  If expand is set,
+    the public packets of the authors are embedded in place of their urls.  If
+    fields is set, the threads are limited to those fields.
+    '''
+    direction, field, position = "next", sorts[sort], None
+    if cursor:
+        direction, field, date, id = decode_cursor(cursor, sorts.values())
+        position = (date, id)
+        start = 0
+
+    index = getattr(store, indexes[field])
+    thread_set = [store.threads[thread_id] for thread_id in page(
+        index, key(forum), limit, start, direction == "next", position)]
+    full = limit and len(thread_set) == limit
+    if direction == "prev":
+        thread_set.reverse()
+
+    cursors = {"prev": None, "next": None}
+    if thread_set:
+        if cursor or start:
+            cursors["prev"] = encode_cursor(thread_set[0], "prev", field) \
+                if direction == "next" or full else None
+        if direction == "prev" or full:
+            cursors["next"] = encode_cursor(thread_set[-1], "next", field)
+
+    authors = find_authors(thread_set, get_users) if expand else None
+    return [thread_summary(thread, authors, fields)
+            for thread in thread_set], cursors
+
+
+def get_post(id=None, expand=False, fields=None):
+    ''' get_post
+    Retrieval function to get a single post.  Just requires the identifier
+    for the desired post and will return the entry in the database.  If
+    the identifier is not found or provided, an error will be raised.  If
+    expand is set, the public packet of the author is embedded.  If fields is
+    set, the post is limited to those fields.
+    '''
+    if not id:
+        raise errors.MissingInfoError("No id provided to retrieve post for")
+    # Retrieve post
+    post = store.posts.get(key(id))
+    if not post:
+        raise errors.NoEntryError("No post found for provided id")
+
+    return post_packet(
+        post, find_authors([post], get_users) if expand else None, fields)
+
+
+def reply(id=None, post=None):
+    ''' reply
+    Creates a post in reply to a thread, this does not create a new thread
+    but instead adds onto an existing thread, there are two arguments, the
+    id of the thread being replied to and the actual post that is a reply
+    to the thread
+    '''
+    if not id or not post:
+        raise errors.MissingInfoError('No id/post provided for the reply')
+    post = {
+        "id": new_id(),
+        "thread": key(id),
+        "user": key(post['user']),
+        "content": post.get('content'),
+        "created": post.get('created', datetime.utcnow()),
+        "editted": None,
+        "editted_by": None,
+        "version": 0
+    }
+    with lock:
+        thread = store.threads.get(post['thread'])
+        if not thread:
+            raise errors.NoEntryError('No thread found for provided id')
+        store.threads_activity.remove(thread)
+        thread.update({
+            "post_count": thread['post_count'] + 1,
+            "last_post_at": post['created'],
+            "last_post_user": post['user']
+        })
+        store.threads_activity.add(thread)
+        if thread['forum'] in store.forums:
+            store.forums[thread['forum']]['post_count'] += 1
+        __insert_post(post)
+    return post_packet(post)
+
+
+def edit_post(id, user=None, info=None, version=None):
+    ''' edit_post
+    Modifies the post entry in the databased based on the post id that is
+    passed in.  The provided information is applied at once, and if a
+    version is given, only if the post is still at that version (otherwise a
+    ConflictError is raised).
+    '''
+    if not info:
+        raise errors.MissingInfoError('No post information provided')
+
+    return post_packet(__edit("posts", id, user, info, version))
+
+
+def __edit(table, id, user, info, version):
+    ''' (private) __edit
+    Applies the edit to the row of the table, bumping the version of the
+    row, returns the modified row.  Only the editable fields of the table
+    are set, none of them are in an index.
+    '''
+    user = user if user else session['id']
+    info.update({
+        "editted": datetime.utcnow(),
+        "editted_by": key(user)
+    })
+    with lock:
+        row = getattr(store, table).get(key(id))
+        if not row:
+            raise errors.NoEntryError('No document found for provided id')
+        if version is not None and row['version'] != version:
+            raise errors.ConflictError(
+                'Document has been modified since version {}', version)
+        row.update((name, info[name]) for name in editable[table]
+                   if name in info)
+        row['version'] += 1
+        return row.copy()
+
+
+def reconcile():
+    ''' reconcile
+    Rebuilds the post_count, last_post_at and last_post_user of every thread
+    and the thread_count and post_count of every forum from the posts
+    themselves, the latest post of a thread is the last entry of its posts
+    index.  Returns the number of threads and forums updated.
+    '''
+    with lock:
+        for forum in store.forums.itervalues():
+            forum.update(thread_count=0, post_count=0)
+        for thread in store.threads.itervalues():
+            latest = page(store.posts_thread, thread['id'], 1, reverse=True)
+            latest = store.posts[latest[0]] if latest else {}
+            store.threads_activity.remove(thread)
+            thread.update({
+                "post_count": store.posts_thread.count(thread['id']),
+                "last_post_at": latest.get('created'),
+                "last_post_user": latest.get('user')
+            })
+            store.threads_activity.add(thread)
+            if thread['forum'] in store.forums:
+                forum = store.forums[thread['forum']]
+                forum['thread_count'] += 1
+                forum['post_count'] += thread['post_count']
+        return len(store.threads), len(store.forums)
+
+
+def __insert_post(post):
+    ''' (private) __insert_post
+    Stores the post (and its index entry)
+    '''
+    store.posts[post['id']] = post.copy()
+    store.posts_thread.add(post)
+
+
+def __stream(post_ids, expand=False, fields=None):
+    ''' (private) __stream
+    Generates the cleaned up posts of the ids a batch at a time
+    '''
+    for begin in xrange(0, len(post_ids), STREAM_BATCH):
+        batch = [store.posts[id]
+                 for id in post_ids[begin:begin + STREAM_BATCH]]
+        authors = find_authors(batch, get_users) if expand else None
+        for post in batch:
+            yield post_packet(post, authors, fields)
@@ -0,0 +1,120 @@
+''' User
+The wrapper class for operations on users in the database backend, this
+includes things like creating a new user, logging in as a user, or getting
+the public information of a user.
+'''
+from . import store, lock, new_id, sparse
+from ..rows import key, keys, ident
+from .. import errors
+from ...links import Link
+from datetime import datetime
+user_keys = ["username", "password"]
+
+
+def create(info):
+    ''' create
+    Single argument function, this argument should be a dictionary of all
+    of the information for this user.  At this point, there should be
+    minimal validation on this packet and it will really just be inserted
+    into the DB as is.  The username index rejects the user if the username
+    is already taken.
+    '''
+    if 'rights' not in info:
+        info['rights'] = []
+
+    with lock:
+        if not store.users:
+            info['rights'].append(0)
+
+        info.update({
+            'created': datetime.utcnow(),
+            'modified': None,
+            'modified_by': None
+        })
+
+        if info['username'] in store.usernames:
+            raise errors.ExistingUsernameError(
+                "Username: {} already exists", info["username"])
+        info['id'] = new_id()
+        store.users[info['id']] = dict(info, rights=list(info['rights']))
+        store.usernames[info['username']] = info['id']
+
+    return str(info['id']), __private(info)
+
+
+def login(username, password):
+    ''' login
+    Performs a login check with the provided credentials, the password is
+    just looking for a match, the hashing occurs above the layer.  Returns
+    None if no matching user was found.
+    '''
+    user = store.users.get(store.usernames.get(username))
+    if user and user['password'] == password:
+        return user['id'], __private(user)
+    return None, None
+
+
+def get(id=None, private=False, fields=None):
+    ''' get
+    Returns the public form of the user with the provided ID, if no ID is
+    provided, throws an error.  If no user is found with the ID, returns
+    None.  If fields is set, the packet is limited to those fields.
+    '''
+    if not id:
+        raise errors.MissingInfoError('No ID for the user request')
+
+    user = store.users.get(key(id))
+    if not user:
+        raise errors.NoEntryError("No user found with the provided id")
+    return sparse(__public(user) if not private else __private(user), fields)
+
+
+def get_many(ids):
+    ''' get_many
+    Returns the public forms of the users with the provided IDs, keyed by the
+    (string) ID.  IDs that don't match a user (or aren't IDs) are left out.
+    '''
+    users = [store.users.get(id) for id in keys(ids)]
+    return {str(user['id']): __public(user) for user in users if user}
+
+
+def delete(id=None):
+    ''' delete
+    Removes the specified user from the database.  If no ID is provided or the
+    ID does not point to an existing user, an error is raised.
+    '''
+    if not id:
+        raise errors.MissingInfoError('No ID for the user deletion')
+    with lock:
+        user = store.users.pop(key(id), None)
+        if user:
+            store.usernames.pop(user['username'], None)
+
+
+def __private(user):
+    ''' (private) __private
+    method for formatting the information when used *by* the user (this
+    is all of the private information for the user).  This method is used
+    to standardize the output format from the DB wrapper to the API layer.
+    '''
+    private_packet = user.copy()
+    private_packet.pop("password", None)
+    private_packet['id'] = ident(private_packet['id'])
+    private_packet['rights'] = list(private_packet.get('rights', []))
+
+    private_packet['url'] = Link('get_user', user_id=private_packet['id'])
+
+    return private_packet
+
+
+def __public(user):
+    ''' (private) __public
+    method for formatting the information when used by another user (this
+    is for all of the public information for the user).  This method is
+    used to standardize the output format from the DB wrapper to the API
+    layer.
+    '''
+    return {
+        'username': user.get('username'),
+        'url': Link('get_user', user_id=ident(user['id']))
+    }
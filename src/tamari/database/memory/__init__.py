@@ -0,0 +1,159 @@
+''' memory
+Storage engine keeping the forum in dicts in the memory of the process, for
+the tests and for profiling the web layer without the latency of a database.
+Rows are dicts keyed by their id in a table (a dict) for each kind of row,
+with the lists read through secondary indexes (see Index) that are kept
+sorted as the rows are written.  Nothing is persisted, the store is emptied
+when the process exits (or by cleanup).
+'''
+from sys import modules
+from bisect import bisect_left, bisect_right, insort
+from itertools import count
+from threading import RLock
+from ..fields import includes, subfields, sparse
+settings = modules['tamari.settings']
+
+ids = count(1)  # ids are never reused (like ObjectIds), even after cleanup,
+    # so they are safe to cache and hand out
+lock = RLock()  # held by writes that touch a row and its index entries,
+    # and by the scans of the indexes
+
+
+class Index(object):
+    ''' Index
+    Secondary index of a table, for each value of the grouping column the
+    keys (the values of the ordering columns followed by the id) of its rows,
+    kept sorted as rows are added and removed.
+    '''
+    def __init__(self, group, order=()):
+        self.group = group
+        self.order = order
+        self.entries = {}
+
+    def key(self, row):
+        ''' Index::key
+        The key of the row in the index
+        '''
+        return tuple(row.get(column) for column in self.order) + (row['id'],)
+
+    def add(self, row):
+        ''' Index::add
+        Adds the row to the index
+        '''
+        insort(self.entries.setdefault(row.get(self.group), []),
+               self.key(row))
+
+    def add_many(self, rows):
+        ''' Index::add_many
+        Adds the rows to the index, sorting each group once
+        '''
+        groups = set()
+        for row in rows:
+            self.entries.setdefault(row.get(self.group), []).append(
+                self.key(row))
+            groups.add(row.get(self.group))
+        for group in groups:
+            self.entries[group].sort()
+
+    def remove(self, row):
+        ''' Index::remove
+        Removes the row from the index
+        '''
+        entries = self.entries.get(row.get(self.group), [])
+        key = self.key(row)
+        index = bisect_left(entries, key)
+        if index < len(entries) and entries[index] == key:
+            del entries[index]
+
+    def scan(self, group, reverse=False, position=None, limit=0, start=0):
+        ''' Index::scan
+        Returns the keys in the group, in order (or in reverse order), that
+        are past the position (a key) if one is provided, skipping start of
+        them and up to limit (0 is no limit).  The keys are copied under the
+        lock, as writes move a row by removing and adding its key.
+        '''
+        with lock:
+            entries = self.entries.get(group, [])
+            if reverse:
+                end = bisect_left(entries, position) if position \
+                    else len(entries)
+                end = max(end - start, 0)
+                return entries[max(end - limit, 0) if limit else 0:end][::-1]
+            begin = (bisect_right(entries, position) if position else 0) + \
+                start
+            return entries[begin:begin + limit if limit else None]
+
+    def count(self, group):
+        ''' Index::count
+        Number of rows in the group
+        '''
+        return len(self.entries.get(group, []))
+
+
+class Store(object):
+    ''' Store
+    The tables and indexes of the engine
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        ''' Store::reset
+        Empties the store, the old tables are just dropped
+        '''
+        self.users, self.forums, self.threads, self.posts = {}, {}, {}, {}
+        self.sessions, self.revoked_sessions = {}, {}
+        self.usernames = {}  # unique index, username -> user id
+        self.forums_parent = Index("parent")
+        self.threads_created = Index("forum", ("created",))
+        self.threads_activity = Index("forum", ("last_post_at",))
+        self.posts_thread = Index("thread", ("created",))
+
+store = Store()
+# Indexes of the store, (name, description) for each, reported by migrate
+INDEXES = [
+    ("usernames", "users by username (unique)"),
+    ("forums_parent", "forums by parent"),
+    ("threads_created", "threads by forum, created"),
+    ("threads_activity", "threads by forum, last_post_at"),
+    ("posts_thread", "posts by thread, created"),
+]
+
+
+def migrate(dry_run=False):
+    ''' migrate
+    The indexes are always kept with the tables, so there is nothing to
+    create.  A dry run reports the indexes that are kept.
+    '''
+    if not dry_run:
+        return []
+    return ["index {} kept in memory ({} groups)".format(
+        description, len(getattr(store, name)) if name == "usernames"
+        else len(getattr(store, name).entries))
+        for name, description in INDEXES]
+
+
+def cleanup():
+    ''' cleanup
+    Used by the unittest system to cleanup the database between tests, the
+    store is swapped for empty tables rather than emptied row by row.
+    '''
+    if settings.DEBUG:
+        with lock:
+            store.reset()
+
+
+def new_id():
+    ''' new_id
+    The key for a new row
+    '''
+    return next(ids)
+
+
+def page(index, group, limit=0, start=0, reverse=False, position=None):
+    ''' page
+    The ids of the page of the group in the index (see Index.scan), a limit
+    of 0 is no limit
+    '''
+    return [entry[-1] for entry in index.scan(
+        group, reverse, position, limit, start)]
@@ -0,0 +1,126 @@
+''' Bulk
+Bulk writes of generated data (see synthetic.py), the documents of a batch
+are written with batch inserts of up to INSERT_BATCH documents.  The ids are
+generated on the app side, so the documents can refer to each other without
+being read back.  The rows hold the ids (as strings) of the documents they
+refer to, the ids of the written documents are returned in order.
+'''
+from . import database as mongo
+from . import ObjectId, new_id
+from .. import errors
+from .Forum import ancestors
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+INSERT_BATCH = 1000  # documents sent by each insert
+
+
+def users(rows):
+    ''' users
+    Writes the users, none of them have any rights.  If any of the usernames
+    is taken (or repeated in the batch) an ExistingUsernameError is raised
+    and none are written (unless the username was taken while the batch was
+    being written).
+    '''
+    users = [{
+        "_id": new_id(),
+        "username": row['username'],
+        "password": row['password'],
+        "rights": [],
+        "created": row.get('created', datetime.utcnow()),
+        "modified": None,
+        "modified_by": None
+    } for row in rows]
+    taken = set(user['username'] for user in mongo.users.find(
+        {"username": {"$in": [user['username'] for user in users]}},
+        fields=['username']))
+    for user in users:
+        if user['username'] in taken:
+            raise errors.ExistingUsernameError(
+                "Username: {} already exists", user['username'])
+        taken.add(user['username'])
+    try:
+        __insert(mongo.users, users, safe=True)
+    except DuplicateKeyError as err:
+        raise errors.ExistingUsernameError(str(err))
+    return [str(user['_id']) for user in users]
+
+
+def forums(rows):
+    ''' forums
+    Writes the forums (with their list of ancestors), their parents must
+    already be written
+    '''
+    parents = {parent['_id']: parent for parent in mongo.forums.find(
+        {"_id": {"$in": list(set(ObjectId(row['parent']) for row in rows
+                                 if row['parent']))}},
+        fields=['name', 'parent', 'ancestors'])}
+    forums = []
+    for row in rows:
+        forum = {
+            "_id": new_id(),
+            "name": row['name'],
+            "parent": None,
+            "ancestors": [],
+            "thread_count": 0,
+            "post_count": 0
+        }
+        if row['parent']:
+            parent = parents[ObjectId(row['parent'])]
+            forum['parent'] = parent['_id']
+            forum['ancestors'] = ancestors(parent) + [
+                {'_id': parent['_id'], 'name': parent['name']}]
+        forums.append(forum)
+    __insert(mongo.forums, forums)
+    return [str(document['_id']) for document in forums]
+
+
+def threads(rows):
+    ''' threads
+    Writes the threads along with their posts (the first is the head post),
+    and adds them to the counts of their forums
+    '''
+    threads, posts, counts = [], [], {}
+    for row in rows:
+        last = row['posts'][-1]
+        thread = {
+            "_id": new_id(),
+            "forum": ObjectId(row['forum']),
+            "title": row['title'],
+            "user": ObjectId(row['user']),
+            "created": row['created'],
+            "editted": None,
+            "post_count": len(row['posts']),
+            "last_post_at": last['created'],
+            "last_post_user": ObjectId(last['user']),
+            "version": 0
+        }
+        for post in row['posts']:
+            posts.append({
+                "_id": new_id(),
+                "thread": thread['_id'],
+                "user": ObjectId(post['user']),
+                "content": post['content'],
+                "created": post['created'],
+                "editted": None,
+                "version": 0
+            })
+        thread['head'] = posts[-len(row['posts'])]['_id']
+        threads.append(thread)
+        count = counts.setdefault(thread['forum'], [0, 0])
+        count[0] += 1
+        count[1] += thread['post_count']
+
+    __insert(mongo.posts, posts)
+    __insert(mongo.threads, threads)
+    for forum, (thread_count, post_count) in counts.iteritems():
+        mongo.forums.update({"_id": forum}, {"$inc": {
+            "thread_count": thread_count, "post_count": post_count}})
+    return [str(document['_id']) for document in threads]
+
+
+def __insert(collection, documents, **options):
+    ''' (private) __insert
+    Inserts the documents INSERT_BATCH at a time, with the options of insert
+    '''
+    for start in xrange(0, len(documents), INSERT_BATCH):
+        collection.insert(documents[start:start + INSERT_BATCH], **options)
@@ -4,45 +4,74 @@ includes things like creating a forum, getting the list of forums at
 different levels of the hierarchy
 '''
 from . import database as mongo
-from . import convert_id, ObjectId
+from . import convert_id, ObjectId, new_id, projection, includes, sparse
 from .. import errors
-from flask import url_for
+from ...links import Link
 database = mongo.forums
+paths = {}  # cache of forum id -> ids from the root down to the forum, the
+    # tree is only ever added to, so an entry never goes stale
+derived = {  # packet fields built from other document fields, see projection
+    "id": [], "url": [], "threads": [], "forums": [],
+    "breadcrumbs": ["ancestors", "parent"]
+}
 
 
 def create(info):
     ''' create
     Single argument function, this argument should be a dictionary of all
     of the information for creating this forum.  Should really just have
-    a name and a parent, if it's parent is root, don't add it
+    a name and a parent, if it's parent is root, don't add it.  The list of
+    ancestors (id and name of each forum from the root down to the parent) is
+    stored with the forum so the path never has to be walked.
     '''
     if not info:
         raise errors.MissingInfoError('No forum information provided')
 
+    info.update({
+        'ancestors': [],
+        'thread_count': 0,
+        'post_count': 0
+    })
     if info['parent']:
-        info['parent'] = ObjectId(info['parent'])
-
-    return get(database.insert(info))
-
-
-def get(forum_id):
+        parent = database.find_one(
+            {'_id': ObjectId(info['parent'])},
+            fields=['name', 'parent', 'ancestors'])
+        if not parent:
+            raise errors.NoEntryError('No forum found with provided parent id')
+        info['parent'] = parent['_id']
+        info['ancestors'] = ancestors(parent) + [
+            {'_id': parent['_id'], 'name': parent['name']}]
+
+    info['_id'] = new_id()
+    database.insert(info)
+    paths[str(info['_id'])] = frozenset(
+        [str(ancestor['_id']) for ancestor in info['ancestors']] +
+        [str(info['_id'])])
+    return __full(info)
+
+
+def get(forum_id, fields=None):
     ''' get
     Returns the forum information for the specified forum level, the level
     should be the ID of the forum, if level is not specified, it will
-    return a list of the root subforums
+    return a list of the root subforums.  If fields is set, the packet is
+    limited to those fields.
     '''
-    forum = database.find_one({'_id': ObjectId(forum_id)})
+    forum = database.find_one(
+        {'_id': ObjectId(forum_id)}, projection(fields, derived))
     if not forum:
         raise errors.NoEntryError('No forum found with provided id')
-    return __full(forum)
+    return __full(forum, fields)
 
 
-def children(parent=None):
+def children(parent=None, fields=None):
     ''' children
-    Returns a list of the forums whose parent is the provided argument.
+    Returns a list of the forums whose parent is the provided argument.  If
+    fields is set, the packets are limited to those fields.
     '''
     parent = ObjectId(parent)
-    return [__simple(forum) for forum in database.find({'parent': parent})]
+    return [__simple(forum, fields) for forum in database.find(
+        {'parent': parent}, projection(fields, derived))]
 
 
 def get_root():
@@ -54,32 +83,77 @@ def get_root():
     if database.count() == 0:
         return database.insert({
             'name': 'root',
-            'parent': None
+            'parent': None,
+            'ancestors': [],
+            'thread_count': 0,
+            'post_count': 0
         })
     else:
         return database.find_one({'parent': None})['_id']
 
 
-def __simple(forum):
+def __simple(forum, fields=None):
     ''' (private) ::__simple
     Simple format of the forum packet
     '''
-    return {
-        "url": url_for('get_forum', forum_id=str(forum['_id'])),
-        "name": forum['name']
-    }
+    return sparse({
+        "url": Link('get_forum', forum_id=str(forum['_id'])),
+        "name": forum.get('name')
+    }, fields)
 
 
-def __full(packet):
+def __full(packet, fields=None):
     ''' (private) ::__full
     Full format of the forum packet
     '''
     forum = packet.copy()
+    forum.setdefault('thread_count', 0)
+    forum.setdefault('post_count', 0)
+    if includes(fields, 'breadcrumbs'):
+        forum['breadcrumbs'] = [__simple(parent)
+                                for parent in ancestors(forum)]
+    forum.pop('ancestors', None)
     convert_id(forum)
-    forum['url'] = url_for('get_forum', forum_id=forum['id'])
-    forum['threads'] = url_for('get_threads', forum_id=forum['id'])
-    forum['forums'] = url_for('get_forums', forum_id=forum['id'])
-    return forum
+    forum['url'] = Link('get_forum', forum_id=forum['id'])
+    forum['threads'] = Link('get_threads', forum_id=forum['id'])
+    forum['forums'] = Link('get_forums', forum_id=forum['id'])
+    return sparse(forum, fields)
+
+
+def ancestors(forum):
+    ''' ancestors
+    Returns the stored list of ancestors for the forum document.  Forums that
+    were created before the list was stored have it built by walking up the
+    parents once, and it is then saved on the document.
+    '''
+    if 'ancestors' not in forum:
+        chain = []
+        parent = forum['parent']
+        while parent:
+            parent = database.find_one(
+                {'_id': parent}, fields=['name', 'parent'])
+            chain.insert(0, {'_id': parent['_id'], 'name': parent['name']})
+            parent = parent['parent']
+        database.update(
+            {'_id': forum['_id']}, {'$set': {'ancestors': chain}})
+        forum['ancestors'] = chain
+    return forum['ancestors']
+
+
+def path(forum_id):
+    ''' path
+    Returns the ids (as strings) of the forum and all of its ancestors.  These
+    are cached per process after the first lookup of a forum.
+    '''
+    forum_id = str(forum_id)
+    if forum_id not in paths:
+        forum = database.find_one(
+            {'_id': ObjectId(forum_id)}, fields=['parent', 'ancestors'])
+        if not forum:
+            raise errors.NoEntryError('No forum found with provided id')
+        paths[forum_id] = frozenset(
+            [str(parent['_id']) for parent in ancestors(forum)] + [forum_id])
+    return paths[forum_id]
 
 
 def find_parent(forum, id_list):
@@ -90,11 +164,4 @@ def find_parent(forum, id_list):
     if 0 in id_list:  # CHANGEME: checks if id_list is root
         return True
 
-    forum = database.find_one({'_id': ObjectId(forum)})
-    while forum['parent']:  # Loops through parent of forum until finds one
-            # or hits root
-        if str(forum['_id']) in id_list:
-            return True
-        forum = database.find_one({'_id': forum['parent']})
-
-    return str(forum['_id']) in id_list
+    return not path(forum).isdisjoint(id_list)
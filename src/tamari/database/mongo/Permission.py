@@ -29,7 +29,8 @@ def check_forum(forum_id):
     Returns whether the user has the rights to modify things in the specified
     forum level.  This will check parents if the application property
     INHERIT_ADMINS is set (i.e. an admin at the root level has rights to modify
-    the root > sub_forum level)
+    the root > sub_forum level), the stored path of the forum makes this a
+    single set intersection with the session rights.
     '''
     if is_root():
         return True
@@ -43,7 +44,8 @@ def check_thread(thread_id):
     If the user is the creator of the thread, they have rights, if the user is
     an admin of the forum posted in, they have rights.
     '''
-    thread = threads.find_one({'_id': ObjectId(thread_id)})
+    thread = threads.find_one(
+        {'_id': ObjectId(thread_id)}, fields=['user', 'forum'])
     return True if str(thread['user']) == session['id'] \
         else check_forum(str(thread['forum']))
 
@@ -54,8 +56,9 @@ def check_post(post_id):
     the user is the creator of the post, they have rights, if the user is an
     admin of the forum posted in, they have rights.
     '''
-    post = posts.find_one({'_id': ObjectId(post_id)})
+    post = posts.find_one(
+        {'_id': ObjectId(post_id)}, fields=['user', 'thread'])
     if str(post['user']) != session['id']:
-        thread = threads.find_one({'_id': post['thread']})
+        thread = threads.find_one({'_id': post['thread']}, fields=['forum'])
         return check_forum(str(thread['forum']))
     return True
@@ -1,6 +1,9 @@
 from . import database as mongo
 from bson.objectid import ObjectId
+from datetime import datetime
+from calendar import timegm
 database = mongo.sessions
+revocations = mongo.revoked_sessions
 
 
 def get(id):
@@ -13,3 +16,21 @@ def save(packet):
 
 def remove(id):
     return database.remove(ObjectId(id))
+
+
+def revoke(token, expires):
+    # expires is kept as a date so the TTL index drops the entry once the
+    # token could no longer be used anyway
+    revocations.save({
+        "_id": token,
+        "expires": datetime.utcfromtimestamp(expires),
+        "revoked": datetime.utcnow()
+    })
+
+
+def revoked(since=None):
+    query = {"expires": {"$gt": datetime.utcnow()}}
+    if since:
+        query["revoked"] = {"$gte": since}
+    return [(entry["_id"], timegm(entry["expires"].utctimetuple()))
+            for entry in revocations.find(query)]
@@ -5,17 +5,30 @@ is not going to be part of each post) and the head post, then there is a
 much larger table of posts which all belong to a thread
 '''
 from . import database as mongo
-from . import clean_dict, ObjectId, convert_id
+from . import clean_dict, ObjectId, convert_id, encode_cursor, decode_cursor, \
+    new_id, projection, includes, subfields, sparse
+from .User import get_many as get_users
 from .. import errors
 from datetime import datetime
+from itertools import islice
 from pymongo import DESCENDING, ASCENDING
-from flask import url_for, session
+from flask import session
+from ...links import Link
 
 threads = mongo.threads
 thread_keys = ["title", "user", "head", "created", "_id", "editted",
-               "forum"]
+               "forum", "post_count", "last_post_at", "last_post_user"]
 posts = mongo.posts
 post_keys = ["content", "user", "thread", "created", "_id", "editted"]
+forums = mongo.forums
+sorts = {  # orderings of the thread list, name -> field sorted on
+    "created": "created",
+    "activity": "last_post_at"
+}
+STREAM_BATCH = 100  # posts read (and authors looked up) at a time by stream
+derived = {  # packet fields built from other document fields, see projection
+    "id": [], "url": [], "posts": []
+}
 
 
 def create(info=None):
@@ -23,7 +36,8 @@ def create(info=None):
     Single argument function, this argument should be the thread being
     created.  The keys for the thread will be pulled out and stored in as
     thread with a pointer to the post information as the 'head' of the
-    thread, then the rest will be stored as a post beginning the thread.
+    thread, then the rest will be stored as a post beginning the thread.  The
+    returned thread is built from what was written, it is not read back.
     '''
     if not info:
         raise errors.MissingInfoError('No thread information provided')
@@ -36,83 +50,166 @@ def create(info=None):
     info['user'] = ObjectId(info['user'])  # Convert id into ObjectId
     if 'forum' in info:
         info['forum'] = ObjectId(info['forum'])
-    # Create placeholder for initial post in thread
+    info.update({
+        "post_count": 1,
+        "last_post_at": info['created'],
+        "last_post_user": info['user']
+    })
+    # Ids are generated up front so the thread and head post can point to
+    # each other when they are first written
+    thread = clean_dict(info, thread_keys)
     post = clean_dict(info, post_keys)
-    post_id = posts.insert({"temp": ""})  # placeholder
-    post["_id"] = post_id
-    info['head'] = post_id
-    # Create thread
-    thread_id = threads.insert(clean_dict(info, thread_keys))
-    # Create initial post properly
-    post["thread"] = thread_id
-    posts.save(post)
+    thread.update({"_id": new_id(), "head": new_id(), "version": 0})
+    post.update({"_id": thread['head'], "thread": thread['_id'], "version": 0})
+    posts.insert(post)
+    threads.insert(thread)
+    if 'forum' in info:
+        forums.update(
+            {"_id": info['forum']},
+            {"$inc": {"thread_count": 1, "post_count": 1}})
 
-    return get(thread_id=thread_id)
+    return __full(thread, [post])
 
 
-def edit_thread(id, user=None, info=None):
+def edit_thread(id, user=None, info=None, version=None):
     ''' edit_thread
     Modifies the thread entry in the database based on the thread id that
-    is passed in.  First checks that the user id provided is the same as
-    the user that created the thread, if it is not, raises an error,
-    otherwise the thread will be updated with the provided information.
+    is passed in.  The provided information is applied with a single atomic
+    update, and if a version is given, only if the thread is still at that
+    version (otherwise a ConflictError is raised).  Returns the updated
+    thread without its posts.
     '''
     if not info:
         raise errors.MissingInfoError('No thread information provided')
 
-    user = user if user else session['id']
-    info.update({
-        "editted": datetime.utcnow(),
-        "editted_by": ObjectId(user)
-    })
-    # Retrieve thread to be changed
-    thread = threads.find_one({"_id": ObjectId(id)})
-    if not thread:
-        raise errors.NoEntryError('No thread found for provided id')
-    # Update thread object with new information & save
-    thread.update(info)
-    id = threads.save(thread)
-
-    return get(thread_id=id)
+    return __full(__edit(threads, id, user, info, version), None)
 
 
-def get(thread_id=None, forum=None, limit=0, start=0):
+def get(thread_id=None, forum=None, limit=0, start=0, expand=False,
+        fields=None):
     ''' get
     Retrieval function for threads.  The purpose is to return all of the
     threads based on given conditions.  If the id argument is set, it will
     return more granular information on that single thread, if it is not,
-    a list of threads with a simple summary will be returned instead.
+    a list of threads with a simple summary will be returned instead.  If
+    expand is set, the public packets of the authors are embedded in place of
+    their urls.  If fields is set, the packets are limited to those fields
+    (with the posts limited by the nested 'posts.' fields) and only what is
+    needed for them is read from the database.
     '''
     if not thread_id:  # Thread list
-        thread_set = threads.find(
-            {"forum": ObjectId(forum)}, skip=start, limit=limit,
-            sort=[("created", DESCENDING)])
-        return [__short(thread) for thread in thread_set]
+        thread_set = list(threads.find(
+            {"forum": ObjectId(forum)}, projection(fields, derived),
+            skip=start, limit=limit, sort=[("created", DESCENDING)]))
+        authors = __authors(thread_set) if expand else None
+        return [__short(thread, authors, fields) for thread in thread_set]
     else:  # Single thread
         thread_id = ObjectId(thread_id)
-        thread = threads.find_one({"_id": thread_id})
+        thread = threads.find_one(
+            {"_id": thread_id}, projection(fields, derived))
         if not thread:
             raise errors.NoEntryError('No thread found for provided id')
+        post_set = None  # posts are only read if they were requested
+        if includes(fields, "posts"):
+            post_set = list(posts.find(
+                {"thread": thread_id},
+                projection(subfields(fields, "posts"), derived),
+                skip=start, limit=limit, sort=[("created", ASCENDING)]))
+        authors = __authors([thread] + (post_set or [])) if expand else None
+        return __full(thread, post_set, authors, fields)
+
+
+def stream(thread_id=None, limit=0, start=0, expand=False, fields=None):
+    ''' stream
+    Retrieves a single thread like get, but the posts of the thread are a
+    generator reading them from the database cursor as they are consumed (in
+    batches of STREAM_BATCH, along with the authors of each batch if expand is
+    set), so a large page of posts is never held in memory at once.
+    '''
+    thread = threads.find_one(
+        {"_id": ObjectId(thread_id)}, projection(fields, derived))
+    if not thread:
+        raise errors.NoEntryError('No thread found for provided id')
+    thread_id = thread['_id']
+    thread = __full(
+        thread, None, __authors([thread]) if expand else None, fields)
+    if includes(fields, "posts"):
+        post_fields = subfields(fields, "posts")
         post_set = posts.find(
-            {"thread": thread_id}, skip=start, limit=limit,
-            sort=[("created", ASCENDING)])
-        return __full(thread, post_set)
+            {"thread": thread_id}, projection(post_fields, derived),
+            skip=start, limit=limit, sort=[("created", ASCENDING)]
+        ).batch_size(STREAM_BATCH)
+        thread['posts'] = __stream(post_set, expand, post_fields)
+    return thread
+
 
+def get_page(forum=None, limit=0, cursor=None, start=0, sort="created",
+             expand=False, fields=None):
+    ''' get_page
+    Keyset paginated retrieval of the thread list for a forum, newest first
+    by the ordering named by sort (one of sorts).  If a cursor (from a previous
+    page) is provided, the page is found with a range query on the position
+    stored in it (and in the ordering stored in it), otherwise the page begins
+    at the offset of start.  Returns a tuple of the list of threads and a dict
+    with the 'prev' and 'next' cursors for the surrounding pages (None if
+    there is no page in that direction).  If expand is set, the public
+    packets of the authors are embedded in place of their urls.  If fields is
+    set, the threads are limited to those fields.
+    '''
+    query = {"forum": ObjectId(forum)}
+    direction, field = "next", sorts[sort]
+    if cursor:
+        direction, field, position, id = decode_cursor(
+            cursor, sorts.values())
+        op = "$lt" if direction == "next" else "$gt"
+        # the bound on the field starts the range of the index at the cursor,
+        # the $or only settles the rows that share its position
+        query[field] = {"$lte" if direction == "next" else "$gte": position}
+        query["$or"] = [
+            {field: {op: position}},
+            {field: position, "_id": {op: id}}]
+        start = 0
+
+    order = DESCENDING if direction == "next" else ASCENDING
+    projected = projection(fields, derived)
+    if projected is not None:
+        projected.append(field)  # the position of the cursors
+    thread_set = list(threads.find(
+        query, projected, skip=start, limit=limit,
+        sort=[(field, order), ("_id", order)]))
+    full = limit and len(thread_set) == limit
+    if direction == "prev":
+        thread_set.reverse()
+
+    cursors = {"prev": None, "next": None}
+    if thread_set:
+        if cursor or start:
+            cursors["prev"] = encode_cursor(thread_set[0], "prev", field) \
+                if direction == "next" or full else None
+        if direction == "prev" or full:
+            cursors["next"] = encode_cursor(thread_set[-1], "next", field)
 
-def get_post(id=None):
+    authors = __authors(thread_set) if expand else None
+    return [__short(thread, authors, fields) for thread in thread_set], \
+        cursors
+
+
+def get_post(id=None, expand=False, fields=None):
     ''' get_post
     Retrieval function to get a single post.  Just requires the identifier
     for the desired post and will return the entry in the database.  If
-    the identifier is not found or provided, an error will be raised.
+    the identifier is not found or provided, an error will be raised.  If
+    expand is set, the public packet of the author is embedded.  If fields is
+    set, the post is limited to those fields.
     '''
     if not id:
         raise errors.MissingInfoError("No id provided to retrieve post for")
     # Retrieve post
-    post = posts.find_one({"_id": ObjectId(id)})
+    post = posts.find_one({"_id": ObjectId(id)}, projection(fields, derived))
     if not post:
         raise errors.NoEntryError("No post found for provided id")
 
-    return __post(post)
+    return __post(post, __authors([post]) if expand else None, fields)
 
 
 def reply(id=None, post=None):
@@ -124,66 +221,178 @@ def reply(id=None, post=None):
     '''
     if not id or not post:
         raise errors.MissingInfoError('No id/post provided for the reply')
+    post.setdefault("created", datetime.utcnow())
     post.update({
         'user': ObjectId(post['user']),
         "thread": ObjectId(id)
     })
-    return get_post(posts.save(clean_dict(post, post_keys)))
+    thread = threads.find_and_modify(
+        {"_id": post['thread']},
+        {"$inc": {"post_count": 1}, "$set": {
+            "last_post_at": post['created'],
+            "last_post_user": post['user']}},
+        fields=["forum"])
+    if not thread:
+        raise errors.NoEntryError('No thread found for provided id')
+    forums.update({"_id": thread['forum']}, {"$inc": {"post_count": 1}})
+
+    post = clean_dict(post, post_keys)
+    post.update({"_id": new_id(), "version": 0})
+    posts.insert(post)
+    return __post(post)
 
 
-def edit_post(id, user=None, info=None):
+def edit_post(id, user=None, info=None, version=None):
     ''' edit_post
     Modifies the post entry in the databased based on the post id that is
-    passed in.  First checks that the passed in user id is the same as the
-    one attached to the post itself, otherwise raises an error.
+    passed in.  The provided information is applied with a single atomic
+    update, and if a version is given, only if the post is still at that
+    version (otherwise a ConflictError is raised).
     '''
     if not info:
         raise errors.MissingInfoError('No post information provided')
 
+    return __post(__edit(posts, id, user, info, version))
+
+
+def __edit(collection, id, user, info, version):
+    ''' (private) __edit
+    Applies the edit to the document with a find and modify, bumping the
+    version of the document, returns the modified document.  Documents from
+    before versions were stored count as version 0.
+    '''
     user = user if user else session['id']
     info.update({
         "editted": datetime.utcnow(),
         "editted_by": ObjectId(user)
     })
-    # Retrieve the post to be changed
-    post = posts.find_one({"_id": ObjectId(id)})
-    if not post:
-        raise errors.NoEntryError('No post found for provided id')
-    # Update post object with new information & save
-    post.update(info)
-    id = posts.save(post)
+    query = {"_id": ObjectId(id)}
+    if version is not None:
+        query["version"] = version if version else {"$in": [0, None]}
+
+    document = collection.find_and_modify(
+        query, {"$set": info, "$inc": {"version": 1}}, new=True)
+    if document:
+        return document
+    if version is not None and collection.find_one(query["_id"], fields=[]):
+        raise errors.ConflictError(
+            'Document has been modified since version {}', version)
+    raise errors.NoEntryError('No document found for provided id')
+
+
+def reconcile():
+    ''' reconcile
+    Rebuilds the post_count, last_post_at and last_post_user of every thread
+    and the thread_count and post_count of every forum from the posts
+    themselves.  Makes a single pass over the posts (in thread order) and one
+    over the threads, returns the number of threads and forums updated.
+    '''
+    activity = {}
+    for post in posts.find(
+            fields=["thread", "created", "user"],
+            sort=[("thread", ASCENDING), ("created", ASCENDING)]):
+        count = activity[post['thread']][0] if post['thread'] in activity \
+            else 0
+        activity[post['thread']] = (count + 1, post['created'], post['user'])
 
-    return get_post(id=id)
+    counts, updated = {}, 0
+    for thread in threads.find(fields=["forum"]):
+        count, last_at, last_user = activity.get(
+            thread['_id'], (0, None, None))
+        updated += 1
+        threads.update({"_id": thread['_id']}, {"$set": {
+            "post_count": count,
+            "last_post_at": last_at,
+            "last_post_user": last_user}})
+        forum = counts.setdefault(thread.get('forum'), [0, 0])
+        forum[0] += 1
+        forum[1] += count
 
+    for forum in forums.find(fields=["_id"]):
+        thread_count, post_count = counts.get(forum['_id'], (0, 0))
+        forums.update({"_id": forum['_id']}, {"$set": {
+            "thread_count": thread_count,
+            "post_count": post_count}})
 
-def __short(thread):
+    return updated, forums.count()
+
+
+def __short(thread, authors=None, fields=None):
     ''' (private) __short
     Summarizes a thread entry from the database
     '''
-    return {
-        "url": url_for("get_thread", thread_id=str(thread['_id'])),
-        "title": thread["title"],
-        "created": thread["created"],
-        "user": url_for("get_user", user_id=str(thread["user"]))
-    }
+    return sparse({
+        "url": Link("get_thread", thread_id=str(thread['_id'])),
+        "title": thread.get("title"),
+        "created": thread.get("created"),
+        "user": __user(thread["user"], authors) if "user" in thread else None,
+        "post_count": thread.get("post_count", 0),
+        "last_post_at": thread.get("last_post_at"),
+        "last_post_user": Link(
+            "get_user", user_id=str(thread["last_post_user"]))
+        if thread.get("last_post_user") else None
+    }, fields)
 
 
-def __full(thread, posts):
+def __full(thread, posts, authors=None, fields=None):
     ''' (private) _full
     Cleans up the full document from the database
     '''
     convert_id(thread)
-    thread['url'] = url_for("get_thread", thread_id=thread['id'])
-    thread['user'] = url_for("get_user", user_id=thread['user'])
-    thread['posts'] = [__post(post) for post in posts]
-    return thread
+    thread.setdefault('version', 0)
+    thread['url'] = Link("get_thread", thread_id=thread['id'])
+    if 'user' in thread:
+        thread['user'] = __user(thread['user'], authors)
+    if thread.get('last_post_user'):
+        thread['last_post_user'] = Link(
+            "get_user", user_id=thread['last_post_user'])
+    if posts is not None:
+        post_fields = subfields(fields, "posts")
+        thread['posts'] = [__post(post, authors, post_fields)
+                           for post in posts]
+    return sparse(thread, fields)
 
 
-def __post(post):
+def __post(post, authors=None, fields=None):
     ''' (private) __post
     Cleans up the full document from the database
     '''
     convert_id(post)
-    post['url'] = url_for("get_post", post_id=post['id'])
-    post['user'] = url_for("get_user", user_id=post['user'])
-    return post
+    post.setdefault('version', 0)
+    post['url'] = Link("get_post", post_id=post['id'])
+    if 'user' in post:
+        post['user'] = __user(post['user'], authors)
+    return sparse(post, fields)
+
+
+def __stream(post_set, expand=False, fields=None):
+    ''' (private) __stream
+    Generates the cleaned up posts of the cursor a batch at a time
+    '''
+    while True:
+        batch = list(islice(post_set, STREAM_BATCH))
+        if not batch:
+            return
+        authors = __authors(batch) if expand else None
+        for post in batch:
+            yield __post(post, authors, fields)
+
+
+def __authors(documents):
+    ''' (private) __authors
+    Looks up the public packets of the authors of all of the documents with
+    a single query, keyed by the (string) id of the user
+    '''
+    return get_users(set(document['user'] for document in documents
+                         if 'user' in document))
+
+
+def __user(user_id, authors=None):
+    ''' (private) __user
+    The user field of a packet, the embedded author packet if the authors
+    were looked up, otherwise the url of the user
+    '''
+    user_id = str(user_id)
+    if authors and user_id in authors:
+        return authors[user_id]
+    return Link("get_user", user_id=user_id)
@@ -4,12 +4,16 @@ includes things like creating a new user, logging in as a user, or getting
 the public information of a user.
 '''
 from . import database as mongo
-from . import convert_id, ObjectId
+from . import convert_id, ObjectId, projection, sparse
 from .. import errors
-from flask import url_for
+from ...links import Link
 from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 database = mongo.users
 user_keys = ["username", "password"]
+derived = {  # packet fields built from other document fields, see projection
+    "id": [], "url": []
+}
 
 
 def create(info):
@@ -17,12 +21,9 @@ def create(info):
     Single argument function, this argument should be a dictionary of all
     of the information for this user.  At this point, there should be
     minimal validation on this packet and it will really just be inserted
-    into the DB as is.
+    into the DB as is.  The unique index on username rejects the insert if
+    the username is already taken.
     '''
-    if database.find_one({"username": info["username"]}):
-        raise errors.ExistingUsernameError(
-            "Username: {} already exists", info["username"])
-
     if 'rights' not in info:
         info['rights'] = []
 
@@ -35,7 +36,11 @@ def create(info):
         'modified_by': None
     })
 
-    id = database.insert(info)
+    try:
+        id = database.insert(info, safe=True)
+    except DuplicateKeyError:
+        raise errors.ExistingUsernameError(
+            "Username: {} already exists", info["username"])
 
     return str(id), __private(info)
 
@@ -52,19 +57,38 @@ def login(username, password):
     return None, None
 
 
-def get(id=None, private=False):
+def get(id=None, private=False, fields=None):
     ''' get
     Returns the public form of the user with the provided ID, if no ID is
     provided, throws an error.  If no user is found with the ID, returns
-    None
+    None.  If fields is set, the packet is limited to those fields.
     '''
     if not id:
         raise errors.MissingInfoError('No ID for the user request')
 
-    user = database.find_one({"_id": ObjectId(id)})
+    user = database.find_one(
+        {"_id": ObjectId(id)}, projection(fields, derived))
     if not user:
         raise errors.NoEntryError("No user found with the provided id")
-    return __public(user) if not private else __private(user)
+    return sparse(__public(user) if not private else __private(user), fields)
+
+
+def get_many(ids):
+    ''' get_many
+    Returns the public forms of the users with the provided IDs, fetched with
+    a single query and keyed by the (string) ID.  IDs that don't match a user
+    (or aren't ObjectIds) are left out.
+    '''
+    keys = []
+    for id in ids:
+        try:
+            keys.append(ObjectId(id))
+        except errors.NoEntryError:
+            continue
+    ids = keys
+    users = database.find(
+        {"_id": {"$in": ids}}, fields=["username"]) if ids else []
+    return {str(user['_id']): __public(user) for user in users}
 
 
 def delete(id=None):
@@ -85,9 +109,9 @@ def __private(user):
     '''
     private_packet = user.copy()
     convert_id(private_packet)
-    del private_packet["password"]
+    private_packet.pop("password", None)
 
-    private_packet['url'] = url_for('get_user', user_id=private_packet['id'])
+    private_packet['url'] = Link('get_user', user_id=private_packet['id'])
 
     return private_packet
 
@@ -100,6 +124,6 @@ def __public(user):
     layer.
     '''
     return {
-        'username': user['username'],
-        'url': url_for('get_user', user_id=str(user['_id']))
+        'username': user.get('username'),
+        'url': Link('get_user', user_id=str(user['_id']))
     }
@@ -1,8 +1,13 @@
 import pymongo as mongo
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from bson.objectid import ObjectId as ObjectId_
 from bson.errors import InvalidId
 from .. import errors
+from ..fields import includes, subfields, sparse
 from sys import modules
+from datetime import datetime, timedelta
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 settings = modules['tamari.settings']
 
 # Default properties
@@ -15,6 +20,74 @@ connection_info.update(settings.DATABASE['info'])  # This overrides the
 connection = mongo.Connection(**connection_info)
 
 database = connection["tamari_dev" if settings.DEBUG else "tamari"]
+EPOCH = datetime(1970, 1, 1)
+# Indexes for each collection, (keys, options) for each index
+INDEXES = [
+    ("threads", [
+        ([("forum", ASCENDING), ("created", DESCENDING), ("_id", DESCENDING)],
+         {}),
+        ([("forum", ASCENDING), ("last_post_at", DESCENDING),
+          ("_id", DESCENDING)], {}),
+    ]),
+    ("posts", [
+        ([("thread", ASCENDING), ("created", ASCENDING)], {}),
+    ]),
+    ("users", [
+        ([("username", ASCENDING)], {"unique": True}),
+    ]),
+    ("forums", [
+        ([("parent", ASCENDING)], {}),
+    ]),
+    ("revoked_sessions", [
+        ([("revoked", ASCENDING)], {}),
+        ([("expires", ASCENDING)], {"expireAfterSeconds": 0}),
+    ]),
+]
+# Representative queries made by the app, (collection, spec, sort) for each,
+# their plans are shown on a dry run of migrate
+QUERIES = [
+    ("threads", {"forum": ObjectId_()},
+     [("created", DESCENDING), ("_id", DESCENDING)]),
+    ("threads", {"forum": ObjectId_()},
+     [("last_post_at", DESCENDING), ("_id", DESCENDING)]),
+    ("posts", {"thread": ObjectId_()}, [("created", ASCENDING)]),
+    ("users", {"username": ""}, None),
+    ("forums", {"parent": None}, None),
+]
+
+
+def migrate(dry_run=False):
+    ''' migrate
+    Creates any of the declared indexes that are missing from the database,
+    this is safe to run repeatedly.  Returns a list of lines reporting what
+    was (or on a dry run, would be) created, a dry run also explains the plan
+    used for each of the app's representative queries.
+    '''
+    report = []
+    for name, indexes in INDEXES:
+        collection = database[name]
+        existing = [index['key'] for index
+                    in collection.index_information().values()]
+        for keys, options in indexes:
+            if keys in existing:
+                continue
+            report.append("{} index {} on {}".format(
+                "missing" if dry_run else "creating", keys, name))
+            if dry_run:
+                continue
+            try:
+                collection.create_index(keys, background=True, **options)
+            except OperationFailure as err:
+                report.append("failed index {} on {}: {}".format(
+                    keys, name, err))
+
+    if dry_run:
+        for name, spec, sort in QUERIES:
+            cursor = database[name].find(spec)
+            plan = (cursor.sort(sort) if sort else cursor).explain()
+            report.append("query {} on {} uses {} (scanned {})".format(
+                spec.keys(), name, plan.get('cursor'), plan.get('nscanned')))
+    return report
 
 
 def cleanup():
@@ -23,6 +96,8 @@ def cleanup():
     '''
     if settings.DEBUG:
         connection.drop_database("tamari_dev")
+        if settings.DATABASE.get('indexes', True):
+            migrate()
 
 
 def clean_dict(src, keys):
@@ -51,6 +126,14 @@ def ObjectId(src):
             "the system.")
 
 
+def new_id():
+    ''' new_id
+    Generates a new ObjectId on the app side, so the id of a document is
+    known before it is written and doesn't need to be read back.
+    '''
+    return ObjectId_()
+
+
 def convert_id(packet):
     ''' convert_id
     Helper function that converts a packet's _id property used in Mongo into
@@ -62,3 +145,59 @@ def convert_id(packet):
     for (key, value) in packet.items():
         if isinstance(value, ObjectId_):
             packet[key] = str(value)
+
+
+def projection(fields, derived=None):
+    ''' projection
+    Helper function that returns the document fields (a Mongo projection)
+    needed to build the requested packet fields, None for the whole document
+    if no fields were requested.  derived maps the packet fields that are
+    built from other document fields (or from none, like 'url') to those, the
+    rest are taken as they are.  Nested fields (i.e. 'posts.content') are
+    projected by the top level field.
+    '''
+    if fields is None:
+        return None
+    derived = derived if derived else {}
+    projected = set()
+    for field in fields:
+        field = field.split('.')[0]
+        projected.update(derived.get(field, [field]))
+    return list(projected)
+
+
+def encode_cursor(document, direction, field="created"):
+    ''' encode_cursor
+    Helper function that packs the sort position of a document (the date in
+    the sorted field and its _id) along with the paging direction into an
+    opaque, URL safe string to hand out to clients for keyset pagination.
+    '''
+    delta = (document.get(field) or EPOCH) - EPOCH
+    millis = (delta.days * 86400 + delta.seconds) * 1000 + \
+        delta.microseconds // 1000
+    cursor = "{}:{}:{}:{}".format(direction, field, millis, document["_id"])
+    return urlsafe_b64encode(cursor).rstrip("=")
+
+
+def decode_cursor(cursor, fields=("created",)):
+    ''' decode_cursor
+    Helper function that reverses encode_cursor, returns a tuple of the
+    direction, sorted field, date and _id stored in the cursor.  Raises a
+    BadCursorError if the cursor was not generated by the system (or is for a
+    field not in the provided fields).
+    '''
+    try:
+        cursor = str(cursor)
+        cursor = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, field, millis, id = cursor.split(":")
+        if direction not in ("next", "prev") or field not in fields:
+            raise ValueError(direction)
+        return direction, field, EPOCH + timedelta(milliseconds=int(millis)), \
+            ObjectId_(id)
+    except (TypeError, ValueError, InvalidId, UnicodeError):
+        raise errors.BadCursorError(
+            "The cursor provided was not generated by the system.")
+
+
+if settings.DATABASE.get('indexes', True):
+    migrate()
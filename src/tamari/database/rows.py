@@ -0,0 +1,158 @@
+''' rows.py
+Helper functions shared by the database engines that keep the forum as rows
+keyed by integer ids (the sqlite and memory engines): the conversion of ids,
+the keyset cursors of the thread list and the formatting of the thread and
+post packets from their rows.
+'''
+from datetime import datetime, timedelta
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from . import errors
+from .fields import subfields, sparse
+from ..links import Link
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def key(src):
+    ''' key
+    Converts an id from the app into the key of a row, an id that isn't one
+    raises a NoEntryError (like an id that isn't an ObjectId in the mongo
+    engine).
+    '''
+    try:
+        return int(src)
+    except (TypeError, ValueError):
+        raise errors.NoEntryError(
+            "Information provided to find a document used an ID not from " +
+            "the system.")
+
+
+def keys(ids):
+    ''' keys
+    Converts the ids from the app into the keys of rows, leaving out the ids
+    that can't be one (no row has them)
+    '''
+    converted = []
+    for id in ids:
+        try:
+            converted.append(key(id))
+        except errors.NoEntryError:
+            continue
+    return converted
+
+
+def ident(value):
+    ''' ident
+    Converts the key of a row into the id used by the app (a string)
+    '''
+    return str(value) if value is not None else None
+
+
+def encode_cursor(document, direction, field="created"):
+    ''' encode_cursor
+    Helper function that packs the sort position of a row (the date in the
+    sorted field and its id) along with the paging direction into an opaque,
+    URL safe string to hand out to clients for keyset pagination.
+    '''
+    delta = (document.get(field) or EPOCH) - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + \
+        delta.microseconds
+    cursor = "{}:{}:{}:{}".format(direction, field, micros, document["id"])
+    return urlsafe_b64encode(cursor).rstrip("=")
+
+
+def decode_cursor(cursor, fields=("created",)):
+    ''' decode_cursor
+    Helper function that reverses encode_cursor, returns a tuple of the
+    direction, sorted field, date and id stored in the cursor.  Raises a
+    BadCursorError if the cursor was not generated by the system (or is for a
+    field not in the provided fields).
+    '''
+    try:
+        cursor = str(cursor)
+        cursor = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, field, micros, id = cursor.split(":")
+        if direction not in ("next", "prev") or field not in fields:
+            raise ValueError(direction)
+        return direction, field, EPOCH + timedelta(
+            microseconds=int(micros)), int(id)
+    except (TypeError, ValueError, UnicodeError):
+        raise errors.BadCursorError(
+            "The cursor provided was not generated by the system.")
+
+
+def thread_summary(thread, authors=None, fields=None):
+    ''' thread_summary
+    Summarizes a thread row for the thread list
+    '''
+    return sparse({
+        "url": Link("get_thread", thread_id=ident(thread['id'])),
+        "title": thread.get("title"),
+        "created": thread.get("created"),
+        "user": author(thread["user"], authors) if "user" in thread else None,
+        "post_count": thread.get("post_count", 0),
+        "last_post_at": thread.get("last_post_at"),
+        "last_post_user": Link(
+            "get_user", user_id=ident(thread["last_post_user"]))
+        if thread.get("last_post_user") else None
+    }, fields)
+
+
+def thread_packet(thread, posts, authors=None, fields=None):
+    ''' thread_packet
+    Cleans up the full row of a thread, along with its post rows (if they
+    were read)
+    '''
+    thread = ids(thread, ["id", "forum", "head", "editted_by"])
+    thread['url'] = Link("get_thread", thread_id=thread['id'])
+    if 'user' in thread:
+        thread['user'] = author(thread['user'], authors)
+    if thread.get('last_post_user'):
+        thread['last_post_user'] = Link(
+            "get_user", user_id=ident(thread['last_post_user']))
+    if posts is not None:
+        post_fields = subfields(fields, "posts")
+        thread['posts'] = [post_packet(post, authors, post_fields)
+                           for post in posts]
+    return sparse(thread, fields)
+
+
+def post_packet(post, authors=None, fields=None):
+    ''' post_packet
+    Cleans up the full row of a post
+    '''
+    post = ids(post, ["id", "thread", "editted_by"])
+    post['url'] = Link("get_post", post_id=post['id'])
+    if 'user' in post:
+        post['user'] = author(post['user'], authors)
+    return sparse(post, fields)
+
+
+def ids(row, names):
+    ''' ids
+    Copy of the row with the keys in the named columns converted into ids
+    '''
+    row = row.copy()
+    for name in names:
+        if row.get(name) is not None:
+            row[name] = ident(row[name])
+    return row
+
+
+def find_authors(rows, get_users):
+    ''' find_authors
+    Looks up the public packets of the authors of all of the rows with the
+    get_many of the engine's User module, keyed by the (string) id of the user
+    '''
+    return get_users(set(row['user'] for row in rows if 'user' in row))
+
+
+def author(user_id, authors=None):
+    ''' author
+    The user field of a packet, the embedded author packet if the authors
+    were looked up, otherwise the url of the user
+    '''
+    user_id = ident(user_id)
+    if authors and user_id in authors:
+        return authors[user_id]
+    return Link("get_user", user_id=user_id)
@@ -0,0 +1,108 @@
+''' Bulk
+Bulk writes of generated data (see synthetic.py), each batch is written with
+executemany in a single transaction.  The ids of the batch are reserved up
+front (past the highest id the table has handed out), so the rows can refer
+to each other without being read back.  The rows hold the ids (as strings) of
+the rows they refer to, the ids of the written rows are returned in order.
+'''
+from . import execute, query_one, transaction, key, ident
+from .. import errors
+from datetime import datetime
+from sqlite3 import IntegrityError
+
+
+def users(rows):
+    ''' users
+    Writes the users, none of them have any rights.  If any of the usernames
+    is taken (or repeated in the batch) an ExistingUsernameError is raised
+    and none are written.
+    '''
+    try:
+        with transaction() as db:
+            first = __reserve("users")
+            db.executemany(
+                "INSERT INTO users (id, username, password, created) " +
+                "VALUES (?, ?, ?, ?)",
+                [(first + number, row['username'], row['password'],
+                  row.get('created', datetime.utcnow()))
+                 for number, row in enumerate(rows)])
+    except IntegrityError:
+        raise errors.ExistingUsernameError(
+            "Username: {} already exists", __taken(rows))
+    return [ident(first + number) for number in xrange(len(rows))]
+
+
+def forums(rows):
+    ''' forums
+    Writes the forums, their parents must already be written
+    '''
+    with transaction() as db:
+        first = __reserve("forums")
+        db.executemany(
+            "INSERT INTO forums (id, name, parent) VALUES (?, ?, ?)",
+            [(first + number, row['name'],
+              key(row['parent']) if row['parent'] else None)
+             for number, row in enumerate(rows)])
+    return [ident(first + number) for number in xrange(len(rows))]
+
+
+def threads(rows):
+    ''' threads
+    Writes the threads along with their posts (the first is the head post),
+    and adds them to the counts of their forums
+    '''
+    with transaction() as db:
+        thread_id, post_id = __reserve("threads"), __reserve("posts")
+        threads, posts, counts = [], [], {}
+        for row in rows:
+            forum, last = key(row['forum']), row['posts'][-1]
+            threads.append((
+                thread_id, forum, row['title'], key(row['user']), post_id,
+                row['created'], len(row['posts']), last['created'],
+                key(last['user'])))
+            for post in row['posts']:
+                posts.append((post_id, thread_id, key(post['user']),
+                              post['content'], post['created']))
+                post_id += 1
+            thread_id += 1
+            count = counts.setdefault(forum, [0, 0])
+            count[0] += 1
+            count[1] += len(row['posts'])
+
+        db.executemany(
+            "INSERT INTO threads (id, forum, title, user, head, created, " +
+            "post_count, last_post_at, last_post_user) " +
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", threads)
+        db.executemany(
+            "INSERT INTO posts (id, thread, user, content, created) " +
+            "VALUES (?, ?, ?, ?, ?)", posts)
+        db.executemany(
+            "UPDATE forums SET thread_count = thread_count + ?, " +
+            "post_count = post_count + ? WHERE id = ?",
+            [(thread_count, post_count, forum_id) for forum_id,
+             (thread_count, post_count) in counts.iteritems()])
+    return [ident(thread[0]) for thread in threads]
+
+
+def __taken(rows):
+    ''' (private) __taken
+    The first username of the rows that is already written (or is repeated
+    in the rows)
+    '''
+    seen = set()
+    for row in rows:
+        if row['username'] in seen or query_one(
+                "SELECT id FROM users WHERE username = ?", (row['username'],)):
+            return row['username']
+        seen.add(row['username'])
+
+
+def __reserve(table):
+    ''' (private) __reserve
+    The first id of a batch written to the table, past every id the table
+    has handed out (the table's AUTOINCREMENT sequence is moved past the ids
+    written)
+    '''
+    sequence = query_one(
+        "SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    return (sequence['seq'] if sequence else 0) + 1
@@ -0,0 +1,153 @@
+''' Forum
+The wrapper class for operations on forums in the database backend, this
+includes things like creating a forum, getting the list of forums at
+different levels of the hierarchy
+'''
+from . import execute, query, query_one, key, ident, columns, includes, \
+    sparse
+from .. import errors
+from ...links import Link
+forum_columns = ["id", "name", "parent", "thread_count", "post_count"]
+paths = {}  # cache of forum id -> ids from the root down to the forum, the
+    # tree is only ever added to, so an entry never goes stale
+derived = {  # packet fields built from other columns, see columns
+    "url": [], "threads": [], "forums": [], "breadcrumbs": ["parent"]
+}
+
+
+def create(info):
+    ''' create
+    Single argument function, this argument should be a dictionary of all
+    of the information for creating this forum.  Should really just have
+    a name and a parent, if it's parent is root, don't add it.
+    '''
+    if not info:
+        raise errors.MissingInfoError('No forum information provided')
+
+    info.update({
+        'thread_count': 0,
+        'post_count': 0
+    })
+    if info['parent']:
+        parent = query_one(
+            "SELECT id FROM forums WHERE id = ?", (key(info['parent']),))
+        if not parent:
+            raise errors.NoEntryError('No forum found with provided parent id')
+        info['parent'] = parent['id']
+    else:
+        info['parent'] = None
+
+    info['id'] = execute(
+        "INSERT INTO forums (name, parent) VALUES (?, ?)",
+        (info['name'], info['parent'])).lastrowid
+    return __full(info)
+
+
+def get(forum_id, fields=None):
+    ''' get
+    Returns the forum information for the specified forum level, the level
+    should be the ID of the forum, if level is not specified, it will
+    return a list of the root subforums.  If fields is set, the packet is
+    limited to those fields.
+    '''
+    forum = query_one("SELECT {} FROM forums WHERE id = ?".format(
+        columns(fields, forum_columns, derived)), (key(forum_id),))
+    if not forum:
+        raise errors.NoEntryError('No forum found with provided id')
+    return __full(forum, fields)
+
+
+def children(parent=None, fields=None):
+    ''' children
+    Returns a list of the forums whose parent is the provided argument.  If
+    fields is set, the packets are limited to those fields.
+    '''
+    return [__simple(forum, fields) for forum in query(
+        "SELECT id, name FROM forums WHERE parent = ? ORDER BY id",
+        (key(parent),))]
+
+
+def get_root():
+    ''' get_root
+    If there is are no forums in the database, a basic root forum is created
+    and the id is returned, if there are forums in the database, the root forum
+    is retrieved and the id is returned.  Used in discovery of the root forum.
+    '''
+    root = query_one("SELECT id FROM forums WHERE parent IS NULL LIMIT 1")
+    if root:
+        return root['id']
+    return execute(
+        "INSERT INTO forums (name, parent) VALUES ('root', NULL)").lastrowid
+
+
+def __simple(forum, fields=None):
+    ''' (private) ::__simple
+    Simple format of the forum packet
+    '''
+    return sparse({
+        "url": Link('get_forum', forum_id=ident(forum['id'])),
+        "name": forum.get('name')
+    }, fields)
+
+
+def __full(packet, fields=None):
+    ''' (private) ::__full
+    Full format of the forum packet
+    '''
+    forum = packet.copy()
+    forum.setdefault('thread_count', 0)
+    forum.setdefault('post_count', 0)
+    if includes(fields, 'breadcrumbs'):
+        forum['breadcrumbs'] = [__simple(parent)
+                                for parent in ancestors(forum)]
+    forum['id'] = ident(forum['id'])
+    if 'parent' in forum:
+        forum['parent'] = ident(forum['parent'])
+    forum['url'] = Link('get_forum', forum_id=forum['id'])
+    forum['threads'] = Link('get_threads', forum_id=forum['id'])
+    forum['forums'] = Link('get_forums', forum_id=forum['id'])
+    return sparse(forum, fields)
+
+
+def ancestors(forum):
+    ''' ancestors
+    Returns the ancestors (id and name of each forum from the root down to the
+    parent) of the forum row, read in a single recursive query up the parents.
+    '''
+    if not forum.get('parent'):
+        return []
+    return query(
+        "WITH RECURSIVE chain (id, name, parent, depth) AS (" +
+        "SELECT id, name, parent, 0 FROM forums WHERE id = ? UNION ALL " +
+        "SELECT forums.id, forums.name, forums.parent, chain.depth + 1 " +
+        "FROM forums JOIN chain ON forums.id = chain.parent) " +
+        "SELECT id, name FROM chain ORDER BY depth DESC",
+        (key(forum['parent']),))
+
+
+def path(forum_id):
+    ''' path
+    Returns the ids (as strings) of the forum and all of its ancestors.  These
+    are cached per process after the first lookup of a forum.
+    '''
+    forum_id = str(forum_id)
+    if forum_id not in paths:
+        forum = query_one(
+            "SELECT parent FROM forums WHERE id = ?", (key(forum_id),))
+        if not forum:
+            raise errors.NoEntryError('No forum found with provided id')
+        paths[forum_id] = frozenset(
+            [ident(parent['id']) for parent in ancestors(forum)] +
+            [forum_id])
+    return paths[forum_id]
+
+
+def find_parent(forum, id_list):
+    ''' find_parent
+    Helper function, finds if the forum or the forum's parent(s) are in the
+    provided id_list, used for checking permissions
+    '''
+    if 0 in id_list:  # CHANGEME: checks if id_list is root
+        return True
+
+    return not path(forum).isdisjoint(id_list)
@@ -0,0 +1,56 @@
+''' Session
+Storage of the server side sessions and of the revoked tokens, the session
+packets are stored as JSON.
+'''
+from . import execute, query, query_one
+from datetime import datetime
+import json
+import time
+
+
+def get(id):
+    try:
+        id = int(id)
+    except (TypeError, ValueError):
+        return None
+    entry = query_one("SELECT id, packet FROM sessions WHERE id = ?", (id,))
+    if not entry:
+        return None
+    packet = json.loads(entry['packet'])
+    packet['_id'] = entry['id']
+    return packet
+
+
+def save(packet):
+    data = json.dumps({key: value for key, value in packet.items()
+                       if key != '_id'}, default=str)
+    if packet.get('_id') is not None:
+        execute("INSERT OR REPLACE INTO sessions (id, packet) VALUES (?, ?)",
+                (packet['_id'], data))
+    else:
+        packet['_id'] = execute(
+            "INSERT INTO sessions (packet) VALUES (?)", (data,)).lastrowid
+    return packet['_id']
+
+
+def remove(id):
+    execute("DELETE FROM sessions WHERE id = ?", (id,))
+
+
+def revoke(token, expires):
+    # tokens past their expiry can't be used anyway, so their entries go
+    execute("DELETE FROM revoked_sessions WHERE expires <= ?",
+            (int(time.time()),))
+    execute("INSERT OR REPLACE INTO revoked_sessions (token, expires, " +
+            "revoked) VALUES (?, ?, ?)", (token, expires, datetime.utcnow()))
+
+
+def revoked(since=None):
+    now = int(time.time())
+    if since:
+        entries = query("SELECT token, expires FROM revoked_sessions " +
+                        "WHERE expires > ? AND revoked >= ?", (now, since))
+    else:
+        entries = query("SELECT token, expires FROM revoked_sessions " +
+                        "WHERE expires > ?", (now,))
+    return [(entry["token"], entry["expires"]) for entry in entries]
@@ -0,0 +1,368 @@
+''' Thread
+The wrapper class for operations on threads in the database backend, there
+are two tables, one is a table of threads, this will hold the title (which
+is not going to be part of each post) and the head post, then there is a
+much larger table of posts which all belong to a thread
+'''
+from . import execute, query, query_one, transaction, key, columns, limits, \
+    encode_cursor, decode_cursor, includes, subfields
+from .User import get_many as get_users
+from ..rows import thread_summary, thread_packet, post_packet, find_authors
+from .. import errors
+from datetime import datetime
+from sqlite3 import IntegrityError
+from flask import session
+
+thread_columns = ["id", "forum", "title", "user", "head", "created",
+                  "editted", "editted_by", "post_count", "last_post_at",
+                  "last_post_user", "version"]
+# columns read by thread_summary, all held by the thread list indexes so the
+# list is read from them alone
+summary_columns = ["id", "title", "created", "user", "post_count",
+                   "last_post_at", "last_post_user"]
+post_columns = ["id", "thread", "user", "content", "created", "editted",
+                "editted_by", "version"]
+editable = {  # columns an edit can set, for each table
+    "threads": ["title", "editted", "editted_by"],
+    "posts": ["content", "editted", "editted_by"]
+}
+sorts = {  # orderings of the thread list, name -> field sorted on
+    "created": "created",
+    "activity": "last_post_at"
+}
+STREAM_BATCH = 100  # posts read (and authors looked up) at a time by stream
+derived = {  # packet fields built from other columns, see columns
+    "url": [], "posts": []
+}
+
+
+def create(info=None):
+    ''' create
+    Single argument function, this argument should be the thread being
+    created.  The thread is stored with a pointer to the post information as
+    the 'head' of the thread, then the rest will be stored as a post beginning
+    the thread, both in a single transaction.  The returned thread is built
+    from what was written, it is not read back.
+    '''
+    if not info:
+        raise errors.MissingInfoError('No thread information provided')
+
+    created = datetime.utcnow()
+    thread = {
+        "forum": key(info['forum']) if 'forum' in info else None,
+        "title": info.get('title'),
+        "user": key(info['user']),
+        "created": created,
+        "editted": None,
+        "editted_by": None,
+        "post_count": 1,
+        "last_post_at": created,
+        "last_post_user": key(info['user']),
+        "version": 0
+    }
+    post = {
+        "user": thread['user'],
+        "content": info.get('content'),
+        "created": created,
+        "editted": None,
+        "editted_by": None,
+        "version": 0
+    }
+    try:
+        with transaction():
+            thread['id'] = execute(
+                "INSERT INTO threads (forum, title, user, created, " +
+                "post_count, last_post_at, last_post_user) " +
+                "VALUES (?, ?, ?, ?, 1, ?, ?)",
+                (thread['forum'], thread['title'], thread['user'], created,
+                 created, thread['user'])).lastrowid
+            post['thread'] = thread['id']
+            post['id'] = thread['head'] = execute(
+                "INSERT INTO posts (thread, user, content, created) " +
+                "VALUES (?, ?, ?, ?)",
+                (thread['id'], post['user'], post['content'],
+                 created)).lastrowid
+            execute("UPDATE threads SET head = ? WHERE id = ?",
+                    (thread['head'], thread['id']))
+            if thread['forum'] is not None:
+                execute(
+                    "UPDATE forums SET thread_count = thread_count + 1, " +
+                    "post_count = post_count + 1 WHERE id = ?",
+                    (thread['forum'],))
+    except IntegrityError:
+        raise errors.NoEntryError('No forum found with provided id')
+
+    return thread_packet(thread, [post])
+
+
+def edit_thread(id, user=None, info=None, version=None):
+    ''' edit_thread
+    Modifies the thread entry in the database based on the thread id that
+    is passed in.  The provided information is applied with a single update,
+    and if a version is given, only if the thread is still at that version
+    (otherwise a ConflictError is raised).  Returns the updated thread
+    without its posts.
+    '''
+    if not info:
+        raise errors.MissingInfoError('No thread information provided')
+
+    return thread_packet(__edit("threads", id, user, info, version), None)
+
+
+def get(thread_id=None, forum=None, limit=0, start=0, expand=False,
+        fields=None):
+    ''' get
+    Retrieval function for threads.  The purpose is to return all of the
+    threads based on given conditions.  If the id argument is set, it will
+    return more granular information on that single thread, if it is not,
+    a list of threads with a simple summary will be returned instead.  If
+    expand is set, the public packets of the authors are embedded in place of
+    their urls.  If fields is set, the packets are limited to those fields
+    (with the posts limited by the nested 'posts.' fields) and only the
+    columns needed for them are read.
+    '''
+    if not thread_id:  # Thread list
+        thread_set = query(
+            "SELECT {} FROM threads WHERE forum = ? ".format(
+                columns(fields, thread_columns, derived, summary_columns)) +
+            "ORDER BY created DESC, id DESC LIMIT ? OFFSET ?",
+            (key(forum),) + limits(limit, start))
+        authors = find_authors(thread_set, get_users) if expand else None
+        return [thread_summary(thread, authors, fields)
+                for thread in thread_set]
+    else:  # Single thread
+        thread = query_one("SELECT {} FROM threads WHERE id = ?".format(
+            columns(fields, thread_columns, derived)), (key(thread_id),))
+        if not thread:
+            raise errors.NoEntryError('No thread found for provided id')
+        post_set = None  # posts are only read if they were requested
+        if includes(fields, "posts"):
+            post_set = __posts(
+                thread['id'], limit, start, subfields(fields, "posts")
+            ).fetchall()
+        authors = find_authors([thread] + (post_set or []), get_users) \
+            if expand else None
+        return thread_packet(thread, post_set, authors, fields)
+
+
+def stream(thread_id=None, limit=0, start=0, expand=False, fields=None):
+    ''' stream
+    Retrieves a single thread like get, but the posts of the thread are a
+    generator reading them from the database cursor as they are consumed (in
+    batches of STREAM_BATCH, along with the authors of each batch if expand is
+    set), so a large page of posts is never held in memory at once.
+    '''
+    thread = query_one("SELECT {} FROM threads WHERE id = ?".format(
+        columns(fields, thread_columns, derived)), (key(thread_id),))
+    if not thread:
+        raise errors.NoEntryError('No thread found for provided id')
+    thread_id = thread['id']
+    thread = thread_packet(
+        thread, None,
+        find_authors([thread], get_users) if expand else None, fields)
+    if includes(fields, "posts"):
+        post_fields = subfields(fields, "posts")
+        thread['posts'] = __stream(
+            __posts(thread_id, limit, start, post_fields), expand,
+            post_fields)
+    return thread
+
+
+def get_page(forum=None, limit=0, cursor=None, start=0, sort="created",
+             expand=False, fields=None):
+    ''' get_page
+    Keyset paginated retrieval of the thread list for a forum, newest first
+    by the ordering named by sort (one of sorts).  If a cursor (from a previous
+    page) is provided, the page is found with a range query on the position
+    stored in it (and in the ordering stored in it), otherwise the page begins
+    at the offset of start.  Returns a tuple of the list of threads and a dict
+    with the 'prev' and 'next' cursors for the surrounding pages (None if
+    there is no page in that direction).  If expand is set, the public
+    packets of the authors are embedded in place of their urls.  If fields is
+    set, the threads are limited to those fields.
+    '''
+    condition, parameters = "forum = ?", (key(forum),)
+    direction, field = "next", sorts[sort]
+    if cursor:
+        direction, field, position, id = decode_cursor(
+            cursor, sorts.values())
+        # a row value comparison, so the range of the index begins at the
+        # cursor (an OR of the two columns is only a bound on the forum)
+        condition += " AND ({}, id) {} (?, ?)".format(
+            field, "<" if direction == "next" else ">")
+        parameters += (position, id)
+        start = 0
+
+    order = "DESC" if direction == "next" else "ASC"
+    selected = columns(fields, thread_columns, derived, summary_columns)
+    if fields is not None and field not in selected.split(", "):
+        selected += ", " + field  # the position of the cursors
+    thread_set = query(
+        "SELECT {0} FROM threads WHERE {1} ORDER BY {2} {3}, id {3} "
+        "LIMIT ? OFFSET ?".format(selected, condition, field, order),
+        parameters + limits(limit, start))
+    full = limit and len(thread_set) == limit
+    if direction == "prev":
+        thread_set.reverse()
+
+    cursors = {"prev": None, "next": None}
+    if thread_set:
+        if cursor or start:
+            cursors["prev"] = encode_cursor(thread_set[0], "prev", field) \
+                if direction == "next" or full else None
+        if direction == "prev" or full:
+            cursors["next"] = encode_cursor(thread_set[-1], "next", field)
+
+    authors = find_authors(thread_set, get_users) if expand else None
+    return [thread_summary(thread, authors, fields)
+            for thread in thread_set], cursors
+
+
+def get_post(id=None, expand=False, fields=None):
+    ''' get_post
+    Retrieval function to get a single post.  Just requires the identifier
+    for the desired post and will return the entry in the database.  If
+    the identifier is not found or provided, an error will be raised.  If
+    expand is set, the public packet of the author is embedded.  If fields is
+    set, the post is limited to those fields.
+    '''
+    if not id:
+        raise errors.MissingInfoError("No id provided to retrieve post for")
+    # Retrieve post
+    post = query_one("SELECT {} FROM posts WHERE id = ?".format(
+        columns(fields, post_columns, derived)), (key(id),))
+    if not post:
+        raise errors.NoEntryError("No post found for provided id")
+
+    return post_packet(
+        post, find_authors([post], get_users) if expand else None, fields)
+
+
+def reply(id=None, post=None):
+    ''' reply
+    Creates a post in reply to a thread, this does not create a new thread
+    but instead adds onto an existing thread, there are two arguments, the
+    id of the thread being replied to and the actual post that is a reply
+    to the thread
+    '''
+    if not id or not post:
+        raise errors.MissingInfoError('No id/post provided for the reply')
+    post = {
+        "thread": key(id),
+        "user": key(post['user']),
+        "content": post.get('content'),
+        "created": post.get('created', datetime.utcnow()),
+        "editted": None,
+        "editted_by": None,
+        "version": 0
+    }
+    with transaction():
+        if not execute(
+                "UPDATE threads SET post_count = post_count + 1, " +
+                "last_post_at = ?, last_post_user = ? WHERE id = ?",
+                (post['created'], post['user'], post['thread'])).rowcount:
+            raise errors.NoEntryError('No thread found for provided id')
+        execute("UPDATE forums SET post_count = post_count + 1 " +
+                "WHERE id = (SELECT forum FROM threads WHERE id = ?)",
+                (post['thread'],))
+        post['id'] = execute(
+            "INSERT INTO posts (thread, user, content, created) " +
+            "VALUES (?, ?, ?, ?)",
+            (post['thread'], post['user'], post['content'],
+             post['created'])).lastrowid
+    return post_packet(post)
+
+
+def edit_post(id, user=None, info=None, version=None):
+    ''' edit_post
+    Modifies the post entry in the databased based on the post id that is
+    passed in.  The provided information is applied with a single update,
+    and if a version is given, only if the post is still at that version
+    (otherwise a ConflictError is raised).
+    '''
+    if not info:
+        raise errors.MissingInfoError('No post information provided')
+
+    return post_packet(__edit("posts", id, user, info, version))
+
+
+def __edit(table, id, user, info, version):
+    ''' (private) __edit
+    Applies the edit to the row of the table, bumping the version of the
+    row, returns the modified row.  Only the editable columns of the table
+    are set.
+    '''
+    user = user if user else session['id']
+    info.update({
+        "editted": datetime.utcnow(),
+        "editted_by": key(user)
+    })
+    id = key(id)
+    names = [name for name in editable[table] if name in info]
+    statement = "UPDATE {} SET {}, version = version + 1 WHERE id = ?".format(
+        table, ", ".join(name + " = ?" for name in names))
+    parameters = [info[name] for name in names] + [id]
+    if version is not None:
+        statement += " AND version = ?"
+        parameters.append(version)
+
+    with transaction():
+        if execute(statement, parameters).rowcount:
+            return query_one(
+                "SELECT * FROM {} WHERE id = ?".format(table), (id,))
+        exists = query_one(
+            "SELECT id FROM {} WHERE id = ?".format(table), (id,))
+    if version is not None and exists:
+        raise errors.ConflictError(
+            'Document has been modified since version {}', version)
+    raise errors.NoEntryError('No document found for provided id')
+
+
+def reconcile():
+    ''' reconcile
+    Rebuilds the post_count, last_post_at and last_post_user of every thread
+    and the thread_count and post_count of every forum from the posts
+    themselves, with a single update of each table.  Returns the number of
+    threads and forums updated.
+    '''
+    with transaction():
+        updated = execute(
+            "UPDATE threads SET " +
+            "post_count = (SELECT COUNT(*) FROM posts " +
+            "WHERE thread = threads.id), " +
+            "last_post_at = (SELECT MAX(created) FROM posts " +
+            "WHERE thread = threads.id), " +
+            "last_post_user = (SELECT user FROM posts " +
+            "WHERE thread = threads.id ORDER BY created DESC, id DESC " +
+            "LIMIT 1)").rowcount
+        forums = execute(
+            "UPDATE forums SET " +
+            "thread_count = (SELECT COUNT(*) FROM threads " +
+            "WHERE forum = forums.id), " +
+            "post_count = (SELECT COALESCE(SUM(post_count), 0) " +
+            "FROM threads WHERE forum = forums.id)").rowcount
+    return updated, forums
+
+
+def __posts(thread_id, limit=0, start=0, fields=None):
+    ''' (private) __posts
+    Cursor over the posts of the thread, in the order they were posted
+    '''
+    return execute(
+        "SELECT {} FROM posts WHERE thread = ? ".format(
+            columns(fields, post_columns, derived)) +
+        "ORDER BY created, id LIMIT ? OFFSET ?",
+        (thread_id,) + limits(limit, start))
+
+
+def __stream(post_set, expand=False, fields=None):
+    ''' (private) __stream
+    Generates the cleaned up posts of the cursor a batch at a time
+    '''
+    while True:
+        batch = post_set.fetchmany(STREAM_BATCH)
+        if not batch:
+            return
+        authors = find_authors(batch, get_users) if expand else None
+        for post in batch:
+            yield post_packet(post, authors, fields)
@@ -0,0 +1,154 @@
+''' User
+The wrapper class for operations on users in the database backend, this
+includes things like creating a new user, logging in as a user, or getting
+the public information of a user.  The rights of the users are rows of their
+own table.
+'''
+from . import execute, query, query_one, transaction, key, ident, columns, \
+    sparse, includes
+from ..rows import keys
+from .. import errors
+from ...links import Link
+from datetime import datetime
+from sqlite3 import IntegrityError
+user_keys = ["username", "password"]
+user_columns = ["id", "username", "password", "created", "modified",
+                "modified_by"]
+derived = {  # packet fields built from other columns, see columns
+    "url": [], "rights": []
+}
+
+
+def create(info):
+    ''' create
+    Single argument function, this argument should be a dictionary of all
+    of the information for this user.  At this point, there should be
+    minimal validation on this packet and it will really just be inserted
+    into the DB as is.  The unique index on username rejects the insert if
+    the username is already taken.
+    '''
+    if 'rights' not in info:
+        info['rights'] = []
+
+    if query_one("SELECT id FROM users LIMIT 1") is None:
+        info['rights'].append(0)
+
+    info.update({
+        'created': datetime.utcnow(),
+        'modified': None,
+        'modified_by': None
+    })
+
+    try:
+        with transaction():
+            id = execute(
+                "INSERT INTO users (username, password, created, modified, " +
+                "modified_by) VALUES (?, ?, ?, ?, ?)",
+                (info['username'], info['password'], info['created'],
+                 None, None)).lastrowid
+            for right in info['rights']:
+                execute("INSERT INTO rights (user, forum) VALUES (?, ?)",
+                        (id, right))
+    except IntegrityError:
+        raise errors.ExistingUsernameError(
+            "Username: {} already exists", info["username"])
+
+    info['id'] = id
+    return str(id), __private(info)
+
+
+def login(username, password):
+    ''' login
+    Performs a login check with the provided credentials, the password is
+    just looking for a match, the hashing occurs above the layer.  Returns
+    None if no matching user was found.
+    '''
+    user = query_one(
+        "SELECT * FROM users WHERE username = ? AND password = ?",
+        (username, password))
+    if user:
+        user['rights'] = __rights(user['id'])
+        return user['id'], __private(user)
+    return None, None
+
+
+def get(id=None, private=False, fields=None):
+    ''' get
+    Returns the public form of the user with the provided ID, if no ID is
+    provided, throws an error.  If no user is found with the ID, returns
+    None.  If fields is set, the packet is limited to those fields.
+    '''
+    if not id:
+        raise errors.MissingInfoError('No ID for the user request')
+
+    user = query_one(
+        "SELECT {} FROM users WHERE id = ?".format(
+            columns(fields, user_columns, derived)), (key(id),))
+    if not user:
+        raise errors.NoEntryError("No user found with the provided id")
+    if not private:
+        return sparse(__public(user), fields)
+    if includes(fields, 'rights'):
+        user['rights'] = __rights(user['id'])
+    return sparse(__private(user), fields)
+
+
+def get_many(ids):
+    ''' get_many
+    Returns the public forms of the users with the provided IDs, fetched with
+    a single query and keyed by the (string) ID.  IDs that don't match a user
+    (or aren't IDs) are left out.
+    '''
+    ids = keys(ids)
+    users = query(
+        "SELECT id, username FROM users WHERE id IN ({})".format(
+            ", ".join("?" * len(ids))), ids) if ids else []
+    return {str(user['id']): __public(user) for user in users}
+
+
+def delete(id=None):
+    ''' delete
+    Removes the specified user from the database.  If no ID is provided or the
+    ID does not point to an existing user, an error is raised.
+    '''
+    if not id:
+        raise errors.MissingInfoError('No ID for the user deletion')
+    execute("DELETE FROM users WHERE id = ?", (key(id),))
+
+
+def __rights(id):
+    ''' (private) __rights
+    The rights of the user, the forums they are an admin of (0 for root)
+    '''
+    return [right['forum'] for right in query(
+        "SELECT forum FROM rights WHERE user = ?", (id,))]
+
+
+def __private(user):
+    ''' (private) __private
+    method for formatting the information when used *by* the user (this
+    is all of the private information for the user).  This method is used
+    to standardize the output format from the DB wrapper to the API layer.
+    '''
+    private_packet = user.copy()
+    private_packet.pop("password", None)
+    private_packet['id'] = ident(private_packet['id'])
+    if private_packet.get('modified_by') is not None:
+        private_packet['modified_by'] = ident(private_packet['modified_by'])
+
+    private_packet['url'] = Link('get_user', user_id=private_packet['id'])
+
+    return private_packet
+
+
+def __public(user):
+    ''' (private) __public
+    method for formatting the information when used by another user (this
+    is for all of the public information for the user).  This method is
+    used to standardize the output format from the DB wrapper to the API
+    layer.
+    '''
+    return {
+        'username': user.get('username'),
+        'url': Link('get_user', user_id=ident(user['id']))
+    }
@@ -0,0 +1,252 @@
+''' sqlite
+Storage engine keeping the forum in an embedded SQLite database, for single
+node installs that would rather not run a Mongo server.  The documents of the
+mongo engine are rows of a normalized schema (see SCHEMA), with the lists
+(i.e. the thread list of a forum) read through covering indexes.  Each thread
+of the app opens its own connection, in WAL mode so reads are not blocked by a
+write, and the statements are constant strings with parameters, so each is
+prepared once per connection and then reused from its statement cache.
+'''
+import sqlite3
+from sys import modules
+from threading import local
+from contextlib import contextmanager
+from ..fields import includes, subfields, sparse
+from ..rows import EPOCH, key, ident, encode_cursor, decode_cursor
+settings = modules['tamari.settings']
+
+path = settings.DATABASE['info'].get(
+    'path', "tamari_dev.db" if settings.DEBUG else "tamari.db")
+STATEMENT_CACHE = 256  # prepared statements kept by each connection
+connections = local()  # the connection of each thread
+
+# Tables, (name, statement) for each, the ids are never reused (like ObjectIds)
+# so they are safe to cache and hand out.  Usernames are unique by the table
+# itself rather than by an index, which could be left out (see migrate)
+SCHEMA = [
+    ("users", """CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        created TIMESTAMP,
+        modified TIMESTAMP,
+        modified_by INTEGER)"""),
+    ("rights", """CREATE TABLE IF NOT EXISTS rights (
+        user INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        forum NOT NULL,
+        PRIMARY KEY (user, forum)) WITHOUT ROWID"""),
+    ("forums", """CREATE TABLE IF NOT EXISTS forums (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        parent INTEGER REFERENCES forums (id),
+        thread_count INTEGER NOT NULL DEFAULT 0,
+        post_count INTEGER NOT NULL DEFAULT 0)"""),
+    ("threads", """CREATE TABLE IF NOT EXISTS threads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        forum INTEGER REFERENCES forums (id),
+        title TEXT NOT NULL,
+        user INTEGER NOT NULL,
+        head INTEGER,
+        created TIMESTAMP NOT NULL,
+        editted TIMESTAMP,
+        editted_by INTEGER,
+        post_count INTEGER NOT NULL DEFAULT 0,
+        last_post_at TIMESTAMP,
+        last_post_user INTEGER,
+        version INTEGER NOT NULL DEFAULT 0)"""),
+    ("posts", """CREATE TABLE IF NOT EXISTS posts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        thread INTEGER NOT NULL REFERENCES threads (id),
+        user INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        created TIMESTAMP NOT NULL,
+        editted TIMESTAMP,
+        editted_by INTEGER,
+        version INTEGER NOT NULL DEFAULT 0)"""),
+    ("sessions", """CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        packet TEXT NOT NULL)"""),
+    ("revoked_sessions", """CREATE TABLE IF NOT EXISTS revoked_sessions (
+        token TEXT PRIMARY KEY,
+        expires INTEGER NOT NULL,
+        revoked TIMESTAMP NOT NULL)"""),
+]
+# Indexes, (name, statement) for each, the thread list indexes hold every
+# column of a thread summary so the list is read from the index alone
+INDEXES = [
+    ("forums_parent", """CREATE INDEX IF NOT EXISTS forums_parent
+        ON forums (parent, id, name)"""),
+    ("threads_created", """CREATE INDEX IF NOT EXISTS threads_created
+        ON threads (forum, created DESC, id DESC, title, user, post_count,
+                    last_post_at, last_post_user)"""),
+    ("threads_activity", """CREATE INDEX IF NOT EXISTS threads_activity
+        ON threads (forum, last_post_at DESC, id DESC, title, user,
+                    post_count, created, last_post_user)"""),
+    ("posts_thread", """CREATE INDEX IF NOT EXISTS posts_thread
+        ON posts (thread, created, id)"""),
+    ("revoked_sessions_revoked", """CREATE INDEX IF NOT EXISTS
+        revoked_sessions_revoked ON revoked_sessions (revoked)"""),
+    ("revoked_sessions_expires", """CREATE INDEX IF NOT EXISTS
+        revoked_sessions_expires ON revoked_sessions (expires)"""),
+]
+# Representative queries made by the app, (statement, parameters) for each,
+# their plans are shown on a dry run of migrate
+QUERIES = [
+    ("""SELECT id, title, created, user, post_count, last_post_at,
+        last_post_user FROM threads WHERE forum = ?
+        ORDER BY created DESC, id DESC LIMIT ?""", (1, 25)),
+    ("""SELECT id, title, created, user, post_count, last_post_at,
+        last_post_user FROM threads WHERE forum = ? AND (created, id) < (?, ?)
+        ORDER BY created DESC, id DESC LIMIT ?""", (1, EPOCH, 1, 25)),
+    ("""SELECT id, title, created, user, post_count, last_post_at,
+        last_post_user FROM threads WHERE forum = ?
+        ORDER BY last_post_at DESC, id DESC LIMIT ?""", (1, 25)),
+    ("""SELECT id, title, created, user, post_count, last_post_at,
+        last_post_user FROM threads WHERE forum = ? AND (last_post_at, id) >
+        (?, ?) ORDER BY last_post_at ASC, id ASC LIMIT ?""",
+     (1, EPOCH, 1, 25)),
+    ("""SELECT * FROM posts WHERE thread = ? ORDER BY created, id
+        LIMIT ? OFFSET ?""", (1, 25, 0)),
+    ("SELECT id FROM users WHERE username = ? AND password = ?", ("", "")),
+    ("SELECT id, name FROM forums WHERE parent = ? ORDER BY id", (1,)),
+]
+
+
+def row(cursor, values):
+    ''' row
+    Row factory of the connections, rows are read as dicts
+    '''
+    return {column[0]: value
+            for column, value in zip(cursor.description, values)}
+
+
+def connection():
+    ''' connection
+    Returns the connection of the calling thread, opening it on the first
+    use by the thread.  Connections are in autocommit mode, statements that
+    need to be applied together are run in a transaction.
+    '''
+    db = getattr(connections, 'db', None)
+    if db is None:
+        db = sqlite3.connect(
+            path, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+            cached_statements=STATEMENT_CACHE)
+        db.row_factory = row
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.execute("PRAGMA foreign_keys = ON")
+        connections.db = db
+    return db
+
+
+def execute(statement, parameters=()):
+    ''' execute
+    Runs the statement on the thread's connection, returns the cursor
+    '''
+    return connection().execute(statement, parameters)
+
+
+def query(statement, parameters=()):
+    ''' query
+    Returns all of the rows (as dicts) selected by the statement
+    '''
+    return execute(statement, parameters).fetchall()
+
+
+def query_one(statement, parameters=()):
+    ''' query_one
+    Returns the first row (as a dict) selected by the statement, None if
+    there is none
+    '''
+    return execute(statement, parameters).fetchone()
+
+
+@contextmanager
+def transaction():
+    ''' transaction
+    Runs the statements of the block in a single (immediate) transaction,
+    rolled back if the block raises
+    '''
+    db = connection()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+def migrate(dry_run=False):
+    ''' migrate
+    Creates any of the declared tables and indexes that are missing from the
+    database, this is safe to run repeatedly.  Returns a list of lines
+    reporting what was (or on a dry run, would be) created, a dry run also
+    explains the plan used for each of the app's representative queries.
+    '''
+    report = []
+    existing = set(entry['name'] for entry in query(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'index')"))
+    for name, statement in SCHEMA + INDEXES:
+        if name in existing:
+            continue
+        report.append("{} {}".format(
+            "missing" if dry_run else "creating", name))
+        if not dry_run:
+            execute(statement)
+
+    if dry_run:
+        for statement, parameters in QUERIES:
+            try:
+                plan = query("EXPLAIN QUERY PLAN " + statement, parameters)
+            except sqlite3.OperationalError as err:
+                report.append("no plan for {}: {}".format(
+                    " ".join(statement.split()), err))
+                continue
+            report.append("plan for {}: {}".format(
+                " ".join(statement.split()),
+                "; ".join(step['detail'] for step in plan)))
+    return report
+
+
+def cleanup():
+    ''' cleanup
+    Used by the unittest system to cleanup the database between tests
+    '''
+    if settings.DEBUG:
+        with transaction():
+            for name, _ in reversed(SCHEMA):
+                execute("DELETE FROM " + name)
+
+
+def columns(fields, table, derived=None, default=None):
+    ''' columns
+    Helper function that returns the columns to select (as SQL) to build the
+    requested packet fields, the default columns (all of the table's columns
+    if not given) if no fields were requested.  derived maps the packet
+    fields that are built from other columns to those, the rest are taken as
+    they are if the table has them.  The id is always selected.
+    '''
+    if fields is None:
+        return ", ".join(default if default else table)
+    derived = derived if derived else {}
+    selected = ["id"]
+    for field in fields:
+        field = field.split('.')[0]
+        for column in derived.get(field, [field]):
+            if column in table and column not in selected:
+                selected.append(column)
+    return ", ".join(selected)
+
+
+def limits(limit=0, start=0):
+    ''' limits
+    The LIMIT and OFFSET parameters for a page, a limit of 0 is no limit
+    '''
+    return (limit if limit else -1, start if start else 0)
+
+
+for name, statement in SCHEMA:
+    execute(statement)
+if settings.DATABASE.get('indexes', True):
+    migrate()
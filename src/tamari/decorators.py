@@ -3,17 +3,39 @@ This file defines the helper decorator functions, these are some application
 wide decorators for routes to help with common tasks and scenarios for dealing
 with the web requests.
 '''
-import json
 import datetime
 import time
 from functools import wraps
-from bson.objectid import ObjectId
+from threading import Lock
 from flask import request, make_response, session, abort, render_template, \
-    Flask, url_for
+    Flask, url_for, current_app
 from werkzeug import BaseResponse
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import generate_etag
 from . import settings
+from .cache import LRUCache
+from .session import SETTINGS_CHANGED
+from .serializers import SERIALIZERS, STREAMERS, date_formatter, prepare, \
+    streams
+from .links import URLBuilder
+from .compression import ENCODERS
 import httplib
 
+RESPONSE_CACHE = settings.RESPONSE_CACHE
+STREAM_THRESHOLD = settings.STREAM_THRESHOLD
+DEFAULT_MIMETYPE = 'application/json'
+PREFERENCE = [DEFAULT_MIMETYPE] + sorted(
+    mimetype for mimetype in SERIALIZERS if mimetype != DEFAULT_MIMETYPE)
+    # serializer mimetypes, the one picked for an Accept of */* is first
+COMPRESSION = settings.COMPRESSION
+ENCODINGS = [encoding for encoding in COMPRESSION['encodings']
+             if encoding in ENCODERS]  # available, in order of preference
+COMPRESSIBLE = set(SERIALIZERS.keys() + ['application/javascript'])
+responses = LRUCache(RESPONSE_CACHE['size'])  # (stored, status, headers, body)
+    # of GET responses, by cache_key
+refreshing = set()  # cache keys currently being regenerated
+refreshing_lock = Lock()
+
 
 def intersect(a, b):
     ''' intersect
@@ -31,6 +53,46 @@ def html_base():
     }
 
 
+def expanded(field):
+    ''' expanded
+    Returns whether the request asks for the field to be expanded (embedded
+    rather than linked) with the comma separated 'expand' argument.
+    '''
+    return field in request.args.get('expand', '').split(',')
+
+
+def fieldset():
+    ''' fieldset
+    Returns the fields the request limits the packet to with the comma
+    separated 'fields' argument (fields of nested packets are dotted, i.e.
+    'posts.content'), None if it is not set.
+    '''
+    fields = filter(None, request.args.get('fields', '').split(','))
+    return frozenset(fields) if fields else None
+
+
+def if_match():
+    ''' if_match
+    Returns the version of a document that the request is conditioned on
+    with the If-Match header, None if the header is not set (or is '*').  The
+    header takes either the ETag of a GET of the document (which begins with
+    its version, see conditional) or its 'version' field (i.e. '"3"').
+    Raises a ValueError if the header holds no version, such a tag can never
+    match the document.
+    '''
+    header = request.headers.get('If-Match', '').split(',')[0].strip()
+    if not header or header == '*':
+        return None
+    if header.startswith('W/'):
+        header = header[2:]
+    version = header.strip('"').split('-')[0]
+    if not version.isdigit():
+        raise ValueError(
+            "If-Match must be the ETag of the document (or the 'version' " +
+            "field of its packet)")
+    return int(version)
+
+
 class TamariFlask(Flask):
     ''' TamariFlask:
     This is just an expansion on the Flask app class to add fancier decorators
@@ -50,6 +112,16 @@ class TamariFlask(Flask):
 
         return Flask.__init__(self, *args, **kwargs)
 
+    @property
+    def url_builder(self):
+        ''' url_builder:
+        The URLBuilder for the app's routes, built on first use (once all of
+        the routes are registered).
+        '''
+        if '_url_builder' not in self.__dict__:
+            self._url_builder = URLBuilder(self.url_map)
+        return self._url_builder
+
     def endpoint(self, name, route):
         ''' endpoint:
         Stores an alias for a specific endpoint of the application, this is
@@ -87,37 +159,160 @@ class TamariFlask(Flask):
         return new_route
 
 
-class JSONEncoder(json.JSONEncoder):
-    ''' JSONEncoder
-    An extended json.JSONEncoder, used to customize the encoding of the data
-    packets (dicts or lists) into JSON, just catches various types and beyond
-    the basic types and handles their JSON representation (examples are things
-    like python's datetime or the bson.objectid used for indexing in mongo).
+def last_modified(packet):
+    ''' last_modified
+    Returns the time the document in the packet was last changed, the newest
+    of its editted and last_post_at times (and of the editted times of its
+    posts), truncated to the second like the HTTP header.  None if it has
+    none, i.e. for a list, which can lose entries without a trace.
     '''
-    DATE_FORMATS = {
-        'iso': lambda date: date.isoformat(),
-        'epoch': lambda date: time.mktime(date.timetuple())
-    }
+    if type(packet) is not dict:
+        return None
+    dates = [packet.get('editted'), packet.get('last_post_at')]
+    if type(packet.get('posts')) is list:
+        dates += [post.get('editted') for post in packet['posts']
+                  if type(post) is dict]
+    dates = [date for date in dates if isinstance(date, datetime.datetime)]
+    return max(dates).replace(microsecond=0) if dates else None
+
+
+def conditional(response, packet):
+    ''' conditional
+    Adds a strong ETag (the hash of the serialized body) and a Last-Modified
+    (from the change times in the packet, or the last change of the session
+    settings the packet was formatted with if later) to the response of a
+    GET, then answers a matching If-None-Match or If-Modified-Since with a
+    NOT_MODIFIED.  The ETag of a packet with a version (threads and posts) is
+    prefixed with it, so it can be sent back with If-Match (see if_match).
+    The Cache-Control header is set from the CACHE_CONTROL setting for the
+    endpoint (falling back to its 'default'), made private for a logged in
+    user, and as the packet is formatted with the session, the response
+    varies by Cookie.
+    '''
+    if request.method not in ('GET', 'HEAD'):
+        return response
 
-    def date_format(self, obj):
-        if 'date_format' not in session:
-            return str(obj)
-        if session['date_format'] not in self.DATE_FORMATS:
-            return obj.strftime(session['date_format'])
-        return self.DATE_FORMATS[session['date_format']](obj)
+    version = packet.get('version') if type(packet) is dict else None
+    if version is not None:
+        response.set_etag("{}-{}".format(
+            version, generate_etag(response.data)))
+    else:
+        response.add_etag()
+    modified = last_modified(packet)
+    if modified and session.get(SETTINGS_CHANGED):
+        modified = max(modified, datetime.datetime.utcfromtimestamp(
+            session[SETTINGS_CHANGED]))
+    if modified:
+        response.last_modified = modified
+    response.vary.update(['Accept', 'Cookie'])
+    cache_control = settings.CACHE_CONTROL.get(
+        request.endpoint, settings.CACHE_CONTROL.get('default'))
+    if 'id' in session:  # the packet can hold the user's own data
+        cache_control = "private, " + cache_control if cache_control \
+            else "private"
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+
+def compress(response):
+    ''' compress
+    Compresses the body of the response with the most preferred encoding
+    (see the COMPRESSION setting) the client accepts, if the body is at least
+    the threshold in size and of a compressible type.  A response with an
+    ETag gets a distinct one for each encoding, and conditional requests are
+    answered against it.  While the response cache is on, compressed bodies
+    are kept in it by ETag and encoding, so a cached response is only
+    compressed once.  Used as an after_request handler of the app.
+    '''
+    mimetype = response.mimetype or ''
+    if not ENCODINGS or response.is_streamed or \
+            response.status_code != httplib.OK or \
+            'Content-Encoding' in response.headers or \
+            not (mimetype in COMPRESSIBLE or mimetype.startswith('text/')):
+        return response
 
-    def default(self, obj):
-        if isinstance(obj, ObjectId):  # ObjectId used in mongo
-            return str(obj)
-        elif isinstance(obj, datetime.datetime):  # datetime used for dates
-            return self.date_format(obj)
-        return json.JSONEncoder.default(self, obj)
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if not encoding or len(response.data) < COMPRESSION['threshold']:
+        return response
+
+    etag, weak = response.get_etag()
+    key = ('encoded', etag, encoding)
+    data = responses.get(key) if etag and RESPONSE_CACHE['size'] else None
+    if data is None:
+        data = ENCODERS[encoding](response.data, COMPRESSION['level'])
+        if etag and RESPONSE_CACHE['size']:
+            responses.set(key, data)
+
+    response.data = data
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        response.set_etag(etag + '-' + encoding, weak)
+        response = response.make_conditional(request)
+    return response
+
+
+def links():
+    ''' links
+    Returns the function that turns the Links in a packet into paths for the
+    current request.
+    '''
+    return current_app.url_builder.builder(request.script_root)
+
+
+def streaming(per_page):
+    ''' streaming
+    Returns whether a page of per_page items should be streamed, pages of
+    more items than the STREAM_THRESHOLD setting (or unlimited pages) are if
+    the response will be in a format that can be written incrementally (see
+    STREAMERS in serializers.py).
+    '''
+    if not STREAM_THRESHOLD or 0 < per_page <= STREAM_THRESHOLD or \
+            request.args.get('callback'):
+        return False
+    best = request.accept_mimetypes.best_match(PREFERENCE)
+    return (best if best else DEFAULT_MIMETYPE) in STREAMERS
+
+
+def serialize(serializer):
+    ''' serialize
+    Wraps a serializer (see serializers.py) to format dates for the current
+    session's date_format setting and build the paths of the Links.
+    '''
+    return lambda data: serializer(
+        data, date_formatter(session.get('date_format')), links())
 
 
-JSON_KWARGS = {
-    "cls": JSONEncoder,
-    "separators": (',', ':')
-}
+def stream(streamers, mimetype, data, status_code):
+    ''' stream
+    Returns a streamed response of the packet if it holds generators (see
+    streams in serializers.py) and the mimetype has a streamer, None if not.
+    '''
+    if mimetype not in streamers or not streams(data):
+        return None
+    # written as it is generated, so it can't be made conditional
+    return current_app.response_class(
+        streamers[mimetype](data), status_code, mimetype=mimetype)
+
+
+def package(data, status_code, packet_response):
+    ''' package
+    Turns the output of a route into its response, formatting data packets
+    with packet_response (see datatype).
+    '''
+    if type(data) is int:  # if int, treat it like a status code
+        return make_response("", data)
+    elif type(data) is dict or type(data) is list:
+        # if it is a dict or list, treat like data packet
+        response = packet_response(data, status_code)
+        if status_code == httplib.OK and not response.is_streamed:
+            response = conditional(response, data)
+        return response
+    elif isinstance(data, BaseResponse):  # if it is a Response, use it
+        return data
+    else:  # otherwise, treat it like raw data
+        return make_response(data, status_code)
 
 
 def datatype(template=None):
@@ -127,7 +322,9 @@ def datatype(template=None):
     produce the proper format of output.  If the output of the route is a
     dictionary, it is assumed to be a data packet and will be formatted based
     on the HTTP Accept header, if it is a number, it is treated like a HTTP
-    status code.
+    status code.  Data packets returned to a GET are made conditional (see
+    conditional), unless they hold generators, which are streamed (see
+    streaming).
 
     argument(optional) template file to render html requests with
 
@@ -137,13 +334,35 @@ def datatype(template=None):
         def some_function():  # this will be converted into a proper response
             return { "foo": "bar" }
     '''
-    mimetypes = {
-        "application/json": lambda d: json.dumps(d, **JSON_KWARGS)
-    }
+    mimetypes = {mimetype: serialize(serializer) for mimetype, serializer
+                 in SERIALIZERS.items()}
+    streamers = {mimetype: serialize(streamer) for mimetype, streamer
+                 in STREAMERS.items()}
     if type(template) is str:
-        mimetypes["text/html"] = lambda d: \
-            render_template(template, **dict(d.items() + html_base().items()))
-    default = 'application/json'
+        mimetypes["text/html"] = lambda d: render_template(template, **dict(
+            prepare(d, lambda date: date, links()).items() +
+            html_base().items()))
+    default = DEFAULT_MIMETYPE
+    preference = PREFERENCE + [mimetype for mimetype in mimetypes
+                               if mimetype not in PREFERENCE]
+
+    def packet_response(data, status_code):
+        callback = request.args.get('callback', False)
+        if callback:  # if has a callback parameter, treat like JSONP
+            data = str(callback) + "(" + \
+                mimetypes['application/json'](data) + ");"
+            response = make_response(data, status_code)
+            response.mimetype = 'application/javascript'
+            return response
+        # Non-JSONP treatment
+        best = request.accept_mimetypes.best_match(preference)
+        mimetype = best if best else default
+        response = stream(streamers, mimetype, data, status_code)
+        if response is not None:
+            return response
+        response = make_response(mimetypes[mimetype](data), status_code)
+        response.mimetype = mimetype
+        return response
 
     def decorator(func):
         @wraps(func)
@@ -155,29 +374,7 @@ def datatype(template=None):
                 status_code = data[1]
                 data = data[0]
 
-            if type(data) is int:  # if int, treat it like a status code
-                response = make_response("", data)
-            elif type(data) is dict or type(data) is list:
-                # if it is a dict or list, treat like data packet
-                callback = request.args.get('callback', False)
-                if callback:  # if has a callback parameter, treat like JSONP
-                    data = str(callback) + "(" + \
-                        mimetypes['application/json'](data) + ");"
-                    response = make_response(data, status_code)
-                    response.mimetype = 'application/javascript'
-                else:  # Non-JSONP treatment
-                    best = request.accept_mimetypes. \
-                        best_match(mimetypes.keys())
-                    data = mimetypes[best](data) if best \
-                        else mimetypes[default](data)
-                    response = make_response(data, status_code)
-                    response.mimetype = best if best else default
-            elif isinstance(data, BaseResponse):  # if it is a Response, use it
-                response = data
-            else:  # otherwise, treat it like raw data
-                response = make_response(data, status_code)
-
-            return response
+            return package(data, status_code, packet_response)
         return decorated_function
 
     if hasattr(template, '__call__'):  # if no template was given
@@ -223,7 +420,7 @@ def require_permissions(func=None, forum=False, thread=False, post=False):
     return decorator if not func else decorator(func)
 
 
-def paginate(func):
+def paginate(func=None, cursor=False):
     ''' paginate decorator:
     This decorator function is used to handle the pagination of long lists of
     models.  It pulls the page count and page size from either the request
@@ -232,32 +429,152 @@ def paginate(func):
 
     Assumes the wrapped function takes kwargs of 'page' and 'per_page' to
     handle the limiting and offsetting of the query.
+
+    argument(optional) cursor, if set, the 'cursor' request argument is also
+    passed into the view function.  If the view stores a dict of 'prev' and
+    'next' cursors on request.cursors, the 'Link' header will point to those
+    cursors rather than page offsets.
+    '''
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            page = int(request.args.get('page', 0))
+            per_page = request.args.get(
+                'per_page', session.get('page_size', 25))
+
+            kwargs['page'] = page
+            kwargs['per_page'] = int(per_page)
+            if cursor:
+                kwargs['cursor'] = request.args.get('cursor', None)
+
+            response = func(*args, **kwargs)
+
+            links = []
+            vargs = request.view_args.copy()
+            if 'per_page' in request.args:
+                vargs['per_page'] = per_page
+
+            cursors = getattr(request, 'cursors', None)
+            if cursors is not None:
+                for rel in ["prev", "next"]:
+                    if cursors[rel]:
+                        vargs['cursor'] = cursors[rel]
+                        links.append("<" + url_for(request.endpoint, **vargs)
+                                     + ">; rel=\"" + rel + "\"")
+            else:
+                if page > 0:
+                    vargs['page'] = page - 1
+                    links.append("<" + url_for(request.endpoint, **vargs) +
+                                 ">; rel=\"prev\"")
+
+                vargs['page'] = page + 1
+                links.append("<" + url_for(request.endpoint, **vargs) +
+                             ">; rel=\"next\"")
+
+            if links:
+                response.headers.add('Link', ", ".join(links))
+
+            return response
+        return decorated_function
+
+    return decorator if not func else decorator(func)
+
+
+def cache_key():
+    ''' cache_key
+    Returns the key a GET request's response is cached under, made from the
+    path, query arguments and Accept header of the request and the session
+    settings that change the output.
+    '''
+    return (request.path, tuple(sorted(request.args.items(multi=True))),
+            str(request.accept_mimetypes), session.get('date_format'),
+            session.get('page_size'), 'id' in session)
+
+
+def claim_refresh(key):
+    ''' claim_refresh
+    Marks the key as being regenerated, returns False if another request has
+    already claimed it.
+    '''
+    with refreshing_lock:
+        if key in refreshing:
+            return False
+        refreshing.add(key)
+        return True
+
+
+def cached(func):
+    ''' cached decorator:
+    This decorator function is used to keep the responses of read heavy GET
+    routes in memory, the body, status and headers of successful responses
+    are stored (see RESPONSE_CACHE in the settings) and reused for the same
+    request (see cache_key) until they are older than the ttl.  For another
+    'stale' seconds after that, a stale response is still served while a
+    single request regenerates it, or if regenerating it fails (i.e. the
+    database is timing out).  Routes that change data clear the cache with
+    the invalidates decorator, other app processes only see the change after
+    the ttl.
+
+    ex:
+        @app.get('/some/path')
+        @cached
+        @datatype
+        def some_function():  # only runs when the cached copy is too old
+            return { "foo": "bar" }
     '''
+    ttl, stale = RESPONSE_CACHE['ttl'], RESPONSE_CACHE.get('stale', 0)
+
+    def respond(entry):
+        response = current_app.response_class(
+            entry[3], status=entry[1], headers=entry[2])
+        return response.make_conditional(request)
+
     @wraps(func)
     def decorated_function(*args, **kwargs):
-        page = int(request.args.get('page', 0))
-        per_page = request.args.get('per_page', session.get('page_size', 25))
-
-        kwargs['page'] = page
-        kwargs['per_page'] = int(per_page)
+        if not RESPONSE_CACHE['size'] or request.method != 'GET':
+            return func(*args, **kwargs)
 
-        links = []
-        vargs = request.view_args.copy()
-        if 'per_page' in request.args:
-            vargs['per_page'] = per_page
+        key = cache_key()
+        entry = responses.get(key)
+        age = time.time() - entry[0] if entry else None
+        if entry and age < ttl:
+            return respond(entry)
+        claimed = claim_refresh(key)
+        if entry and age < ttl + stale and not claimed:
+            return respond(entry)
+
+        try:
+            response = func(*args, **kwargs)
+        except HTTPException:
+            raise
+        except Exception:
+            if entry and age < ttl + stale:
+                return respond(entry)
+            raise
+        finally:
+            if claimed:
+                with refreshing_lock:
+                    refreshing.discard(key)
+
+        if response.status_code == httplib.OK and not response.is_streamed:
+            responses.set(key, (time.time(), response.status_code,
+                                response.headers.items(), response.data))
+        return response
 
-        if page > 0:
-            vargs['page'] = page - 1
-            links.append(
-                "<" + url_for(request.endpoint, **vargs) + ">; rel=\"prev\"")
+    return decorated_function
 
-        vargs['page'] = page + 1
-        links.append(
-            "<" + url_for(request.endpoint, **vargs) + ">; rel=\"next\"")
 
+def invalidates(func):
+    ''' invalidates decorator:
+    This decorator function is used to flag routes that change data, when
+    the route succeeds all of the responses kept by the cached decorator are
+    dropped.
+    '''
+    @wraps(func)
+    def decorated_function(*args, **kwargs):
         response = func(*args, **kwargs)
-        response.headers.add('Link', ", ".join(links))
-
+        if response.status_code < httplib.BAD_REQUEST:
+            responses.clear()
         return response
 
     return decorated_function
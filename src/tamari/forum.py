@@ -7,7 +7,8 @@ control them.  Creates and stores an endpoint for the root forum on creation.
 import httplib
 import datetime
 from . import app
-from .decorators import datatype, require_permissions, paginate
+from .decorators import datatype, require_permissions, paginate, expanded, \
+    cached, invalidates, fieldset
 from .database import Forum, Thread, errors
 from flask import request, session
 
@@ -17,6 +18,7 @@ thread_route = forum_base + '/thread'
 
 
 @app.get(forum_base)
+@cached
 @datatype
 def get_forum(forum_id, page=0, per_page=25):
     ''' get_forum -> GET /forum/<forum_id>
@@ -25,19 +27,20 @@ def get_forum(forum_id, page=0, per_page=25):
     arg of <forum_id>).  This will return the basic information for the forum,
     including the URLs to retrieve the list of subforums and the list of
     threads.  Returns a NOT_FOUND if the <forum_id> fails to find a
-    corresponding forum.
+    corresponding forum.  '?fields=' limits the forum to the listed fields.
     '''
     try:
-        forum = Forum.get(forum_id)
+        forum = Forum.get(forum_id, fields=fieldset())
     except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
     return forum if isinstance(forum, dict) else httplib.NOT_FOUND
 
 
 @app.get(thread_route)
-@paginate
+@cached
+@paginate(cursor=True)
 @datatype
-def get_threads(forum_id, page=0, per_page=25):
+def get_threads(forum_id, page=0, per_page=25, cursor=None):
     ''' get_threads -> GET /forum/<forum_id>/thread
 
     Retrieves a paged list of threads for the specified forum (specified by
@@ -46,16 +49,33 @@ def get_threads(forum_id, page=0, per_page=25):
     summary packet for each, with the majority of information coming from the
     URL provided by each packet.  Returns a NOT_FOUND if the <forum_id> fails
     to find results.
+
+    The Link header carries opaque cursors of the first and last threads on
+    the page, following them uses a range query so every page costs the same
+    regardless of depth.  A 'page' argument is still honored when no cursor is
+    given.  The list is ordered by creation, or by the latest post if the
+    'sort' argument is 'activity'.  With '?expand=user' the authors of the
+    threads are embedded rather than linked.  '?fields=' limits the threads
+    to the listed fields.  Returns a BAD_REQUEST if the cursor or sort is not
+    valid.
     '''
+    sort = request.args.get('sort', 'created')
+    if sort not in Thread.sorts:
+        return "Unknown sort: " + sort, httplib.BAD_REQUEST
     try:
-        threads = Thread.get(
-            forum=forum_id, limit=per_page, start=(page * per_page))
-    except errors.NoEntryFound as err:
+        threads, request.cursors = Thread.get_page(
+            forum=forum_id, limit=per_page, cursor=cursor,
+            start=(page * per_page), sort=sort, expand=expanded('user'),
+            fields=fieldset())
+    except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
+    except errors.BadCursorError as err:
+        return str(err), httplib.BAD_REQUEST
     return threads if isinstance(threads, list) else httplib.NOT_FOUND
 
 
 @app.post(thread_route)
+@invalidates
 @datatype
 @require_permissions
 def create_thread(forum_id):
@@ -85,12 +105,13 @@ def create_thread(forum_id):
         })
     except errors.MissingInfoError as err:
         return str(err), httplib.BAD_REQUEST
-    except errors.NoEntryFound as err:
+    except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
     return thread, httplib.CREATED
 
 
 @app.get(forum_route)
+@cached
 @datatype
 def get_forums(forum_id):
     ''' get_forums -> GET /forum/<forum_id>/forum
@@ -99,15 +120,17 @@ def get_forums(forum_id):
     (specified by the <forum_id> route arg).  These are not currently
     paginated.  If the forum_id fails to find a corresponding forum, a
     NOT_FOUND will be returned otherwise will be the list of subforums.
+    '?fields=' limits the subforums to the listed fields.
     '''
     try:
-        forums = Forum.children(parent=forum_id)
-    except errors.NoEntryFound as err:
+        forums = Forum.children(parent=forum_id, fields=fieldset())
+    except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
     return forums if isinstance(forums, list) else httplib.NOT_FOUND
 
 
 @app.post(forum_route)
+@invalidates
 @datatype
 @require_permissions(forum=True)
 def create_forum(forum_id):
@@ -129,7 +152,7 @@ def create_forum(forum_id):
 
     try:
         forum = Forum.create(packet)
-    except errors.NoEntryFound as err:
+    except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
     except errors.MissingInfoError as err:
         return str(err), httplib.BAD_REQUEST
@@ -0,0 +1,61 @@
+''' links.py
+Handles the URLs placed in the data packets.  The database layer marks where a
+URL goes with a Link (the endpoint and the ids for the route) and the web layer
+turns these into paths while serializing the packet, using string templates
+that are compiled once from the app's URL map rather than building each URL
+with url_for.
+'''
+import re
+
+ARGUMENT = re.compile(r"<(?:[^:<>]+:)?([^<>]+)>")
+
+
+class Link(object):
+    ''' Link
+    Placeholder for the URL of an endpoint, holds the endpoint name and the
+    values of the route arguments.
+    '''
+    def __init__(self, endpoint, **values):
+        self.endpoint = endpoint
+        self.values = values
+
+    def __deepcopy__(self, memo):
+        return self  # never modified after it is created
+
+    def __eq__(self, other):
+        return isinstance(other, Link) and \
+            (self.endpoint, self.values) == (other.endpoint, other.values)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Link({!r}, **{!r})".format(self.endpoint, self.values)
+
+
+class URLBuilder(object):
+    ''' URLBuilder
+    Registry of the URL templates of an app, built from the rules of its URL
+    map.  Each rule is turned into a format string (i.e. '/thread/<thread_id>'
+    becomes '/thread/{thread_id}'), keyed by the endpoint and the set of
+    arguments the rule takes.
+    '''
+    def __init__(self, url_map):
+        self.templates = {}
+        for rule in url_map.iter_rules():
+            self.templates.setdefault(rule.endpoint, {}).setdefault(
+                frozenset(rule.arguments), ARGUMENT.sub(r"{\1}", rule.rule))
+
+    def build(self, link, root=""):
+        ''' URLBuilder::build
+        Returns the path for the link, prefixed with the root the app is
+        mounted on.
+        '''
+        template = self.templates[link.endpoint][frozenset(link.values)]
+        return root + template.format(**link.values)
+
+    def builder(self, root=""):
+        ''' URLBuilder::builder
+        Returns a function building the paths for links under the root
+        '''
+        return lambda link: self.build(link, root)
@@ -0,0 +1,219 @@
+''' serializers.py
+Collection of functions that turn the data packets returned by routes into
+response bodies.  Packets are converted into plain types in a single pass
+(dates are formatted with the formatter for the session, resolved once per
+request, ObjectIds become strings and Links become paths) and then dumped with
+the fastest JSON library that is installed.  Packets holding generators (i.e.
+posts read from a database cursor) can also be written out incrementally.  If
+msgpack is installed, packets can also be serialized into MessagePack, with
+dates and ids in their binary forms.
+'''
+import datetime
+import json
+import struct
+from types import GeneratorType
+from bson.objectid import ObjectId
+from .links import Link
+
+try:  # C accelerated JSON libraries, used if installed
+    import ujson
+    BACKEND = "ujson"
+
+    def dumps(data):
+        return ujson.dumps(data, escape_forward_slashes=False)
+except ImportError:
+    try:
+        import simplejson
+        BACKEND = "simplejson"
+
+        def dumps(data):
+            return simplejson.dumps(data, separators=(',', ':'))
+    except ImportError:
+        BACKEND = "json"
+
+        def dumps(data):
+            return json.dumps(data, separators=(',', ':'))
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+EPOCH = datetime.datetime(1970, 1, 1)
+TIMESTAMP_EXT = -1  # MessagePack extension types, the standard timestamp
+OBJECTID_EXT = 1  # and the 12 bytes of an ObjectId
+STREAM_CHUNK = 16 * 1024  # bytes gathered into each chunk of a stream
+NATIVE_TYPES = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+
+def epoch(date):
+    ''' epoch
+    Seconds between the UNIX epoch and the (UTC) date
+    '''
+    delta = date - EPOCH
+    return float(delta.days * 86400 + delta.seconds)
+
+DATE_FORMATS = {
+    'iso': lambda date: date.isoformat(),
+    'epoch': epoch
+}
+
+
+def date_formatter(date_format=None):
+    ''' date_formatter
+    Returns the function that formats dates for the provided date_format
+    setting, either one of the named DATE_FORMATS or a strftime string.  If
+    no format is set, dates are just converted to strings.
+    '''
+    if not date_format:
+        return str
+    if date_format in DATE_FORMATS:
+        return DATE_FORMATS[date_format]
+    return lambda date: date.strftime(date_format)
+
+
+def converter(dates=str, links=str):
+    ''' converter
+    Returns the function converting a packet into plain (JSON native) types
+    in a single pass, the dates are formatted with the provided date formatter
+    and the Links are turned into paths with the provided links function (see
+    links.py).  Generators are read into lists.
+    '''
+    def convert(value):
+        converter = converters.get(type(value))
+        if converter:
+            return converter(value)
+        if type(value) in NATIVE_TYPES:
+            return value
+        for base, converter in bases:  # subclasses (i.e. SON documents)
+            if isinstance(value, base):
+                return converter(value)
+        return value
+
+    converters = {
+        dict: lambda value: {key: convert(item)
+                             for key, item in value.iteritems()},
+        list: lambda value: [convert(item) for item in value],
+        tuple: lambda value: [convert(item) for item in value],
+        GeneratorType: lambda value: [convert(item) for item in value],
+        datetime.datetime: dates,
+        ObjectId: str,
+        Link: links
+    }
+    bases = [(base, converters[base]) for base in
+             (dict, list, tuple, datetime.datetime, ObjectId, Link)]
+    return convert
+
+
+def prepare(packet, dates=str, links=str):
+    ''' prepare
+    Converts the packet into plain (JSON native) types (see converter)
+    '''
+    return converter(dates, links)(packet)
+
+
+def streams(packet):
+    ''' streams
+    Returns whether the packet is, or directly holds, a generator that should
+    be written out as it is read.
+    '''
+    if type(packet) is dict:
+        return any(type(value) is GeneratorType
+                   for value in packet.itervalues())
+    return type(packet) is GeneratorType
+
+
+def __pieces(value, convert):
+    ''' (private) __pieces
+    Generates the JSON of the value in pieces, generators are written one
+    item at a time
+    '''
+    if type(value) is GeneratorType:
+        yield "["
+        for index, item in enumerate(value):
+            yield ("," if index else "") + dumps(convert(item))
+        yield "]"
+    elif streams(value):
+        yield "{"
+        for index, (key, item) in enumerate(value.iteritems()):
+            yield ("," if index else "") + dumps(key) + ":"
+            for piece in __pieces(item, convert):
+                yield piece
+        yield "}"
+    else:
+        yield dumps(convert(value))
+
+
+def iter_json(packet, dates=str, links=str):
+    ''' iter_json
+    Serializes the packet into JSON as a generator of chunks (of about
+    STREAM_CHUNK bytes), the generators in the packet are only read as the
+    chunks are, so a large list is never held in memory as a whole.
+    '''
+    chunk, size = [], 0
+    for piece in __pieces(packet, converter(dates, links)):
+        chunk.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def to_json(packet, dates=str, links=str):
+    ''' to_json
+    Serializes the packet into a JSON string
+    '''
+    return dumps(prepare(packet, dates, links))
+
+
+def timestamp(date):
+    ''' timestamp
+    Packs the (UTC) date into the data of a MessagePack timestamp, using the
+    smallest of the 32, 64 and 96 bit formats that holds it
+    '''
+    delta = date - EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    nanoseconds = delta.microseconds * 1000
+    if seconds >> 34:  # negative or past 2514
+        return struct.pack(">Iq", nanoseconds, seconds)
+    data = nanoseconds << 34 | seconds
+    return struct.pack(">I" if data >> 32 == 0 else ">Q", data)
+
+
+def to_msgpack(packet, dates=str, links=str):
+    ''' to_msgpack
+    Serializes the packet into MessagePack, dates are timestamps (ignoring
+    the date formatter) and ObjectIds are their 12 bytes (extension type
+    OBJECTID_EXT).
+    '''
+    def default(value):
+        if isinstance(value, Link):
+            return links(value)
+        if isinstance(value, datetime.datetime):
+            # built directly, msgpack before 1.0 refuses the negative
+            # (reserved) extension types in ExtType()
+            return tuple.__new__(
+                msgpack.ExtType, (TIMESTAMP_EXT, timestamp(value)))
+        if isinstance(value, ObjectId):
+            return msgpack.ExtType(OBJECTID_EXT, value.binary)
+        if type(value) is GeneratorType:
+            return list(value)
+        raise TypeError("Can't serialize {!r}".format(value))
+
+    return msgpack.packb(packet, default=default, use_bin_type=False)
+
+# serializer for each mimetype, these take the packet, the date formatter and
+# the function building the paths of the Links
+SERIALIZERS = {
+    "application/json": to_json
+}
+if msgpack:
+    SERIALIZERS["application/msgpack"] = to_msgpack
+    SERIALIZERS["application/x-msgpack"] = to_msgpack
+# serializers that can write a packet incrementally (see iter_json), for each
+# mimetype, used when the packet holds generators
+STREAMERS = {
+    "application/json": iter_json
+}
@@ -1,27 +1,114 @@
 ''' session.py
 Collection of functions that deal with the session handling for the Flask app,
-sessions exist in the mongo db and are created with a set of defaults dictated
-in the settings file.
+sessions exist in the mongo db (or in a signed cookie, see SESSION_BACKEND) and
+are created with a set of defaults dictated in the settings file.  Sessions are
+only written back when they change, so requests that never touch the session
+cost no writes.
 '''
 from flask.sessions import SessionInterface, SessionMixin
+from copy import deepcopy
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime, timedelta
+import hashlib
+import hmac
+import json
+import os
+import time
 from . import settings
+from .cache import LRUCache
 from .database import Session as Sessions
 
 SESSION_KEY = settings.SESSION_KEY
+SESSION_LIFETIME = settings.SESSION_LIFETIME
+SESSION_REFRESH = settings.SESSION_REFRESH
+SHARED_SESSION = 'tamari.session'  # environ key of a session shared with the
+    # request (the calls of a batch use the session of the batch)
+SETTINGS_CHANGED = 'settings_changed'  # session key of the time (in epoch
+    # seconds) the settings were last set, packets are formatted with them
+
+
+class SessionCache(object):
+    ''' SessionCache
+    wrapper around the database Session module that keeps recently used
+    session packets in an LRUCache.  Saves are written through to the
+    database and removals evict the entry.  With multiple app processes, a
+    session changed by another process can be stale here for up to the ttl.
+    '''
+    def __init__(self, store, size, ttl=None):
+        self.store = store
+        self.cache = LRUCache(size, ttl)
+
+    def get(self, id):
+        packet = self.cache.get(str(id))
+        if packet is None:
+            packet = self.store.get(id)
+            if packet:
+                self.cache.set(str(id), deepcopy(packet))
+        return deepcopy(packet)
+
+    def save(self, packet):
+        id = self.store.save(packet)
+        self.cache.set(str(id), deepcopy(dict(packet)))
+        return id
+
+    def remove(self, id):
+        self.cache.delete(str(id))
+        return self.store.remove(id)
+
+    def __getattr__(self, key):
+        return getattr(self.store, key)
+
+if settings.SESSION_CACHE['size']:
+    Sessions = SessionCache(Sessions, **settings.SESSION_CACHE)
 
 
 class Session(dict, SessionMixin):
     ''' Session
     wrapper class for the created session, just makes sure the session is
-    initialized to a specific default (as specified in the settings)
+    initialized to a specific default (as specified in the settings).  Keeps a
+    copy of the packet it was opened with to tell if it has been modified.
     '''
-    def __init__(self, *args, **kwargs):
-        dict.__init__(self, *args, **kwargs)
-        self["permissions"] = []
-        self.update(settings.SESSION_DEFAULTS)
+    def __init__(self, packet=None):
+        dict.__init__(self)
+        self.new = packet is None
+        self.update(packet if packet else self.defaults())
+        self.__original = deepcopy(dict(self))
+        self.__modified = False
+        self.token = None
+
+    @staticmethod
+    def defaults():
+        ''' Session::defaults
+        returns the packet a session starts out with
+        '''
+        packet = {"permissions": []}
+        packet.update(deepcopy(settings.SESSION_DEFAULTS))
+        return packet
+
+    @property
+    def modified(self):
+        ''' Session::modified
+        whether the session differs from the packet it was opened with, this
+        includes changes made in place (i.e. appending to the rights list)
+        '''
+        return self.__modified or dict(self) != self.__original
+
+    @modified.setter
+    def modified(self, value):
+        self.__modified = value
+
+    @property
+    def is_default(self):
+        ''' Session::is_default
+        whether the session holds nothing beyond the default packet
+        '''
+        packet = dict(self)
+        packet.pop("_id", None)
+        return packet == self.defaults()
 
     def clear(self, *args, **kwargs):
-        Sessions.remove(self['_id'])
+        if '_id' in self:
+            Sessions.remove(self['_id'])
         return dict.clear(self, *args, **kwargs)
 
 
@@ -35,21 +122,135 @@ class SessionHandler(SessionInterface):
 
     def open_session(self, app, request):
         ''' SessionHandler::open_session
-        if no key is stored in the cookies, returns None, otherwise will return
-        the data packet stored in the database using the key retrieved from the
-        cookie.
+        if no key is stored in the cookies, returns a new session, otherwise
+        will return the data packet stored in the database using the key
+        retrieved from the cookie.
         '''
+        if SHARED_SESSION in request.environ:
+            return request.environ[SHARED_SESSION]
         if SESSION_KEY not in request.cookies:
             return Session()
         session_id = request.cookies[SESSION_KEY]
         session = Sessions.get(session_id)
-        return session if session else Session()
+        return Session(session) if session else Session()
 
     def save_session(self, app, session, response):
         ''' Sessions::save_session
-        saves the session packet into the database and checks if this is a new
-        session packet or not (if the is an id in the packet), if it is new,
-        the id will be stored as a cookie for future lookup
+        saves the session packet into the database if it has been modified,
+        new sessions are only stored (and have their id stored as a cookie for
+        future lookup) once they hold more than the defaults.  A cleared
+        session has its cookie removed.
         '''
+        if not session.modified:
+            return
+        if not session:
+            if not session.new:
+                response.delete_cookie(SESSION_KEY)
+            return
+        if session.new and session.is_default:
+            return
+
         id = Sessions.save(session)
-        response.set_cookie(SESSION_KEY, value=id)
+        if session.new:
+            response.set_cookie(SESSION_KEY, value=str(id))
+
+
+def encode(value):
+    return urlsafe_b64encode(value).rstrip("=")
+
+
+def decode(value):
+    return urlsafe_b64decode(str(value) + "=" * (-len(value) % 4))
+
+
+class CookieSessionHandler(SessionInterface):
+    ''' CookieSessionHandler
+    class implementing the SessionInterface for Flask to keep the whole session
+    packet in a compact cookie signed with the app's secret key, so opening a
+    session needs no trip to the database.  Each cookie carries a random token
+    and an expiry, logging out revokes the token in the database.  The list of
+    revoked tokens is reloaded every SESSION_REFRESH seconds rather than being
+    checked on every request.  Note that changes to a user's rights only show
+    up in their session once they log back in.
+    '''
+    def __init__(self):
+        self.revoked = {}
+        self.refreshed = None
+
+    def sign(self, app, payload):
+        ''' CookieSessionHandler::sign
+        returns the signature for the payload using the app's secret key
+        '''
+        return encode(hmac.new(app.secret_key, payload, hashlib.sha1).digest())
+
+    def is_revoked(self, token):
+        ''' CookieSessionHandler::is_revoked
+        checks the token against the revoked tokens, reloading any tokens
+        revoked since the last reload if the list is older than SESSION_REFRESH
+        seconds (from this or any other app node)
+        '''
+        now, refresh = time.time(), timedelta(seconds=SESSION_REFRESH)
+        if not self.refreshed or datetime.utcnow() - self.refreshed > refresh:
+            # overlap the reloads a little to allow for clock drift
+            since = self.refreshed - refresh if self.refreshed else None
+            self.refreshed = datetime.utcnow()
+            self.revoked.update(Sessions.revoked(since))
+            self.revoked = {key: expires for key, expires
+                            in self.revoked.items() if expires > now}
+        return token in self.revoked
+
+    def open_session(self, app, request):
+        ''' CookieSessionHandler::open_session
+        if no valid (correctly signed, unexpired and not revoked) cookie is
+        sent, returns a new session, otherwise the session is rebuilt from the
+        packet stored in the cookie.
+        '''
+        if SHARED_SESSION in request.environ:
+            return request.environ[SHARED_SESSION]
+        if SESSION_KEY not in request.cookies:
+            return Session()
+        try:
+            payload, signature = str(request.cookies[SESSION_KEY]).split(".")
+            if not hmac.compare_digest(self.sign(app, payload), signature):
+                return Session()
+            packet = json.loads(decode(payload))
+        except (TypeError, ValueError, UnicodeError):
+            return Session()
+
+        if packet["e"] < time.time() or self.is_revoked(packet["t"]):
+            return Session()
+        session = Session(packet["d"])
+        session.token = packet["t"], packet["e"]
+        return session
+
+    def save_session(self, app, session, response):
+        ''' CookieSessionHandler::save_session
+        writes a freshly signed cookie if the session has been modified (and
+        holds more than the defaults).  A cleared session has its token revoked
+        and the cookie removed.
+        '''
+        if not session.modified:
+            return
+        if not session:
+            if session.token:
+                Sessions.revoke(*session.token)
+                self.revoked[session.token[0]] = session.token[1]
+                response.delete_cookie(SESSION_KEY)
+            return
+        if session.new and session.is_default:
+            return
+
+        token, expires = session.token if session.token else \
+            (encode(os.urandom(12)), int(time.time()) + SESSION_LIFETIME)
+        payload = encode(json.dumps(
+            {"d": session, "t": token, "e": expires},
+            separators=(',', ':'), default=str))
+        response.set_cookie(
+            SESSION_KEY, value=payload + "." + self.sign(app, payload),
+            expires=expires, httponly=True)
+
+
+backends = {
+    "database": SessionHandler,
+    "cookie": CookieSessionHandler
+}
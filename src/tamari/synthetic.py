@@ -0,0 +1,200 @@
+''' synthetic.py
+Seeded generator of large synthetic forums, for reproducing the problems of a
+large install (deep pages, huge threads, wide forum trees) in the tests and
+the benchmarks.  The same seed and settings always generate the same forum: a
+tree of forums of the given depth and fan-out, users whose activity follows a
+power law (a few users write most of the posts), and threads whose lengths
+are heavy tailed (most are short, a few run to max_posts), with post sizes
+and the times between posts drawn from skewed distributions too.  The forum is
+written through the Bulk module of the database engine rather than a call for
+each thread and post.
+
+    >>> from tamari.synthetic import Generator, populate
+    >>> populate(Generator(seed=1, threads=1000))
+'''
+import random
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import islice
+from . import password_hash
+from .database import Bulk, Forum
+
+END = datetime(2014, 1, 1)  # when the generated activity ends, fixed so the
+    # same seed always generates the same dates
+BATCH = 250  # threads (with their posts) written by each bulk write
+WORDS = ("forum thread post reply the a of and to in is it that for on with "
+         "as was this but be have not at by are from or one had they you all "
+         "there when up use your how said each which she do their time if "
+         "will way about many then them write would like so these her long "
+         "make thing see him two has look more day could go come did number "
+         "sound no most people my over know water than call first who may "
+         "down side been now find any new work part take get place made live "
+         "where after back little only round man year came show every good "
+         "me give our under name very through just form sentence great think "
+         "say help low line differ turn cause much mean before move right "
+         "boy old too same tell does set three want air well also play small "
+         "end put home read hand port large spell add even land here must")
+WORDS = WORDS.split()
+
+
+class Generator(object):
+    ''' Generator
+    Generates the rows of a synthetic forum, each kind of row is drawn from
+    its own random generator (seeded from the seed) so the rows of one kind
+    don't change with the settings of another.  The rows refer to the rows
+    they belong to by their position (the n-th user, forum, ...).
+
+    params:
+        seed: <Int> of the random generators
+        users: <Int> number of users
+        prefix: <String> of the usernames (followed by the number of the
+            user), another prefix writes the users next to existing ones
+        depth, fanout: <Int> levels of forums below the root, and subforums
+            of each forum
+        threads: <Int> number of threads, spread over the forums
+        max_posts: <Int> most posts in a thread, including the head post
+        giants: <Int> threads that have max_posts posts
+        alpha: <Float> shape of the thread lengths (a Pareto distribution),
+            lower makes long threads more common
+        skew: <Float> exponent of the power law of user activity
+        days: <Int> span of the thread creation times, before END
+        words: <Int> median length (in words) of a post
+    '''
+    def __init__(self, seed=1, users=1000, depth=3, fanout=4, threads=10000,
+                 max_posts=50000, giants=1, alpha=1.2, skew=1.1, days=1095,
+                 words=40, prefix="user"):
+        self.seed, self.prefix = seed, prefix
+        self.user_count, self.thread_count = users, threads
+        self.depth, self.fanout = depth, fanout
+        self.max_posts, self.giants, self.alpha = max_posts, giants, alpha
+        self.days, self.words = days, words
+        self.activity = []  # cumulative weights of the users
+        for rank in xrange(1, users + 1):
+            self.activity.append(
+                (self.activity[-1] if self.activity else 0) +
+                1.0 / rank ** skew)
+        text = self.random(0)
+        self.text = [text.choice(WORDS) for number in xrange(1 << 16)]
+
+    def random(self, stream):
+        ''' Generator::random
+        The random generator of a kind of row
+        '''
+        return random.Random(self.seed * 8 + stream)
+
+    def author(self, rng):
+        ''' Generator::author
+        Picks a user, by the power law of their activity
+        '''
+        return bisect(self.activity, rng.random() * self.activity[-1])
+
+    def content(self, rng, words):
+        ''' Generator::content
+        Text of about words words (a log-normal number of them)
+        '''
+        count = min(len(self.text), max(1, int(
+            rng.lognormvariate(0, 0.8) * words)))
+        start = rng.randrange(len(self.text) - count + 1)
+        return " ".join(self.text[start:start + count])
+
+    def users(self, password="password"):
+        ''' Generator::users
+        Generates the users, all with the same password
+        '''
+        rng = self.random(1)
+        for number in xrange(self.user_count):
+            yield {
+                "username": "{}{}".format(self.prefix, number),
+                "password": password,
+                "created": END - timedelta(
+                    days=self.days + 30 * rng.random())
+            }
+
+    def forums(self):
+        ''' Generator::forums
+        Generates the levels of the forum tree, a list of forums for each
+        level (the first level are children of the root, parent None)
+        '''
+        parents, position = [(None, "Forum ")], 0
+        for level in xrange(self.depth):
+            forums = [{"name": name + str(number), "parent": parent}
+                      for parent, name in parents
+                      for number in xrange(self.fanout)]
+            yield forums
+            parents = [(position + number, forum['name'] + ".")
+                       for number, forum in enumerate(forums)]
+            position += len(forums)
+
+    def threads(self):
+        ''' Generator::threads
+        Generates the threads, each along with its posts (the first is the
+        head post), the first giants threads have max_posts posts.  Threads
+        are spread over the forums at random, in order of creation.
+        '''
+        rng, giants = self.random(2), self.giants
+        forums = sum(self.fanout ** depth
+                     for depth in xrange(1, self.depth + 1))
+        span = self.days * 86400
+        for created in sorted(rng.random() * span
+                              for number in xrange(self.thread_count)):
+            created = END - timedelta(seconds=span - created)
+            length = self.max_posts if giants else min(
+                self.max_posts, int(rng.paretovariate(self.alpha)))
+            giants = max(0, giants - 1)
+            gap = 3600.0 * 24 / max(1, length)  # mean seconds between posts
+            posts, at = [], created
+            for number in xrange(length):
+                posts.append({
+                    "user": self.author(rng),
+                    "content": self.content(rng, self.words),
+                    "created": at
+                })
+                at += timedelta(seconds=rng.expovariate(1 / gap))
+            yield {
+                "forum": rng.randrange(forums) if forums else None,
+                "title": self.content(rng, 6).capitalize(),
+                "user": posts[0]['user'],
+                "created": created,
+                "posts": posts
+            }
+
+
+def populate(generator, password="password"):
+    ''' populate
+    Writes the forum of the generator through the Bulk module of the database
+    engine, under the root forum.  Returns a dict of the ids of the users and
+    the forums (in the order they were generated), the number of threads and
+    posts written, and the id of the longest thread.  Raises an
+    ExistingUsernameError if a generated username is taken (use another
+    prefix), before anything else is written.
+    '''
+    users = []
+    rows = generator.users(password_hash(password))
+    for batch in iter(lambda: list(islice(rows, BATCH * 4)), []):
+        users.extend(Bulk.users(batch))
+
+    root, forums = str(Forum.get_root()), []
+    for level in generator.forums():
+        for row in level:
+            row['parent'] = forums[row['parent']] \
+                if row['parent'] is not None else root
+        for start in xrange(0, len(level), BATCH * 4):
+            forums.extend(Bulk.forums(level[start:start + BATCH * 4]))
+
+    result = {"users": users, "forums": forums, "threads": 0, "posts": 0,
+              "longest": None}
+    longest, rows = 0, generator.threads()
+    for batch in iter(lambda: list(islice(rows, BATCH)), []):
+        for row in batch:
+            row['forum'] = forums[row['forum']] \
+                if row['forum'] is not None else root
+            row['user'] = users[row['user']]
+            for post in row['posts']:
+                post['user'] = users[post['user']]
+        ids = Bulk.threads(batch)
+        for id, row in zip(ids, batch):
+            if len(row['posts']) > longest:
+                longest, result['longest'] = len(row['posts']), id
+            result['posts'] += len(row['posts'])
+        result['threads'] += len(ids)
+    return result
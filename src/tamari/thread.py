@@ -8,13 +8,15 @@ created (in reply to a thread), modified, and retrieved.
 import httplib
 import datetime
 from . import app
-from .decorators import datatype, require_permissions, paginate
+from .decorators import datatype, require_permissions, paginate, if_match, \
+    expanded, cached, invalidates, streaming, fieldset
 from .database import errors, Thread
 
 from flask import request, session
 
 
 @app.get('/thread/<thread_id>')
+@cached
 @paginate
 @datatype
 def get_thread(thread_id, page=0, per_page=25):
@@ -23,11 +25,17 @@ def get_thread(thread_id, page=0, per_page=25):
     Retrieves the thread specified by the route arg <thread_id>.  Will paginate
     the output based on the paginate decorator.  If the thread_id does not
     correspond to a thread on the system, a NOT_FOUND will be returned,
-    otherwise the thread packet will be returned.
+    otherwise the thread packet will be returned.  With '?expand=user' the
+    authors of the thread and posts are embedded rather than linked.  Large
+    pages (see the STREAM_THRESHOLD setting) are streamed as the posts are
+    read.  '?fields=title,posts.content' limits the thread (and its posts) to
+    the listed fields.
     '''
+    fetch = Thread.stream if streaming(per_page) else Thread.get
     try:
-        thread = Thread.get(
-            thread_id=thread_id, limit=per_page, start=(page * per_page))
+        thread = fetch(
+            thread_id=thread_id, limit=per_page, start=(page * per_page),
+            expand=expanded('user'), fields=fieldset())
     except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
 
@@ -35,6 +43,7 @@ def get_thread(thread_id, page=0, per_page=25):
 
 
 @app.put('/thread/<thread_id>')
+@invalidates
 @datatype
 @require_permissions(thread=True)
 def edit_thread(thread_id):
@@ -45,23 +54,32 @@ def edit_thread(thread_id):
     If the thread_id does not correspond to an item in the database, will
     return a NOT_FOUND.  Otherwise will apply the changes in the PUT data to
     the existing thread object and return an ACCEPTED with the new thread
-    object.
+    object.  If an If-Match header with the ETag of a GET of the thread (or
+    its 'version' field) is sent and the thread has since been changed, or
+    the header holds no version, a PRECONDITION_FAILED is returned.
     '''
     if 'title' not in request.form:
         return httplib.BAD_REQUEST
 
     title = request.form['title']
+    try:
+        version = if_match()
+    except ValueError as err:
+        return str(err), httplib.PRECONDITION_FAILED
     try:
         thread = Thread.edit_thread(thread_id, user=session['id'], info={
             "title": title,
             "editted": datetime.datetime.utcnow()
-        })
+        }, version=version)
     except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
+    except errors.ConflictError as err:
+        return str(err), httplib.PRECONDITION_FAILED
     return thread, httplib.ACCEPTED
 
 
 @app.post('/thread/<thread_id>')
+@invalidates
 @datatype
 @require_permissions
 def replyto_thread(thread_id):
@@ -93,6 +111,7 @@ def replyto_thread(thread_id):
 
 
 @app.put('/post/<post_id>')
+@invalidates
 @datatype
 @require_permissions(post=True)
 def edit_post(post_id):
@@ -102,16 +121,25 @@ def edit_post(post_id):
     Attempts to apply changes to the post specified by the <post_id> route arg,
     if the post_id does not correspond to an existing post, a NOT_FOUND will be
     be returned.  If the modification succeeds, an ACCEPTED will be returned
-    with the structure of the modified post.
+    with the structure of the modified post.  If an If-Match header with the
+    ETag of a GET of the post (or its 'version' field) is sent and the post
+    has since been changed, or the header holds no version, a
+    PRECONDITION_FAILED is returned.
     '''
     content = request.form['content']
+    try:
+        version = if_match()
+    except ValueError as err:
+        return str(err), httplib.PRECONDITION_FAILED
     try:
         post = Thread.edit_post(post_id, user=session['id'], info={
             "content": content,
             "editted": datetime.datetime.utcnow()
-        })
+        }, version=version)
     except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
+    except errors.ConflictError as err:
+        return str(err), httplib.PRECONDITION_FAILED
     return (post, httplib.ACCEPTED) if isinstance(post, dict) \
         else httplib.NOT_FOUND
 
@@ -123,10 +151,13 @@ def get_post(post_id):
 
     Retrieves the post specified by the <post_id> route arg.  If the post_id
     does not correspond to a post on the system, a NOT_FOUND will be returned.
-    Otherwise the post object will be returned.
+    Otherwise the post object will be returned.  With '?expand=user' the
+    author of the post is embedded rather than linked.  '?fields=' limits the
+    post to the listed fields.
     '''
     try:
-        post = Thread.get_post(post_id)
+        post = Thread.get_post(
+            post_id, expand=expanded('user'), fields=fieldset())
     except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
     return post if isinstance(post, dict) else httplib.NOT_FOUND
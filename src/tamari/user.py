@@ -4,11 +4,12 @@ registering new users, modifying existing users, retrieving other users, and
 logging in and out as a user.
 '''
 from .database import errors, User
-from .decorators import datatype
+from .decorators import datatype, fieldset
 import httplib
 from tamari import password_hash, app
 from flask import request, session, abort
 
+MAX_IDS = 100  # most users that can be fetched with one request
 __routes__ = {
     'login': '/login',
     'logout': '/logout',
@@ -61,7 +62,7 @@ def login():
     password = request.form['password']
     id, user = User.login(username, password_hash(password))
     if id:
-        session['id'] = id
+        session['id'] = str(id)
         session['rights'] = user['rights']
         return user, httplib.ACCEPTED
 
@@ -117,13 +118,26 @@ def get_user(user_id=None):
     Retrieves the user that corresponds to the <user_id> route argument if it
     is specified.  If it is not, will retrieve the currently logged in user.
     If the user_id does not correspond to an existing user on the system a
-    NOT_FOUND is returned.
+    NOT_FOUND is returned.  '?fields=' limits the user to the listed fields.
+
+    GET /user?ids=[id],[id],... instead returns the list of the public packets
+    of the users with the listed ids (leaving out ids without a user, or that
+    aren't ids), up to MAX_IDS of them.
     '''
+    if not user_id and 'ids' in request.args:
+        ids = filter(None, request.args['ids'].split(','))
+        if len(ids) > MAX_IDS:
+            return "Too many ids, limit is " + str(MAX_IDS), \
+                httplib.BAD_REQUEST
+        users = User.get_many(ids)
+        return [users[id] for id in ids if id in users]
+
     if not user_id and 'id' not in session:
         abort(httplib.UNAUTHORIZED)
     user_id = user_id if user_id else session['id']
     try:
-        user = User.get(user_id, 'id' in session and user_id == session['id'])
+        user = User.get(user_id, 'id' in session and user_id == session['id'],
+                        fields=fieldset())
     except errors.NoEntryError as err:
         return str(err), httplib.NOT_FOUND
     return user if user else httplib.NOT_FOUND
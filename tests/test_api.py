@@ -1,6 +1,7 @@
 from base import TestBase
 import httplib
 import json
+import time
 
 
 class APITest(TestBase):
@@ -48,6 +49,23 @@ class APITest(TestBase):
         settings = self.get_settings()
         self.assertEqual(settings["foo"], "bar")
 
+    def test_untouched_session(self):
+        ''' Requests that don't touch the session don't store it
+        Anonymous reads should not create a session (or a cookie), once a
+        setting is made the session is stored and the cookie is issued once
+        '''
+        response = self.app.get(
+            self.endpoints['root']['url'], headers=self.json_header)
+        self.assertHasStatus(response, httplib.OK)
+        self.assertNotIn('Set-Cookie', response.headers)
+
+        response = self.set_settings({"foo": "bar"})
+        self.assertIn('Set-Cookie', response.headers)
+        response = self.app.get(
+            self.endpoints['root']['url'], headers=self.json_header)
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertEqual(self.get_settings()["foo"], "bar")
+
     def test_prohibited_settings(self):
         ''' Set session settings that are reserved
         Tests that you cannot modify/retrieve specific settings that should
@@ -71,7 +89,7 @@ class APITest(TestBase):
         testing 'epoch', 'iso', and the strftime strings
         '''
         import datetime
-        import time
+        import calendar
 
         def get_thread_dt(thread_id):  # short helper function
             return self.get_thread(thread)["created"]
@@ -86,8 +104,159 @@ class APITest(TestBase):
         # test the 'epoch' format, checks that it matchs the ISO dt object
         self.set_settings({"date_format": "epoch"})
         datetime_int = get_thread_dt(thread)
-        self.assertEqual(datetime_int, time.mktime(datetime_obj.timetuple()))
+        self.assertEqual(
+            datetime_int, calendar.timegm(datetime_obj.utctimetuple()))
         # test a custom format, checks against the output of the ISO dt object
         self.set_settings({"date_format": "%d%%%m"})
         datetime_str = get_thread_dt(thread)
         self.assertEqual(datetime_str, datetime_obj.strftime("%d%%%m"))
+
+    def test_conditional_get(self):
+        ''' Conditional GET of a thread
+        A thread request repeated with the returned ETag should get a
+        NOT_MODIFIED, until the thread is replied to
+        '''
+        self.register(self.user)
+        thread = self.create_thread(thread=self.thread)
+
+        response = self.app.get(thread['url'], headers=self.json_header)
+        self.assertHasStatus(response, httplib.OK)
+        self.assertIn('Last-Modified', response.headers)
+        headers = self.json_header + [
+            ('If-None-Match', response.headers['ETag'])]
+        response = self.app.get(thread['url'], headers=headers)
+        self.assertHasStatus(response, httplib.NOT_MODIFIED)
+
+        self.app.post(
+            thread['url'], data={"content": "reply"}, headers=self.json_header)
+        response = self.app.get(thread['url'], headers=headers)
+        self.assertHasStatus(response, httplib.OK)
+
+    def test_session_response(self):
+        ''' Responses formatted with the session
+        The responses to a logged in user are private and vary by Cookie, a
+        change of the date format modifies a thread (though the thread itself
+        hasn't changed) and a list has no Last-Modified
+        '''
+        self.register(self.user)
+        thread = self.create_thread(thread=self.thread)
+
+        response = self.app.get(thread['url'], headers=self.json_header)
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertIn('Cookie', response.headers['Vary'])
+        headers = self.json_header + [
+            ('If-Modified-Since', response.headers['Last-Modified'])]
+        response = self.app.get(thread['url'], headers=headers)
+        self.assertHasStatus(response, httplib.NOT_MODIFIED)
+
+        time.sleep(1)  # Last-Modified is to the second
+        self.set_settings({"date_format": "epoch"})
+        response = self.app.get(thread['url'], headers=headers)
+        self.assertHasStatus(response, httplib.OK)
+
+        forum = self.get_forum(self.endpoints['root'])
+        response = self.app.get(forum['threads'], headers=self.json_header)
+        self.assertHasStatus(response, httplib.OK)
+        self.assertNotIn('Last-Modified', response.headers)
+
+    def test_cached_response(self):
+        ''' Cached thread list is dropped when a thread is created
+        Requests the thread list twice (the second from the response cache),
+        then creates a thread, which should show up in the next request
+        '''
+        self.register(self.user)
+        self.assertEmpty(self.get_threads())
+        self.assertEmpty(self.get_threads())
+        self.create_thread(thread=self.thread)
+        self.assertEqual(len(self.get_threads()), 1)
+
+    def test_compressed_response(self):
+        ''' Large responses are compressed for clients accepting gzip
+        Requests a large thread with and without gzip, the compressed body
+        should hold the same data with its own ETag (which can be used for a
+        conditional request), small responses are left as they are
+        '''
+        import zlib
+        self.register(self.user)
+        thread = self.create_thread(thread={
+            "title": "compressed thread", "content": "compress me " * 200})
+        headers = self.json_header + [('Accept-Encoding', 'gzip')]
+
+        plain = self.app.get(thread['url'], headers=self.json_header)
+        response = self.app.get(thread['url'], headers=headers)
+        self.assertHasStatus(response, httplib.OK)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(
+            zlib.decompress(response.data, 16 + zlib.MAX_WBITS), plain.data)
+        self.assertNotEqual(response.headers['ETag'], plain.headers['ETag'])
+
+        response = self.app.get(thread['url'], headers=headers + [
+            ('If-None-Match', response.headers['ETag'])])
+        self.assertHasStatus(response, httplib.NOT_MODIFIED)
+
+        response = self.app.get(
+            self.endpoints['settings']['url'], headers=headers)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_msgpack_response(self):
+        ''' Packets are returned as MessagePack when it is accepted
+        Requests a thread as MessagePack, it should hold the same thread as
+        the JSON response, with the dates as timestamps
+        '''
+        try:
+            import msgpack
+        except ImportError:
+            self.skipTest("msgpack is not installed")
+        self.register(self.user)
+        thread = self.create_thread(thread=self.thread)
+
+        response = self.app.get(
+            thread['url'], headers=[('Accept', 'application/msgpack')])
+        self.assertHasStatus(response, httplib.OK)
+        self.assertEqual(response.mimetype, 'application/msgpack')
+        packed = msgpack.unpackb(
+            response.data, ext_hook=lambda code, data: code)
+        self.assertEqual(packed['url'], thread['url'])
+        self.assertEqual(packed['title'], thread['title'])
+        self.assertEqual(packed['created'], -1)  # timestamp extension
+
+    def test_batch(self):
+        ''' Several calls made with one batch request
+        Runs a batch that reads the root forum and its threads, creates a
+        thread and reads the threads again, each call should have its result
+        in order, with the later read seeing the new thread
+        '''
+        self.register(self.user)
+        root = self.get_forum()
+        calls = [
+            {"path": root['url']},
+            {"path": root['threads']},
+            {"method": "POST", "path": root['threads'], "body": self.thread},
+            {"path": root['threads'], "headers": {"If-None-Match": "x"}}]
+        for concurrent in [False, True]:
+            response = self.app.post(
+                self.endpoints['batch']['url'], headers=self.json_header,
+                content_type='application/json',
+                data=json.dumps({"calls": calls, "concurrent": concurrent}))
+            self.assertHasStatus(response, httplib.OK)
+            results = json.loads(response.data)
+            self.assertEqual(
+                [result['status'] for result in results],
+                [httplib.OK, httplib.OK, httplib.CREATED, httplib.OK])
+            self.assertEqual(results[0]['body']['url'], root['url'])
+            self.assertEqual(
+                len(results[3]['body']), len(results[1]['body']) + 1)
+
+        response = self.app.post(
+            self.endpoints['batch']['url'], headers=self.json_header,
+            content_type='application/json',
+            data=json.dumps([{"path": self.endpoints['batch']['url']}]))
+        self.assertHasStatus(response, httplib.BAD_REQUEST)
+        for call in [{"path": root['threads'], "body": [1]},
+                     {"path": root['threads'], "body": 5},
+                     {"path": root['threads'], "headers": ["Accept"]}]:
+            response = self.app.post(
+                self.endpoints['batch']['url'], headers=self.json_header,
+                content_type='application/json', data=json.dumps([call]))
+            self.assertHasStatus(response, httplib.BAD_REQUEST)
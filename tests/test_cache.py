@@ -0,0 +1,182 @@
+from tamari.cache import LRUCache, SingleFlight
+from tamari import session
+from tamari.session import SessionCache
+from threading import Thread, Event
+import unittest
+import time
+
+
+class CacheTest(unittest.TestCase):
+    ''' CacheTest
+    Test Suite for the in process LRUCache, checks the eviction, expiry and
+    counters of the cache
+    '''
+
+    def test_eviction(self):
+        ''' Least recently used entry is evicted
+        Fills the cache past its size, the entry that was least recently used
+        should be the one removed
+        '''
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expiry(self):
+        ''' Entries older than the ttl are missing
+        Stores an entry, then ages it past the ttl
+        '''
+        cache = LRUCache(2, ttl=60)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        cache.entries["a"] = (time.time() - 61, 1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_counters(self):
+        ''' Hits and misses are counted
+        '''
+        cache = LRUCache(2)
+        cache.get("a")
+        cache.set("a", 1)
+        cache.get("a")
+        cache.delete("a")
+        cache.get("a")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 2, "size": 0})
+
+
+class SingleFlightTest(unittest.TestCase):
+    ''' SingleFlightTest
+    Test Suite for the SingleFlight helper, checks that concurrent identical
+    calls are collapsed into one
+    '''
+
+    def test_collapsed(self):
+        ''' Concurrent identical calls share the result of one
+        Starts a call that blocks, then makes the same call from another
+        thread, the function should run once and both get its result
+        '''
+        flight = SingleFlight()
+        started, release = Event(), Event()
+        calls, results = [], []
+
+        def lookup():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return {"posts": [1, 2]}
+
+        def call():
+            results.append(flight.do("key", lookup))
+
+        threads = [Thread(target=call), Thread(target=call)]
+        threads[0].start()
+        started.wait()
+        threads[1].start()
+        while not flight.collapsed:
+            time.sleep(0.001)
+        release.set()
+        map(Thread.join, threads)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.collapsed, 1)
+        self.assertEqual(results, [{"posts": [1, 2]}] * 2)
+        self.assertIsNot(results[0], results[1])
+
+    def test_uncontended(self):
+        ''' A call no one joined isn't copied
+        Makes a call with no other thread waiting on it, the caller should
+        get the result itself
+        '''
+        flight, result = SingleFlight(), {"posts": [1, 2]}
+        self.assertIs(flight.do("key", lambda: result), result)
+        self.assertEqual(flight.collapsed, 0)
+
+
+class Store(object):
+    ''' Store
+    Stand in for the database Session module that counts its reads
+    '''
+    def __init__(self):
+        self.packets = {}
+        self.reads = 0
+
+    def get(self, id):
+        self.reads += 1
+        packet = self.packets.get(id)
+        return dict(packet) if packet else None
+
+    def save(self, packet):
+        packet.setdefault('_id', len(self.packets) + 1)
+        self.packets[packet['_id']] = dict(packet)
+        return packet['_id']
+
+    def remove(self, id):
+        self.packets.pop(id, None)
+
+
+class SessionCacheTest(unittest.TestCase):
+    ''' SessionCacheTest
+    Test Suite for the SessionCache wrapper, checks that reads are served
+    from the cache and that saves and removals keep it in step with the
+    database
+    '''
+
+    def setUp(self):
+        self.store = Store()
+        self.sessions = SessionCache(self.store, 10)
+
+    def test_cached_read(self):
+        ''' Repeated reads skip the database
+        Reads a stored session twice, only the first should reach the store
+        '''
+        id = self.store.save({"permissions": []})
+        self.assertEqual(self.sessions.get(id)["_id"], id)
+        self.assertEqual(self.sessions.get(id)["_id"], id)
+        self.assertEqual(self.store.reads, 1)
+
+    def test_cached_copy(self):
+        ''' Changes to a read session don't reach the cache
+        '''
+        id = self.store.save({"permissions": []})
+        self.sessions.get(id)["permissions"].append("admin")
+        self.assertEqual(self.sessions.get(id)["permissions"], [])
+
+    def test_write_through(self):
+        ''' Saves are written to the database and the cache
+        Saves a session and reads it back, the store should hold the packet
+        and the read shouldn't reach the store
+        '''
+        id = self.sessions.save({"permissions": ["forum"]})
+        self.assertEqual(self.store.packets[id]["permissions"], ["forum"])
+        self.assertEqual(self.sessions.get(id)["permissions"], ["forum"])
+        self.assertEqual(self.store.reads, 0)
+
+    def test_remove(self):
+        ''' Removals evict the cached session
+        Reads a session into the cache, then removes it, the next read
+        should go to the store and find nothing
+        '''
+        id = self.sessions.save({"permissions": []})
+        self.sessions.get(id)
+        self.sessions.remove(id)
+        self.assertNotIn(id, self.store.packets)
+        self.assertIsNone(self.sessions.get(id))
+        self.assertEqual(self.store.reads, 1)
+
+    def test_clear(self):
+        ''' Clearing a session evicts it
+        Clears a session opened from the cache (as logging out does), the
+        session should be gone from the cache and the database
+        '''
+        id = self.sessions.save({"permissions": []})
+        original, session.Sessions = session.Sessions, self.sessions
+        try:
+            session.Session(self.sessions.get(id)).clear()
+        finally:
+            session.Sessions = original
+        self.assertNotIn(id, self.store.packets)
+        self.assertIsNone(self.sessions.get(id))
@@ -128,3 +128,38 @@ class ForumTest(TestBase):
 
         self.assertEqual(1, len(threads))
         self.assertEqual(threads[0]["title"], thread_data["title"])
+
+    def test_breadcrumbs(self):
+        ''' Nested forums list their ancestors
+        Creates a forum inside of a subforum, the nested forum should return
+        the root and the subforum (in order) as its breadcrumbs
+        '''
+        self.elevate_user()
+
+        root = self.get_forum()
+        self.assertEmpty(root['breadcrumbs'])
+        forum = self.create_forum(root, {"name": "middle"})
+        nested = self.create_forum(forum, {"name": "nested"})
+        nested = self.get_forum(nested)
+
+        self.assertEqual(
+            [crumb['url'] for crumb in nested['breadcrumbs']],
+            [root['url'], forum['url']])
+        self.assertEqual(nested['breadcrumbs'][1]['name'], "middle")
+
+    def test_inherited_rights(self):
+        ''' Rights on a subforum carry down to its children only
+        A user with rights on a subforum can create forums under it, but not
+        under the root forum
+        '''
+        self.elevate_user()
+        root = self.get_forum()
+        forum = self.create_forum(root, {"name": "moderated"})
+        with self.app.session_transaction() as session:
+            session['rights'] = [forum['id']]
+
+        nested = self.create_forum(forum, {"name": "nested"})
+        self.create_forum(nested, {"name": "deeper"})
+        response = self.app.post(
+            root['forums'], data={"name": "rogue"}, headers=self.json_header)
+        self.assertHasStatus(response, httplib.UNAUTHORIZED)
@@ -0,0 +1,43 @@
+from tamari.links import Link, URLBuilder
+from werkzeug.routing import Map, Rule
+import unittest
+
+
+class LinksTest(unittest.TestCase):
+    ''' LinksTest
+    Test Suite for the URL templates built from the URL map, the paths built
+    for Links should match the ones the URL map builds
+    '''
+
+    def setUp(self):
+        self.url_map = Map([
+            Rule('/thread/<thread_id>', endpoint='get_thread'),
+            Rule('/forum/', endpoint='get_forums'),
+            Rule('/forum/<forum_id>/forums', endpoint='get_forums'),
+            Rule('/page/<int:page>', endpoint='get_page')
+        ])
+        self.builder = URLBuilder(self.url_map)
+        self.adapter = self.url_map.bind('localhost')
+
+    def test_build(self):
+        ''' Links build the same paths as the URL map
+        Builds the path of a Link for each rule, these should be the same as
+        the path built by the URL map (including picking the rule by the
+        arguments provided)
+        '''
+        for endpoint, values in [
+                ('get_thread', {'thread_id': 'abc123'}),
+                ('get_forums', {}),
+                ('get_forums', {'forum_id': 'abc123'}),
+                ('get_page', {'page': 2})]:
+            self.assertEqual(
+                self.builder.build(Link(endpoint, **values)),
+                self.adapter.build(endpoint, values))
+
+    def test_root(self):
+        ''' Links are built under the root of the app
+        The builder for a root should prefix every path with the root
+        '''
+        build = self.builder.builder('/api')
+        self.assertEqual(build(Link('get_thread', thread_id='abc123')),
+                         '/api/thread/abc123')
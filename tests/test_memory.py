@@ -0,0 +1,60 @@
+import tamari
+from tamari.database.memory import Index
+from datetime import datetime, timedelta
+import unittest
+
+
+class IndexTest(unittest.TestCase):
+    ''' IndexTest
+    Test Suite for the secondary indexes of the memory engine, the keys of
+    each group should be read back in order from any position
+    '''
+
+    def setUp(self):
+        self.index = Index("forum", ("created",))
+        self.start = datetime(2014, 1, 1)
+        self.rows = [{"id": id, "forum": id % 2,
+                      "created": self.start + timedelta(minutes=id // 2)}
+                     for id in range(10)]
+        for row in reversed(self.rows):
+            self.index.add(row)
+
+    def test_scan(self):
+        ''' Index scans the keys of a group in order
+        Scans a group forward and in reverse, then from the position of one
+        of the rows, which should be left out
+        '''
+        ids = [row["id"] for row in self.rows if row["forum"] == 0]
+        self.assertEqual(
+            [key[-1] for key in self.index.scan(0)], ids)
+        self.assertEqual(
+            [key[-1] for key in self.index.scan(0, True)], ids[::-1])
+        position = self.index.key(self.rows[4])
+        self.assertEqual(
+            [key[-1] for key in self.index.scan(0, position=position)],
+            [6, 8])
+        self.assertEqual(
+            [key[-1] for key in self.index.scan(0, True, position)], [2, 0])
+
+    def test_scan_page(self):
+        ''' Index scans a page of the keys of a group
+        Scans a group with a limit and an offset, forward and in reverse
+        '''
+        self.assertEqual(
+            [key[-1] for key in self.index.scan(0, limit=2, start=1)], [2, 4])
+        self.assertEqual(
+            [key[-1] for key in self.index.scan(0, True, limit=2, start=1)],
+            [6, 4])
+        self.assertEqual(self.index.scan(0, True, start=5), [])
+
+    def test_remove(self):
+        ''' Index drops removed rows
+        Removes a row and moves another, the scan should follow
+        '''
+        self.index.remove(self.rows[2])
+        self.index.remove(self.rows[4])
+        self.rows[4]["created"] = self.start + timedelta(days=1)
+        self.index.add(self.rows[4])
+        self.assertEqual(
+            [key[-1] for key in self.index.scan(0)], [0, 6, 8, 4])
+        self.assertEqual(self.index.count(0), 4)
@@ -1,4 +1,5 @@
 from base import TestBase
+from tamari import decorators
 import json
 import re
 import httplib
@@ -184,3 +185,82 @@ class PageTest(TestBase):
         links = self.get_links(response)
         self.assertIn('prev', links)
         self.assertIn('next', links)
+
+    def test_cursor_pages(self):
+        ''' Walk a forum's thread list using the cursor Links
+        Creates a number of threads and follows the cursor based 'next' links
+        until the list is exhausted, every thread should be seen exactly once
+        and in order.  Then checks a 'prev' link leads back to the first page.
+        '''
+        page_size = 5
+
+        root = self.get_forum()
+        self.create_n_threads()
+
+        response = self.app.get(
+            root['threads'], headers=self.json_header,
+            query_string={"per_page": page_size})
+        first = json.loads(response.data)
+        links = self.get_links(response)
+        self.assertNotIn('prev', links)
+        self.assertIn('cursor=', links['next'])
+
+        titles = [thread['title'] for thread in first]
+        second = None
+        while 'next' in links:
+            response = self.app.get(links['next'], headers=self.json_header)
+            self.assertHasStatus(response, httplib.OK)
+            threads = json.loads(response.data)
+            second = second if second else (threads, self.get_links(response))
+            titles += [thread['title'] for thread in threads]
+            links = self.get_links(response) if threads else {}
+
+        self.assertEqual(
+            titles, ['Test thread ' + str(i) for i in range(19, -1, -1)])
+
+        response = self.app.get(second[1]['prev'], headers=self.json_header)
+        self.assertHasStatus(response, httplib.OK)
+        self.assertEqual(first, json.loads(response.data))
+
+    def test_bad_cursor(self):
+        ''' Requesting a thread list with a garbage cursor
+        A cursor that wasn't generated by the system should be rejected
+        '''
+        root = self.get_forum()
+        response = self.app.get(
+            root['threads'], headers=self.json_header,
+            query_string={"cursor": "not a cursor"})
+        self.assertHasStatus(response, httplib.BAD_REQUEST)
+
+    def test_streamed_page(self):
+        ''' Check that large pages of posts are streamed
+        Lowers the stream threshold below the page size, the thread request
+        should then be streamed (without an ETag) and hold the same posts as
+        the regular response.
+        '''
+        page_size = 10
+
+        root = self.get_forum()
+        thread = self.create_n_posts(self.create_thread(forum=root))
+        response = self.app.get(
+            thread['url'], headers=self.json_header,
+            query_string={"per_page": page_size})
+        self.assertHasStatus(response, httplib.OK)
+        posts = json.loads(response.data)['posts']
+
+        threshold = decorators.STREAM_THRESHOLD
+        decorators.STREAM_THRESHOLD = page_size - 1
+        try:
+            response = self.app.get(
+                thread['url'], headers=self.json_header,
+                query_string={"per_page": page_size, "expand": "user"})
+        finally:
+            decorators.STREAM_THRESHOLD = threshold
+        self.assertHasStatus(response, httplib.OK)
+        self.assertNotIn('ETag', response.headers)
+        self.assertIn("Link", response.headers)
+        streamed = json.loads(response.data)['posts']
+        self.assertEqual([post['url'] for post in posts],
+                         [post['url'] for post in streamed])
+        self.assertEqual(
+            streamed[0]['user']['username'], self.default_user['username'])
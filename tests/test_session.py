@@ -0,0 +1,91 @@
+from base import TestBase
+import tamari
+import httplib
+import re
+import time
+
+
+class CookieSessionTest(TestBase):
+    ''' CookieSessionTest
+    Test Suite to test the signed cookie session backend, the session should
+    survive across requests without being stored and be unusable once the
+    user has logged out.
+    '''
+    user = {
+        "username": "cookietester",
+        "password": "just a cookie"
+    }
+
+    def setUp(self):
+        ''' CookieSessionTest::setUp
+        Addition to the TestBase.setUp, swaps in the cookie session backend
+        '''
+        self.interface = tamari.app.session_interface
+        tamari.app.session_interface = tamari.session.CookieSessionHandler()
+        TestBase.setUp(self)
+
+    def tearDown(self):
+        ''' CookieSessionTest::tearDown
+        Addition to the TestBase.tearDown, restores the session backend
+        '''
+        tamari.app.session_interface = self.interface
+        TestBase.tearDown(self)
+
+    def get_cookie(self, response):
+        ''' CookieSessionTest::get_cookie
+        Helper method, pulls the session cookie value out of a response
+        '''
+        cookie = re.search(
+            tamari.session.SESSION_KEY + "=([^;]+)",
+            response.headers.get('Set-Cookie'))
+        return cookie.group(1)
+
+    def current_user(self):
+        return self.app.get(
+            self.endpoints["user"]["url"], headers=self.json_header)
+
+    def test_signed_session(self):
+        ''' Session is kept in the cookie
+        Registers a user, the logged in session should be carried by the
+        cookie alone
+        '''
+        response = self.register(self.user)
+        self.assertHasStatus(response, httplib.CREATED)
+        self.assertIn('.', self.get_cookie(response))
+        self.assertHasStatus(self.current_user(), httplib.OK)
+
+    def test_tampered_session(self):
+        ''' Session cookie with a bad signature
+        A cookie that has been changed should be treated as no session
+        '''
+        cookie = self.get_cookie(self.register(self.user))
+        payload, signature = cookie.split(".")
+        self.app.set_cookie(
+            'localhost', tamari.session.SESSION_KEY,
+            payload + "." + signature[::-1])
+        self.assertHasStatus(self.current_user(), httplib.UNAUTHORIZED)
+
+    def test_revoked_session(self):
+        ''' Reusing the cookie after logging out
+        Once logged out, the cookie from the session should no longer work
+        even if the client sends it again
+        '''
+        cookie = self.get_cookie(self.register(self.user))
+        self.assertTrue(self.logout())
+        self.assertHasStatus(self.current_user(), httplib.UNAUTHORIZED)
+
+        self.app.set_cookie('localhost', tamari.session.SESSION_KEY, cookie)
+        self.assertHasStatus(self.current_user(), httplib.UNAUTHORIZED)
+
+    def test_expired_revocations(self):
+        ''' Revoked tokens are dropped once expired
+        A token past its expiry can't be used anyway, so its revocation is
+        pruned rather than kept forever
+        '''
+        now = int(time.time())
+        tamari.database.Session.revoke("expired", now - 1)
+        tamari.database.Session.revoke("current", now + 60)
+        tokens = [token for token, expires
+                  in tamari.database.Session.revoked()]
+        self.assertIn("current", tokens)
+        self.assertNotIn("expired", tokens)
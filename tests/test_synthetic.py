@@ -0,0 +1,67 @@
+from base import TestBase
+from tamari.synthetic import Generator, populate
+from tamari.database import errors
+import httplib
+
+
+class SyntheticTest(TestBase):
+    ''' SyntheticTest
+    Test Suite for the synthetic forum generator, the generated forum should
+    be the same for a seed and be readable through the API once written
+    '''
+    settings = {
+        "seed": 7,
+        "users": 5,
+        "depth": 2,
+        "fanout": 2,
+        "threads": 20,
+        "max_posts": 60
+    }
+
+    def test_deterministic(self):
+        ''' Same seed generates the same forum
+        Generates the threads twice with the same seed, these should be the
+        same, and once with another seed, which should differ
+        '''
+        threads = list(Generator(**self.settings).threads())
+        self.assertEqual(threads, list(Generator(**self.settings).threads()))
+        self.assertEqual(len(threads), 20)
+        self.assertEqual(len(threads[0]['posts']), 60)
+        self.assertNotEqual(threads, list(Generator(
+            **dict(self.settings, seed=8)).threads()))
+
+    def test_populate(self):
+        ''' Generated forum is written
+        Writes the generated forum, the counts of the forums should add up to
+        the threads and posts written, the longest thread should be paged and
+        the generated users should be able to log in
+        '''
+        result = populate(Generator(**self.settings))
+        self.assertEqual(len(result['forums']), 6)
+        forums = [self.get_forum({'url': '/forum/' + id})
+                  for id in result['forums']]
+        self.assertEqual(
+            sum(forum['thread_count'] for forum in forums), 20)
+        self.assertEqual(
+            sum(forum['post_count'] for forum in forums), result['posts'])
+
+        thread = self.get_thread({'url': '/thread/' + result['longest']})
+        self.assertEqual(thread['post_count'], 60)
+        self.assertEqual(len(thread['posts']), 25)
+
+        response = self.login({'username': 'user0', 'password': 'password'})
+        self.assertHasStatus(response, httplib.ACCEPTED)
+
+    def test_existing_usernames(self):
+        ''' Generated users clashing with existing ones
+        Writes a generated forum twice, the second should fail on the taken
+        usernames, and succeed with another prefix
+        '''
+        populate(Generator(**self.settings))
+        self.assertRaises(errors.ExistingUsernameError, populate,
+                          Generator(**self.settings))
+        result = populate(Generator(prefix="more", **self.settings))
+        self.assertEqual(len(result['users']), 5)
+
+        response = self.login({'username': 'more4', 'password': 'password'})
+        self.assertHasStatus(response, httplib.ACCEPTED)
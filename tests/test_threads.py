@@ -189,3 +189,131 @@ class ThreadTest(TestBase):
         response = self.app.post(
             thread['url'], data=self.post1, headers=self.json_header)
         self.assertHasStatus(response, httplib.UNAUTHORIZED)
+
+    def test_activity_counters(self):
+        ''' Replies update the thread and forum activity
+        Replies to a thread, the thread listing should show the reply count
+        and latest poster, and the forum should count the threads and posts
+        '''
+        root = self.get_forum()
+        thread = self.create_thread(root, self.thread1)
+        self.logout()
+        user = json.loads(self.register({
+            "username": "replytester",
+            "password": "justreply"
+        }).data)
+
+        response = self.app.post(
+            thread["url"], data=self.post1, headers=self.json_header)
+        self.assertHasStatus(response, httplib.CREATED)
+
+        threads = self.get_threads(root)
+        self.assertEqual(threads[0]["post_count"], 2)
+        self.assertEqual(threads[0]["last_post_user"], user["url"])
+        root = self.get_forum()
+        self.assertEqual(root["thread_count"], 1)
+        self.assertEqual(root["post_count"], 2)
+
+    def test_activity_sort(self):
+        ''' Thread list ordered by latest activity
+        Replying to the older of two threads should move it to the top of the
+        list when sorted by activity, but not when sorted by creation
+        '''
+        root = self.get_forum()
+        older = self.create_thread(root, self.thread1)
+        self.create_thread(root, {"title": "Newer", "content": "newer"})
+        response = self.app.post(
+            older["url"], data=self.post1, headers=self.json_header)
+        self.assertHasStatus(response, httplib.CREATED)
+
+        self.assertEqual(self.get_threads(root)[0]["title"], "Newer")
+        response = self.app.get(
+            root['threads'], headers=self.json_header,
+            query_string={"sort": "activity"})
+        self.assertHasStatus(response, httplib.OK)
+        threads = json.loads(response.data)
+        self.assertEqual(threads[0]["title"], self.thread1["title"])
+
+    def test_conditional_edit_post(self):
+        ''' Editting a post with If-Match
+        Edits conditioned on the current version of the post succeed and bump
+        the version, an edit conditioned on an older version (or on a tag
+        without one) is rejected, the ETag of a GET can be sent back
+        '''
+        thread = self.create_thread(thread=self.thread1)
+        post = thread["posts"][0]
+        self.assertEqual(post["version"], 0)
+
+        headers = self.json_header + [('If-Match', '"0"')]
+        response = self.app.put(
+            post["url"], data={"content": "first edit"}, headers=headers)
+        self.assertHasStatus(response, httplib.ACCEPTED)
+        self.assertEqual(json.loads(response.data)["version"], 1)
+
+        response = self.app.put(
+            post["url"], data={"content": "stale edit"}, headers=headers)
+        self.assertHasStatus(response, httplib.PRECONDITION_FAILED)
+        response = self.app.get(post["url"], headers=self.json_header)
+        self.assertEqual(json.loads(response.data)["content"], "first edit")
+
+        etag = response.headers['ETag']
+        headers = self.json_header + [('If-Match', etag)]
+        response = self.app.put(
+            post["url"], data={"content": "etag edit"}, headers=headers)
+        self.assertHasStatus(response, httplib.ACCEPTED)
+        self.assertEqual(json.loads(response.data)["version"], 2)
+
+        response = self.app.put(
+            post["url"], data={"content": "stale etag edit"}, headers=headers)
+        self.assertHasStatus(response, httplib.PRECONDITION_FAILED)
+
+        headers = self.json_header + [('If-Match', '"not-a-version"')]
+        response = self.app.put(
+            post["url"], data={"content": "bad tag edit"}, headers=headers)
+        self.assertHasStatus(response, httplib.PRECONDITION_FAILED)
+
+    def test_expand_users(self):
+        ''' Thread with the authors embedded
+        Requests a thread with '?expand=user', the user of the thread and of
+        each post should be the author's packet instead of a url
+        '''
+        thread = self.create_thread(thread=self.thread1)
+        response = self.app.get(
+            thread["url"], headers=self.json_header,
+            query_string={"expand": "user"})
+        self.assertHasStatus(response, httplib.OK)
+        thread = json.loads(response.data)
+        self.assertEqual(thread["user"]["username"], self.user["username"])
+        self.assertEqual(
+            thread["posts"][0]["user"]["username"], self.user["username"])
+
+    def test_sparse_fields(self):
+        ''' Thread packets limited with '?fields='
+        Requests the thread list and a thread with only some fields, the
+        packets should hold just those fields (and their url), with the posts
+        limited by the dotted 'posts.' fields
+        '''
+        thread = self.create_thread(thread=self.thread1)
+        root = self.get_forum()
+        response = self.app.get(
+            root["threads"], headers=self.json_header,
+            query_string={"fields": "title"})
+        self.assertHasStatus(response, httplib.OK)
+        threads = json.loads(response.data)
+        self.assertEqual(set(threads[0].keys()), set(["url", "title"]))
+
+        response = self.app.get(
+            thread["url"], headers=self.json_header,
+            query_string={"fields": "title"})
+        self.assertEqual(
+            set(json.loads(response.data).keys()), set(["url", "title"]))
+
+        response = self.app.get(
+            thread["url"], headers=self.json_header,
+            query_string={"fields": "title,posts.content"})
+        sparse = json.loads(response.data)
+        self.assertEqual(set(sparse.keys()), set(["url", "title", "posts"]))
+        self.assertEqual(set(sparse["posts"][0].keys()),
+                         set(["url", "content"]))
+        self.assertEqual(sparse["posts"][0]["content"],
+                         self.thread1["content"])
@@ -94,3 +94,22 @@ class UserTest(TestBase):
         self.assertHasStatus(response, httplib.ACCEPTED)
         response = self.app.get(user['url'])
         self.assertHasStatus(response, httplib.NOT_FOUND)
+
+    def test_get_many_users(self):
+        ''' Get several users with one request
+        Registers two users, then fetches both of their public packets with
+        the ids argument of the user endpoint, an id that isn't one is left
+        out
+        '''
+        user1 = json.loads(self.register(self.user1).data)
+        self.assertTrue(self.logout())
+        user2 = json.loads(self.register(self.user2).data)
+
+        response = self.app.get(
+            self.endpoints["user"]["url"], headers=self.json_header,
+            query_string={"ids": ",".join([user2["id"], "bad", user1["id"]])})
+        self.assertHasStatus(response, httplib.OK)
+        users = json.loads(response.data)
+        self.assertEqual(
+            [user["username"] for user in users],
+            [self.user2["username"], self.user1["username"]])